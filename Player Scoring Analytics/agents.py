@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Agent roles added to the results
+ROLES_DICT = {
+    'Controllers': ['Astra', 'Brimstone', 'Clove', 'Harbor', 'Omen', 'Viper'],
+    'Duelists': ['Iso', 'Jett', 'Neon', 'Phoenix', 'Raze', 'Reyna', 'Yoru'],
+    'Initiators': ['Breach', 'Fade', 'Gekko', 'KAY/O', 'Skye', 'Sova'],
+    'Sentinels': ['Chamber', 'Cypher', 'Deadlock', 'Killjoy', 'Sage', 'Vyse']
+}
+
+ROLES = sorted(ROLES_DICT)
+
+# Agent dimension: the agent_code of each agent. Codes are stored with the results, so
+# they never change: a new agent is appended with the next unused code.
+AGENT_IDS = {
+    'Astra': 0,
+    'Breach': 1,
+    'Brimstone': 2,
+    'Chamber': 3,
+    'Clove': 4,
+    'Cypher': 5,
+    'Deadlock': 6,
+    'Fade': 7,
+    'Gekko': 8,
+    'Harbor': 9,
+    'Iso': 10,
+    'Jett': 11,
+    'KAY/O': 12,
+    'Killjoy': 13,
+    'Neon': 14,
+    'Omen': 15,
+    'Phoenix': 16,
+    'Raze': 17,
+    'Reyna': 18,
+    'Sage': 19,
+    'Skye': 20,
+    'Sova': 21,
+    'Viper': 22,
+    'Vyse': 23,
+    'Yoru': 24,
+}
+
+# Role of each agent code as a position in ROLES; -1 for codes without an agent
+AGENT_ROLE_CODES = np.full(max(AGENT_IDS.values()) + 1, -1, dtype=np.int8)
+for role, agents in ROLES_DICT.items():
+    AGENT_ROLE_CODES[[AGENT_IDS[agent] for agent in agents]] = ROLES.index(role)
+
+
+def agent_codes(agent_names):
+    """
+    Agent code of each name, case-insensitive; -1 for unknown agents.
+
+    Names are looked up once per distinct value and broadcast through categorical codes.
+    """
+    categorical = pd.Categorical(agent_names)
+    lookup = {name.lower(): code for name, code in AGENT_IDS.items()}
+    # The trailing -1 is picked by the -1 code of missing names
+    category_codes = np.array([lookup.get(str(name).lower(), -1) for name in categorical.categories] + [-1], dtype=np.int16)
+    return category_codes[categorical.codes]
+
+
+def add_agent_columns(df):
+    """
+    Encode `agent_name` and `role` as categoricals through the agent dimension.
+
+    `agent_code` is always derived from `agent_name`, replacing any code already in the
+    data. Roles are taken once per agent and broadcast by code; unknown agents keep their
+    name and get no role.
+
+    :param df: DataFrame with an 'agent_name' column.
+    :return: The DataFrame, modified in place.
+    """
+    codes = agent_codes(df['agent_name'])
+    df['agent_code'] = codes
+    df['agent_name'] = df['agent_name'].astype('category')
+    df['role'] = pd.Categorical.from_codes(np.append(AGENT_ROLE_CODES, -1)[codes], categories=ROLES)
+    return df
+
+
+def agent_dimension():
+    """
+    The agent dimension as rows, for joining in SQL.
+
+    :return: DataFrame with agent_key (lower-case name), agent_code and role, one row per agent.
+    """
+    codes = np.array(list(AGENT_IDS.values()))
+    return pd.DataFrame({'agent_key': [name.lower() for name in AGENT_IDS], 'agent_code': codes,
+                         'role': [ROLES[role] for role in AGENT_ROLE_CODES[codes]]})
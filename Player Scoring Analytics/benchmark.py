@@ -0,0 +1,238 @@
+import argparse
+import ast
+import contextlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import joblib
+
+from feature_prep import (calculate_event_features, calculate_opponent_team_consequences, calculate_player_consequences,
+                          calculate_team_consequences)
+from inference import get_feature_columns, load_data, merge_results, prepare_sequences, score_sequences
+from instrumentation import Tracer, set_tracer
+from synthetic_data import generate_snapshots
+
+
+class StageTimer:
+    """Collects wall time, CPU time and peak RSS of named benchmark stages."""
+
+    def __init__(self, quiet=True):
+        self.stages = {}
+        self.quiet = quiet
+        # Spans recorded inside the benchmarked code (e.g. infer) land on the same tracer
+        self.tracer = set_tracer(Tracer('benchmark'))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        print(f"Running {name}...", file=sys.stderr)
+        # Progress prints of the timed code are discarded so the report stays readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if self.quiet else sys.stdout):
+            with self.tracer.span(name):
+                yield
+        record = self.tracer.spans[-1]
+        self.stages[name] = {'seconds': record['wall_s'], 'cpu_seconds': record['cpu_s'], 'peak_rss_mb': record['peak_rss_mb']}
+        print(f"  {name}: {record['wall_s']:.3f}s", file=sys.stderr)
+
+    def record_spans(self, names):
+        """Record the latest spans with these names, recorded inside a timed stage, as stages of their own."""
+        for name in names:
+            record = next(record for record in reversed(self.tracer.spans) if record['name'] == name)
+            self.stages[name] = {'seconds': record['wall_s'], 'cpu_seconds': record['cpu_s'], 'peak_rss_mb': record['peak_rss_mb']}
+            print(f"  {name}: {record['wall_s']:.3f}s", file=sys.stderr)
+
+    def record(self, name, seconds, **details):
+        """Record a stage measured outside this process, e.g. in a subprocess."""
+        self.stages[name] = {'seconds': round(seconds, 6), 'cpu_seconds': None, 'peak_rss_mb': None, **details}
+        print(f"  {name}: {seconds:.3f}s", file=sys.stderr)
+
+
+def import_time(code, cwd=None, top=5):
+    """
+    Total import time of running `code` in a fresh interpreter, from `python -X importtime`.
+
+    :param code: Python code to run.
+    :param cwd: Working directory of the interpreter.
+    :param top: Number of slowest top-level imports returned.
+    :return: Tuple of (seconds, {module: cumulative seconds} of the slowest top-level imports).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd, capture_output=True, text=True)
+    total_us, top_level = 0, {}
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)', line)
+        if not match:
+            continue
+        total_us += int(match.group(1))
+        # Top-level imports are indented by a single space
+        if len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1e6
+    slowest = dict(sorted(top_level.items(), key=lambda item: -item[1])[:top])
+    return total_us / 1e6, slowest
+
+
+def module_imports(script_path):
+    """
+    Module-level import statements of a script that cannot itself be imported (e.g. a Streamlit app).
+
+    Each statement is wrapped so packages missing from the environment are skipped.
+    """
+    with open(script_path, 'r') as file:
+        tree = ast.parse(file.read())
+    statements = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(f"try:\n    {statement}\nexcept ImportError:\n    pass" for statement in statements)
+
+
+def run_startup_benchmarks(timer):
+    """Record the import cost of the entry points, which every cold start pays."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    entry_points = {
+        'import_inference': 'import inference',
+        'import_eg_app': module_imports(os.path.join(script_dir, 'eg_app.py')),
+    }
+    for name, code in entry_points.items():
+        print(f"Running {name}...", file=sys.stderr)
+        seconds, slowest = import_time(code, cwd=script_dir)
+        timer.record(name, seconds, slowest_imports=slowest)
+
+    print("Running inference_help...", file=sys.stderr)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(script_dir, 'inference.py'), '--help'], cwd=script_dir, capture_output=True)
+    timer.record('inference_help', time.perf_counter() - started)
+
+
+def run_benchmarks(args):
+    timer = StageTimer(quiet=not args.verbose)
+    if not args.skip_startup:
+        run_startup_benchmarks(timer)
+    work_dir = tempfile.mkdtemp(prefix='eg_benchmark_')
+    csv_path = os.path.join(work_dir, 'snapshots.csv')
+
+    with timer.stage('generate_snapshots'):
+        snapshots = generate_snapshots(args.games, args.rounds, args.events, args.players, seed=args.seed)
+    with timer.stage('write_csv'):
+        snapshots.to_csv(csv_path, index=False)
+
+    with timer.stage('load_data'):
+        df = load_data(csv_path)
+    feature_columns = get_feature_columns(df)
+
+    # The sequence preparation of inference.py, with its feature_extract, nan_fix, scale
+    # and sample_build steps reported as stages
+    scaler = joblib.load(args.scaler_path)
+    with timer.stage('prepare_sequences'):
+        sequences = prepare_sequences(df, feature_columns, scaler)
+    timer.record_spans(['feature_extract', 'nan_fix', 'scale', 'sample_build'])
+
+    if not args.skip_infer:
+        import tensorflow as tf
+        model = tf.keras.models.load_model(args.model_path)
+        with timer.stage('score_sequences'):
+            results_df = score_sequences(model, sequences)
+        with timer.stage('merge_results'):
+            merged_table = merge_results(snapshots, results_df)
+        merged_path = os.path.join(work_dir, 'results.csv')
+        merged_table.to_csv(merged_path, index=False)
+
+    with timer.stage('event_features'):
+        calculate_event_features(snapshots.sort_values(['game_id', 'round_num', 'event_num']))
+
+    # The consequence windows scale quadratically, so they run on a subset of games
+    subset = snapshots[snapshots['game_id'].isin(snapshots['game_id'].unique()[:args.consequence_games])]
+    with timer.stage('team_consequences'):
+        calculate_team_consequences(subset)
+    with timer.stage('player_consequences'):
+        calculate_player_consequences(subset)
+    with timer.stage('opponent_team_consequences'):
+        calculate_opponent_team_consequences(subset)
+
+    if args.db_config and not args.skip_infer:
+        with open(args.db_config, 'r') as file:
+            db_params = json.load(file)['db_params']
+        # Imported here because sql_utils reads ./config.json at import time
+        from sql_utils import upload_csv_to_postgres
+        with timer.stage('upload_csv_to_postgres'):
+            upload_csv_to_postgres(db_params, merged_path, args.db_table)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': {'games': args.games, 'rounds': args.rounds, 'events': args.events,
+                  'players_per_team': args.players, 'seed': args.seed,
+                  'consequence_games': args.consequence_games},
+        'rows': len(snapshots),
+        'stages': timer.stages,
+        'spans': timer.tracer.spans,
+    }
+
+
+def compare_results(current, baseline, tolerance):
+    """
+    Print stage timings against a baseline report.
+
+    :param current: Current benchmark report.
+    :param baseline: Baseline benchmark report.
+    :param tolerance: Allowed relative slowdown (0.2 = 20%).
+    :return: List of regressed stage names.
+    """
+    if current['scale'] != baseline['scale']:
+        print("Warning: baseline was recorded at a different scale.", file=sys.stderr)
+    regressions = []
+    print(f"{'stage':32} {'baseline':>10} {'current':>10} {'ratio':>7}", file=sys.stderr)
+    for name, stage in current['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before, after = baseline['stages'][name]['seconds'], stage['seconds']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:32} {before:>10.3f} {after:>10.3f} {ratio:>7.2f}{flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks on synthetic Valorant snapshot data.")
+    parser.add_argument('--games', type=int, default=2, help='Number of synthetic games.')
+    parser.add_argument('--rounds', type=int, default=24, help='Rounds per game.')
+    parser.add_argument('--events', type=int, default=20, help='Snapshot events per round.')
+    parser.add_argument('--players', type=int, default=5, help='Players per team.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the data generator.')
+    parser.add_argument('--consequence_games', type=int, default=1, help='Games used for the consequence-window stages.')
+    parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
+    parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    parser.add_argument('--skip_infer', action='store_true', help='Skip the model stages.')
+    parser.add_argument('--skip_startup', action='store_true', help='Skip the import-time stages of the entry points.')
+    parser.add_argument('--db_config', type=str, help='Config file of a local PostgreSQL used for the upload stage.')
+    parser.add_argument('--db_table', type=str, default='public.egr_benchmark', help='Table used for the upload stage.')
+    parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of stdout.')
+    parser.add_argument('--compare', type=str, help='Baseline JSON report to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before a stage is reported as a regression.')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the benchmarked code.')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Benchmark report saved to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if compare_results(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,14 @@
+import os
 import streamlit as st
 import pandas as pd
 import altair as alt
 import plotly.express as px
 import plotly.graph_objects as go
-import seaborn as sns
-from sklearn.preprocessing import MinMaxScaler
-import matplotlib.pyplot as plt
-from PIL import Image  # For loading images
-from sql_utils import fetch_data_from_table
+import numpy as np
+from datetime import timedelta
+import local_db
+from embedding_store import EmbeddingStore
+from player_form import PlayerFormStore
 
 # Page configuration
 st.set_page_config(
@@ -25,21 +26,22 @@ with st.sidebar:
     # Add Logo
     st.markdown("<h2 style='text-align: center;'>🎮 Valorant Analysis</h2>", unsafe_allow_html=True)
     logo_image = "./eglogo.jpg"  # Path to your local logo image
-    try:
-        logo = Image.open(logo_image)
-        st.image(logo, use_column_width=True)
-    except FileNotFoundError:
+    if os.path.exists(logo_image):
+        st.image(logo_image, use_column_width=True)
+    else:
         st.warning("Logo image not found. Please ensure 'logo.png' is in the correct directory.")
 
     # Data Source Selection
     st.markdown("<h3 style='margin-top: 30px;'>Select Data Source</h3>", unsafe_allow_html=True)
     data_source = st.radio("Choose data source", options=["Upload CSV", "SQL Database"])
 
+    # Both sources are queried through the same functions: filters, groupbys and
+    # aggregates run in the database and only chart-ready rows come back
     if data_source == "Upload CSV":
         uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"])
         if uploaded_file is not None:
             try:
-                df = pd.read_csv(uploaded_file)
+                db = local_db.register_results(uploaded_file)
                 st.success("File uploaded successfully!")
             except Exception as e:
                 st.error(f"Error loading file: {e}")
@@ -47,17 +49,21 @@ with st.sidebar:
         else:
             st.info("Awaiting CSV file upload. Using sample data for now.")
             hardcoded_file = "./res.csv"
-            df = pd.read_csv(hardcoded_file)  # Default sample dataset
+            db = local_db.register_results(hardcoded_file)  # Default sample dataset
             st.info(f"Reading data from {hardcoded_file}")
+        st.caption(f"Query engine: {local_db.engine_name()}")
 
     elif data_source == "SQL Database":
-        try:
-            #hardcoded_file = "./res.csv"
-            df =fetch_data_from_table()
-            st.success("Data fetched from SQL database successfully!")
-        except Exception as e:
-            st.error(f"Error fetching data from SQL: {e}")
-            st.stop()
+        # Imported on demand: SQLAlchemy and psycopg2 are only needed for this source
+        import sql_utils
+        db = sql_utils
+
+    try:
+        # Only the column names are fetched here
+        schema_df = db.fetch_data_from_table(conditions="1 = 0")
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        st.stop()
 
 # Required columns for analysis
 required_columns = ['round_num', 'game_id', 'player', 'inventory_value', 'event_num',
@@ -96,31 +102,65 @@ def validate_columns(df, required_columns):
         return False
     return True
 
+# Functions to build SQL conditions from filter selections
+def sql_literal(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def sql_in(column, values):
+    # An empty selection matches nothing, as with DataFrame.isin
+    if len(values) == 0:
+        return "1 = 0"
+    return f'"{column}" IN ({", ".join(sql_literal(value) for value in values)})'
+
+def sql_and(*conditions):
+    return " AND ".join(f"({condition})" for condition in conditions if condition)
+
+def sql_columns(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+# Stores are cached until their metadata file, which is written last on save, changes
+def store_modified(store_dir):
+    metadata_path = os.path.join(store_dir, 'metadata.json')
+    return os.path.getmtime(metadata_path) if os.path.exists(metadata_path) else None
+
+@st.cache_resource(max_entries=1)
+def load_player_form(store_dir, modified):
+    return PlayerFormStore.load(store_dir)
+
+@st.cache_resource(max_entries=1)
+def load_embeddings(store_dir, modified):
+    return EmbeddingStore.load(store_dir)
+
 # Validate uploaded dataset
-if not validate_columns(df, required_columns):
+if not validate_columns(schema_df, required_columns):
     st.stop()
 
 
 # Sidebar Filters
 with st.sidebar:
     st.markdown("<h3 style='margin-top: 30px;'>Filter Data</h3>", unsafe_allow_html=True)
-    filter_won = st.multiselect('Select Win Status', options=df['won'].unique(), default=df['won'].unique())
-    filter_players = st.multiselect('Select Players', options=df['player'].unique(), default=df['player'].unique())
-    filter_game_version = st.multiselect('Select Game Version', options=df['game_version'].unique(), default=df['game_version'].unique())
-    filter_team = st.multiselect('Select Team', options=df['team'].unique(), default=df['team'].unique())
-    filter_side = st.multiselect('Select Side', options=df['side'].unique(), default=df['side'].unique())
-
-# Filter dataframe based on selection
-filtered_df = df[
-    (df['won'].isin(filter_won)) &
-    (df['player'].isin(filter_players)) &
-    (df['game_version'].isin(filter_game_version)) &
-    (df['team'].isin(filter_team)) &
-    (df['side'].isin(filter_side))
-]
-
-# Convert date column to datetime
-filtered_df['date'] = pd.to_datetime(filtered_df['game_datetime'])
+    options = db.fetch_distinct_values(['won', 'player', 'game_version', 'team', 'side'])
+    filter_won = st.multiselect('Select Win Status', options=options['won'], default=options['won'])
+    filter_players = st.multiselect('Select Players', options=options['player'], default=options['player'])
+    filter_game_version = st.multiselect('Select Game Version', options=options['game_version'], default=options['game_version'])
+    filter_team = st.multiselect('Select Team', options=options['team'], default=options['team'])
+    filter_side = st.multiselect('Select Side', options=options['side'], default=options['side'])
+    # Results scored before the model registry have no model version
+    if 'model_version' in schema_df.columns:
+        st.caption(f"EGR model version(s): {', '.join(map(str, db.fetch_distinct_values(['model_version'])['model_version']))}")
+
+# Filter conditions based on selection
+sidebar_conditions = sql_and(
+    sql_in('won', filter_won),
+    sql_in('player', filter_players),
+    sql_in('game_version', filter_game_version),
+    sql_in('team', filter_team),
+    sql_in('side', filter_side)
+)
 
 # Page Title
 st.markdown("<h1 style='text-align: center; margin-bottom: 50px;'>Valorant Data Analysis Dashboard</h1>", unsafe_allow_html=True)
@@ -135,22 +175,29 @@ with tab1:
     st.markdown("<h3 style='font-size: 18px; text-align: center;'>Filters</h3>", unsafe_allow_html=True)
 
     # Date range filter
-    start_date, end_date = st.date_input("Select date range", [filtered_df['date'].min().date(), filtered_df['date'].max().date()])
-    filtered_df = filtered_df[(filtered_df['date'].dt.date >= start_date) & (filtered_df['date'].dt.date <= end_date)]
+    date_range = db.fetch_query(f"SELECT MIN(game_datetime) AS first_date, MAX(game_datetime) AS last_date FROM {{table}} WHERE {sidebar_conditions}")
+    start_date, end_date = st.date_input("Select date range", [pd.to_datetime(date_range['first_date'][0]).date(), pd.to_datetime(date_range['last_date'][0]).date()])
+    filtered_conditions = sql_and(
+        sidebar_conditions,
+        f"game_datetime >= '{start_date}' AND game_datetime < '{end_date + timedelta(days=1)}'"
+    )
+    filtered_options = db.fetch_distinct_values(['game_id', 'role', 'agent_name', 'team'], filtered_conditions)
 
     # Game ID filter
-    game_id = st.selectbox('Select Game ID', filtered_df['game_id'].unique())
+    game_id = st.selectbox('Select Game ID', filtered_options['game_id'])
 
     # Role filter
-    selected_roles = st.multiselect('Select Roles', filtered_df['role'].unique(), default=filtered_df['role'].unique())
+    selected_roles = st.multiselect('Select Roles', filtered_options['role'], default=filtered_options['role'])
 
     # Agent name filter
-    selected_agents = st.multiselect('Select Agent Names', filtered_df['agent_name'].unique(), default=filtered_df['agent_name'].unique())
+    selected_agents = st.multiselect('Select Agent Names', filtered_options['agent_name'], default=filtered_options['agent_name'])
 
     # Apply filters
-    filtered_df_g1 = filtered_df[(filtered_df['game_id'] == game_id) & 
-                              (filtered_df['role'].isin(selected_roles)) & 
-                              (filtered_df['agent_name'].isin(selected_agents))]
+    filtered_df_g1 = db.fetch_data_from_table(
+        columns=sql_columns(['round_num', 'EGR', 'player', 'team', 'won', 'role', 'agent_name']),
+        conditions=sql_and(filtered_conditions, sql_in('game_id', [game_id]),
+                           sql_in('role', selected_roles), sql_in('agent_name', selected_agents))
+    )
 
     # Player Performance (EGR) Across Rounds
     st.markdown("<h3 style='font-size: 18px; text-align: center;'>Player Performance (EGR) Across Rounds</h3>", unsafe_allow_html=True)
@@ -169,15 +216,15 @@ with tab1:
     # Overall EGR Per Player with Team, Role, and Agent Name Filters
     st.markdown("<h3 style='font-size: 18px; text-align: center;'>Overall EGR Per Player</h3>", unsafe_allow_html=True)
     
-    selected_teams = st.multiselect('Select Teams to Highlight', filtered_df['team'].unique())
+    selected_teams = st.multiselect('Select Teams to Highlight', filtered_options['team'])
     
     apply_team_filter = st.button('Apply Team Filter')
 
     if apply_team_filter:
-        overall_egr_per_player = filtered_df.groupby(['team', 'player', 'agent_name', 'role'])['EGR'].mean().reset_index()
-        overall_egr_per_player["EGR"]=overall_egr_per_player["EGR"]*100
-        overall_egr_per_player.sort_values('EGR', ascending=False, inplace=True)
-        overall_egr_per_player.reset_index(drop=True, inplace=True)
+        overall_egr_per_player = db.fetch_query(
+            'SELECT team, player, agent_name, role, AVG("EGR") * 100 AS "EGR" FROM {table} '
+            f'WHERE {filtered_conditions} GROUP BY team, player, agent_name, role ORDER BY "EGR" DESC'
+        )
 
         overall_egr_per_player['color'] = overall_egr_per_player['team'].apply(
             lambda x: 'rgba(39, 174, 96, 0.7)' if x in selected_teams else 'rgba(44, 62, 80, 0.7)'
@@ -219,11 +266,45 @@ with tab1:
 
         st.plotly_chart(fig2, use_container_width=True)
 
+    # Recent form across games, read from the player form store instead of the event rows
+    form_store = load_player_form("./player_form", store_modified("./player_form"))
+    if len(form_store.form):
+        st.markdown("<h3 style='font-size: 18px; text-align: center;'>Recent Form</h3>", unsafe_allow_html=True)
+        form_metrics = {
+            'EGR (exponentially weighted)': 'egr_ewm',
+            f'EGR (last {form_store.last_games} games)': 'egr_last_games',
+            f'EGR (last {form_store.last_days} days)': 'egr_last_days',
+            'EGR (all games)': 'egr_mean',
+        }
+        form_col1, form_col2 = st.columns(2)
+        with form_col1:
+            form_metric = st.selectbox('Rank by', list(form_metrics))
+        with form_col2:
+            form_min_games = st.number_input('Minimum games on agent', min_value=1, value=1)
+        form_leaderboard = form_store.leaderboard(form_metrics[form_metric], n=20, min_games=int(form_min_games), teams=selected_teams)
+        st.dataframe(form_leaderboard, use_container_width=True)
+
+        form_player = st.selectbox('Player form', sorted(form_store.form['player'].unique()))
+        form_history = form_store.history(form_player)
+        form_chart = alt.Chart(form_history).transform_fold(
+            ['egr', 'egr_last_games', 'egr_ewm'], as_=['series', 'value']
+        ).mark_line(point=True).encode(
+            x=alt.X('game_datetime:T', title='Game Date'),
+            y=alt.Y('value:Q', title='EGR'),
+            color=alt.Color('series:N', title=''),
+            tooltip=['game_id', 'agent_name', 'game_datetime:T', 'series:N', 'value:Q']
+        ).properties(title=f'Form of {form_player}')
+        st.altair_chart(form_chart, use_container_width=True)
+
    # Shared Filters for Table and Chart
     st.markdown("<h3 style='font-size: 18px; text-align: center;'>Filters for Detailed Player Stats and Inventory Value vs EGR</h3>", unsafe_allow_html=True)
 
-    selected_game_id = st.selectbox('Select Game ID for Table and Chart', df['game_id'].unique(), index=0)
-    filtered_df_for_game = filtered_df[filtered_df['game_id'] == selected_game_id]
+    selected_game_id = st.selectbox('Select Game ID for Table and Chart', db.fetch_distinct_values(['game_id'])['game_id'], index=0)
+    # Ordered by event so groupby first/last pick the first/last snapshot of each round
+    filtered_df_for_game = db.fetch_query(
+        f"SELECT {sql_columns(['game_id', 'round_num', 'event_num', 'player', 'team', 'kills', 'assists', 'deaths', 'our_team_alive', 'opponent_team_alive', 'is_alive', 'combat_score_round', 'inventory_value', 'EGR', 'won'])} "
+        f"FROM {{table}} WHERE {sql_and(filtered_conditions, sql_in('game_id', [selected_game_id]))} ORDER BY round_num, event_num"
+    )
 
     selected_round_num = st.selectbox('Select Round Number', sorted(filtered_df_for_game['round_num'].unique()), index=0)
     available_players = sorted(filtered_df_for_game['player'].unique())
@@ -319,6 +400,24 @@ with tab1:
 
             st.plotly_chart(fig3, use_container_width=True)
 
+    # Similar players from the embedding store written by `inference.py --embeddings`
+    embedding_store = load_embeddings("./embeddings", store_modified("./embeddings"))
+    if embedding_store is not None:
+        st.markdown("<h3 style='font-size: 18px; text-align: center;'>Players Who Perform Alike</h3>", unsafe_allow_html=True)
+        similar_col1, similar_col2, similar_col3 = st.columns(3)
+        with similar_col1:
+            similar_to = st.selectbox('Player', sorted(embedding_store.ids['player'].unique()))
+        with similar_col2:
+            similar_map = st.selectbox('Map', ['All maps'] + sorted(embedding_store.ids['map_name'].dropna().unique()))
+        with similar_col3:
+            similar_k = st.number_input('Number of players', min_value=1, max_value=50, value=10)
+        similar_df = embedding_store.similar_players(similar_to, int(similar_k), None if similar_map == 'All maps' else similar_map)
+        if similar_df.empty:
+            st.info(f"No games of {similar_to} on {similar_map}.")
+        else:
+            st.dataframe(similar_df, use_container_width=True)
+            st.caption(f"Cosine similarity of mean LSTM embeddings (model version {embedding_store.model_version}).")
+
 
 
 
@@ -328,8 +427,11 @@ with tab2:
     st.markdown("<h2 style='font-size: 20px;'>Team Stats</h2>", unsafe_allow_html=True)
     
     # Filter by game_id with a unique key
-    selected_game_id = st.selectbox('Select Game ID', df['game_id'].unique(), key='team_stats_game_id')
-    filtered_df = df[df['game_id'] == selected_game_id]
+    selected_game_id = st.selectbox('Select Game ID', db.fetch_distinct_values(['game_id'])['game_id'], key='team_stats_game_id')
+    filtered_df = db.fetch_data_from_table(
+        columns=sql_columns(['team', 'round_num', 'EGR', 'won', 'combat_score_round']),
+        conditions=sql_in('game_id', [selected_game_id])
+    )
 
     # Aggregate EGR scores for all players within each team and round
     team_round_egr = filtered_df.groupby(['team', 'round_num']).agg({'EGR': 'mean'}).reset_index()
@@ -375,9 +477,10 @@ with tab2:
 with tab3:
 
 
-    grouped_df = df.groupby(['game_id', 'round_num', 'won']).agg({
-    'EGR': 'mean',
-    'combat_score_round': 'mean'}).reset_index()
+    grouped_df = db.fetch_query(
+        'SELECT game_id, round_num, won, AVG("EGR") AS "EGR", AVG(combat_score_round) AS combat_score_round '
+        'FROM {table} GROUP BY game_id, round_num, won'
+    )
 
     # Separate the data into won=True and won=False
     won_true = grouped_df[grouped_df['won'] == True]
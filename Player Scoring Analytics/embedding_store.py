@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Columns of the id table, one row per player-game
+ID_COLUMNS = ['game_id', 'player', 'team', 'map_name', 'agent_name']
+
+
+def normalize_rows(vectors):
+    """L2-normalize each row, so cosine similarity becomes a dot product."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores, k):
+    """Column indices of the k largest scores of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def player_game_table(game_ids, players, snapshots):
+    """
+    Id table of player-game embeddings.
+
+    :param game_ids: Game id of each embedding.
+    :param players: Player of each embedding.
+    :param snapshots: Snapshot rows with the ID_COLUMNS, used for each player-game's team, map and agent.
+    :return: DataFrame with the ID_COLUMNS, in embedding order.
+    """
+    ids = pd.DataFrame({'game_id': np.asarray(game_ids).astype(str), 'player': np.asarray(players).astype(str)})
+    attributes = snapshots[ID_COLUMNS].drop_duplicates(['game_id', 'player']).astype({'game_id': str, 'player': str})
+    return ids.merge(attributes, on=['game_id', 'player'], how='left')
+
+
+class EmbeddingStore:
+    """
+    Player-game embeddings in one contiguous float32 matrix with an id table.
+
+    Row i of `vectors` belongs to row i of `ids`. Vectors are L2-normalized when the
+    store is built, so a cosine search is a matrix product over the (memory-mapped)
+    matrix. Embeddings of different model versions are not comparable, so a store
+    holds the embeddings of one version.
+    """
+
+    def __init__(self, vectors, ids, model_version=None, normalized=False):
+        self.vectors = vectors if normalized else normalize_rows(vectors)
+        self.ids = ids.reset_index(drop=True)
+        self.model_version = model_version
+        if len(self.vectors) != len(self.ids):
+            raise ValueError("Embeddings and ids have different lengths.")
+
+    @classmethod
+    def load(cls, store_dir):
+        """
+        Load a store, memory-mapping the vectors.
+
+        :param store_dir: Store directory.
+        :return: EmbeddingStore, or None when the directory holds no store.
+        """
+        metadata_path = os.path.join(store_dir, 'metadata.json')
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, 'r') as file:
+            metadata = json.load(file)
+        vectors = np.load(os.path.join(store_dir, 'vectors.npy'), mmap_mode='r')
+        ids = pd.read_csv(os.path.join(store_dir, 'ids.csv'), dtype=str)
+        return cls(vectors, ids, metadata['model_version'], normalized=True)
+
+    def save(self, store_dir):
+        """
+        Write the store to a directory.
+
+        Files are replaced atomically, so readers that memory-mapped the previous
+        vectors keep a valid view. The metadata file is written last.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        files = {'vectors.npy': lambda file: np.save(file, np.ascontiguousarray(self.vectors, dtype=np.float32)),
+                 'ids.csv': lambda file: self.ids.to_csv(file, index=False),
+                 'metadata.json': lambda file: file.write(json.dumps(
+                     {'model_version': self.model_version, 'count': len(self.ids), 'dim': int(self.vectors.shape[1])},
+                     indent=4).encode())}
+        for name, write in files.items():
+            temporary_path = os.path.join(store_dir, f'.{name}.tmp')
+            with open(temporary_path, 'wb') as file:
+                write(file)
+            os.replace(temporary_path, os.path.join(store_dir, name))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def merge(self, other):
+        """
+        Return a store with the embeddings of `other` added.
+
+        Games in `other` replace their earlier embeddings; a store of another model
+        version is replaced entirely.
+        """
+        if other.model_version != self.model_version:
+            return other
+        keep = ~self.ids['game_id'].isin(set(other.ids['game_id'])).to_numpy()
+        vectors = np.concatenate([self.vectors[keep], other.vectors])
+        ids = pd.concat([self.ids[keep], other.ids], ignore_index=True)
+        return EmbeddingStore(vectors, ids, self.model_version, normalized=True)
+
+    def search(self, queries, k=10, candidates=None, block_rows=65536):
+        """
+        Cosine top-k search for a batch of query vectors.
+
+        The store is scanned in blocks of rows, keeping the best k of each query, so
+        memory stays bounded for large stores.
+
+        :param queries: Query vectors [queries, dim]; need not be normalized.
+        :param k: Results per query.
+        :param candidates: Row indices to search (optional), e.g. the player-games on one map.
+        :param block_rows: Store rows scored per matrix product.
+        :return: Tuple of (row indices, cosine similarities), both [queries, k] and best first.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        rows = np.arange(len(self)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            vectors = self.vectors[start:start + len(block)] if candidates is None else self.vectors[block]
+            scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+            all_rows = np.concatenate([best_rows, np.broadcast_to(block, (len(queries), len(block)))], axis=1)
+            keep = top_k(scores, k)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(all_rows, keep, axis=1)
+        return best_rows, best_scores
+
+    def player_profiles(self, mask=None):
+        """
+        Mean embedding of each player over their player-games.
+
+        :param mask: Boolean mask of the player-games to use (optional).
+        :return: Tuple of (players, normalized profile vectors, games per player).
+        """
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        codes, players = pd.factorize(self.ids['player'].to_numpy()[rows])
+        vectors = np.asarray(self.vectors[rows])
+        sums = np.stack([np.bincount(codes, weights=vectors[:, j], minlength=len(players))
+                         for j in range(vectors.shape[1])], axis=1)
+        return np.asarray(players), normalize_rows(sums), np.bincount(codes, minlength=len(players))
+
+    def similar_players(self, player, k=10, map_name=None):
+        """
+        Players whose games resemble `player`'s, e.g. "players who perform like X on Ascent".
+
+        Each player is represented by the mean embedding of their games (on `map_name`,
+        when given), and players are ranked by cosine similarity to `player`.
+
+        :param player: Player to compare against.
+        :param k: Number of players returned.
+        :param map_name: Only use games on this map (optional).
+        :return: DataFrame with player, games and similarity, best first; empty when `player` has no games.
+        """
+        mask = None if map_name is None else (self.ids['map_name'] == map_name).to_numpy()
+        players, profiles, games = self.player_profiles(mask)
+        matches = np.flatnonzero(players == player)
+        if len(matches) == 0:
+            return pd.DataFrame(columns=['player', 'games', 'similarity'])
+        others = np.flatnonzero(players != player)
+        store = EmbeddingStore(profiles, pd.DataFrame({'player': players}), normalized=True)
+        rows, scores = store.search(profiles[matches], k, candidates=others)
+        return pd.DataFrame({'player': players[rows[0]], 'games': games[rows[0]], 'similarity': scores[0]})
+
+
+def update_store(store_dir, store):
+    """
+    Add embeddings to the store in `store_dir`, creating it when missing.
+
+    :param store_dir: Store directory.
+    :param store: EmbeddingStore with the new embeddings.
+    :return: The saved EmbeddingStore.
+    """
+    existing = EmbeddingStore.load(store_dir)
+    if existing is not None and existing.model_version != store.model_version:
+        print(f"Replacing embeddings of model version {existing.model_version} with version {store.model_version}.")
+    merged = store if existing is None else existing.merge(store)
+    merged.save(store_dir)
+    print(f"Saved {len(store)} player-game embeddings to {store_dir} ({len(merged)} in total).")
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find players who perform like a given player.")
+    parser.add_argument('player', type=str, help='Player to compare against.')
+    parser.add_argument('--store', type=str, default='./embeddings', help='Embedding store written by inference.py --embeddings.')
+    parser.add_argument('--map', type=str, help='Only compare games on this map, e.g. Ascent.')
+    parser.add_argument('--k', type=int, default=10, help='Number of similar players.')
+    args = parser.parse_args()
+
+    store = EmbeddingStore.load(args.store)
+    if store is None:
+        print(f"No embedding store found in {args.store}.")
+        return
+    similar = store.similar_players(args.player, args.k, args.map)
+    if similar.empty:
+        print(f"No games of {args.player}{' on ' + args.map if args.map else ''} in the store.")
+    else:
+        print(similar.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
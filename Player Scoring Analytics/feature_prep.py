@@ -0,0 +1,267 @@
+import numpy as np
+import pandas as pd
+
+CHARGE_COLUMNS = ['ability1_base_charges', 'ability2_base_charges', 'grenade_base_charges', 'ultimate_base_charges']
+
+
+def calculate_team_consequences(df):
+    df_sorted = df.sort_values(by=['game_id', 'round_num', 'team', 'seconds'])
+    df_sorted['kill_c'] = 0
+    df_sorted['death_c'] = 0
+    df_sorted['damage_dealt_c'] = 0
+    df_sorted['damage_taken_c'] = 0
+
+    for index, row in df_sorted.iterrows():
+        window_start = row['seconds']
+        window_end = window_start + 10
+
+        subsequent_events = df_sorted[
+            (df_sorted['game_id'] == row['game_id']) &
+            (df_sorted['team'] == row['team']) &
+            (df_sorted['round_num'] == row['round_num']) &
+            (df_sorted['seconds'] > window_start) &
+            (df_sorted['seconds'] <= window_end)
+        ]
+
+        df_sorted.loc[index, 'kill_c'] = subsequent_events['kill_change'].sum()
+        df_sorted.loc[index, 'death_c'] = subsequent_events['death_change'].sum()
+        df_sorted.loc[index, 'damage_dealt_c'] = subsequent_events['damage_dealt'].sum()
+        df_sorted.loc[index, 'damage_taken_c'] = subsequent_events['damage_taken'].sum()
+
+    return df_sorted
+
+
+def calculate_player_consequences(df):
+    df_sorted = df.sort_values(by=['game_id', 'round_num', 'player', 'seconds'])
+    df_sorted['player_kill_c'] = 0
+    df_sorted['player_death_c'] = 0
+    df_sorted['player_damage_dealt_c'] = 0
+    df_sorted['player_damage_taken_c'] = 0
+
+    for index, row in df_sorted.iterrows():
+        window_start = row['seconds']
+        window_end = window_start + 10
+
+        subsequent_events = df_sorted[
+            (df_sorted['game_id'] == row['game_id']) &
+            (df_sorted['player'] == row['player']) &
+            (df_sorted['round_num'] == row['round_num']) &
+            (df_sorted['seconds'] > window_start) &
+            (df_sorted['seconds'] <= window_end)
+        ]
+
+        df_sorted.loc[index, 'player_kill_c'] = subsequent_events['kill_change'].sum()
+        df_sorted.loc[index, 'player_death_c'] = subsequent_events['death_change'].sum()
+        df_sorted.loc[index, 'player_damage_dealt_c'] = subsequent_events['damage_dealt'].sum()
+        df_sorted.loc[index, 'player_damage_taken_c'] = subsequent_events['damage_taken'].sum()
+
+    return df_sorted
+
+
+def calculate_opponent_team_consequences(df):
+    df_sorted = df.sort_values(by=['game_id', 'round_num', 'team', 'seconds'])
+    df_sorted['opponent_kill_c'] = 0
+    df_sorted['opponent_death_c'] = 0
+    df_sorted['opponent_damage_dealt_c'] = 0
+    df_sorted['opponent_damage_taken_c'] = 0
+
+    for index, row in df_sorted.iterrows():
+        window_start = row['seconds']
+        window_end = window_start + 10
+
+        subsequent_events = df_sorted[
+            (df_sorted['game_id'] == row['game_id']) &
+            (df_sorted['team'] != row['team']) &
+            (df_sorted['round_num'] == row['round_num']) &
+            (df_sorted['seconds'] > window_start) &
+            (df_sorted['seconds'] <= window_end)
+        ]
+
+        df_sorted.loc[index, 'opponent_kill_c'] = subsequent_events['kill_change'].sum()
+        df_sorted.loc[index, 'opponent_death_c'] = subsequent_events['death_change'].sum()
+        df_sorted.loc[index, 'opponent_damage_dealt_c'] = subsequent_events['damage_dealt'].sum()
+        df_sorted.loc[index, 'opponent_damage_taken_c'] = subsequent_events['damage_taken'].sum()
+
+    return df_sorted
+
+
+def window_sums(event_keys, event_seconds, event_values, query_keys, query_seconds, window=10):
+    """
+    Sum event values in the window (seconds, seconds + window] of each query, per key.
+
+    Same windows as the consequence functions above, computed with one sort and a
+    cumulative sum instead of a scan per row.
+
+    :param event_keys: Integer key of each event (e.g. team or player code).
+    :param event_seconds: Time of each event.
+    :param event_values: Values to sum, [events] or [events, columns].
+    :param query_keys: Key each query is matched against.
+    :param query_seconds: Window start of each query.
+    :param window: Window length in seconds.
+    :return: Sums, [queries] or [queries, columns].
+    """
+    # Keys and times are combined into one sortable position; round times stay far below the key spacing
+    spacing = 2 * (np.max(np.abs(event_seconds), initial=0) + np.max(np.abs(query_seconds), initial=0) + window) + 1
+    event_position = np.asarray(event_keys, dtype=np.float64) * spacing + event_seconds
+    order = np.argsort(event_position, kind='stable')
+    event_position = event_position[order]
+    values = np.asarray(event_values, dtype=np.float64)[order]
+    cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+
+    query_position = np.asarray(query_keys, dtype=np.float64) * spacing + query_seconds
+    lower = np.searchsorted(event_position, query_position, side='right')
+    upper = np.searchsorted(event_position, query_position + window, side='right')
+    return cumulative[upper] - cumulative[lower]
+
+
+def group_codes(df, columns):
+    """Integer code per row for the combination of `columns`, ordered like a sorted groupby."""
+    codes = np.zeros(len(df), dtype=np.int64)
+    for column in columns:
+        column_codes, uniques = pd.factorize(df[column], sort=True)
+        codes = codes * (len(uniques) + 1) + column_codes + 1
+    return pd.factorize(codes, sort=True)[0]
+
+
+def group_diff(codes, values):
+    """
+    Difference to the previous row of the same group, in row order; 0 for a group's first row.
+
+    Same values as `groupby(...).diff().fillna(0)`.
+    """
+    order = np.argsort(codes, kind='stable')
+    sorted_values = np.asarray(values, dtype=np.float64)[order]
+    change = np.zeros(len(order))
+    same_group = codes[order][1:] == codes[order][:-1]
+    change[1:] = np.where(same_group, sorted_values[1:] - sorted_values[:-1], 0)
+    result = np.empty(len(order))
+    result[order] = np.nan_to_num(change, nan=0.0)
+    return result
+
+
+def asof_rows(codes, seconds, query_codes, query_seconds):
+    """
+    Row of the latest event at or before each query time within the same group, as `merge_asof`.
+
+    Queries earlier than their group's first event get that first event; queries whose
+    group has no events get -1.
+
+    :param codes: Integer group code of each row (e.g. game/round/player).
+    :param seconds: Time of each row.
+    :param query_codes: Group code of each query; negative codes never match.
+    :param query_seconds: Time of each query.
+    :return: Row index per query, or -1.
+    """
+    spacing = 2 * (np.max(np.abs(seconds), initial=0) + np.max(np.abs(query_seconds), initial=0)) + 1
+    position = np.asarray(codes, dtype=np.float64) * spacing + seconds
+    order = np.argsort(position, kind='stable')
+    sorted_codes = np.asarray(codes)[order]
+    if len(order) == 0:
+        return np.full(len(query_codes), -1, dtype=np.int64)
+
+    query_codes = np.asarray(query_codes)
+    found = np.searchsorted(position[order], query_codes * spacing + np.asarray(query_seconds, dtype=np.float64), side='right') - 1
+    # Before the group's first event (or in a group of its own): fall back to the group's first event
+    group_first = np.searchsorted(sorted_codes, query_codes, side='left')
+    in_group = (found >= 0) & (sorted_codes[np.clip(found, 0, None)] == query_codes)
+    found = np.where(in_group, found, group_first)
+    matched = (query_codes >= 0) & (found < len(order)) & (sorted_codes[np.clip(found, 0, len(order) - 1)] == query_codes)
+    return np.where(matched, order[np.clip(found, 0, len(order) - 1)], -1)
+
+
+def attach_damage(df, damage_df):
+    """
+    Add damage_dealt and damage_taken to the snapshot rows of a game.
+
+    Damage events are summed per (game_id, round_num, player, event_num), once for the
+    attacker and once for the victim, and each sum is attached as-of on `seconds` to the
+    player's latest snapshot of the round (see `asof_rows`). The frame keeps one row per
+    snapshot, so the consequence windows scan snapshots only. Damage of players without
+    snapshots in the round is dropped.
+
+    The columns are added to `df` in place.
+
+    :param df: Snapshot rows with game_id, round_num, player and seconds.
+    :param damage_df: Damage events with game_id, round_num, event_num, attacker, victim, damage and seconds.
+    :return: Pandas DataFrame with the added columns.
+    """
+    groups = pd.MultiIndex.from_frame(df[['game_id', 'round_num', 'player']])
+    unique_groups = groups.unique()
+    codes = unique_groups.get_indexer(groups)
+    seconds = df['seconds'].to_numpy(dtype=np.float64)
+
+    for role, column in (('attacker', 'damage_dealt'), ('victim', 'damage_taken')):
+        per_event = (damage_df.groupby(['game_id', 'round_num', role, 'event_num'], sort=False)
+                     .agg(damage=('damage', 'sum'), seconds=('seconds', 'min')).reset_index())
+        query_codes = unique_groups.get_indexer(pd.MultiIndex.from_frame(per_event[['game_id', 'round_num', role]]))
+        rows = asof_rows(codes, seconds, query_codes, per_event['seconds'].to_numpy(dtype=np.float64))
+        matched = rows >= 0
+        df[column] = np.bincount(rows[matched], weights=per_event['damage'].to_numpy(dtype=np.float64)[matched],
+                                 minlength=len(df))
+    return df
+
+
+def calculate_event_features(df):
+    """
+    Add the per-event player, team and opponent features of a game's snapshots.
+
+    Adds kill/death changes, `is_alive`, team alive/health/inventory totals, the
+    opponent team's totals, `spike_event` and the ability charge changes, and zeroes
+    `inventory_value` of dead players. Team totals are summed in one pass over integer
+    (game, round, event, team) codes with `np.add.reduceat`; the opponent's totals are
+    looked up from the other team's group of the same event. Rows of events without an
+    opponent team are dropped.
+
+    The columns are added to `df` in place; a filtered copy is only made when rows are dropped.
+
+    :param df: Snapshot rows with game_id, round_num, event_num, team, player, kills, deaths, hp,
+               inventory_value, spike_planted and the ability charge columns.
+    :return: Pandas DataFrame with the added columns.
+    """
+    player_round = group_codes(df, ['game_id', 'player', 'round_num'])
+    df['kill_change'] = group_diff(player_round, df['kills']).clip(min=0)
+    df['death_change'] = group_diff(player_round, df['deaths']).clip(min=0)
+    df['is_alive'] = (df['hp'] > 0).astype(int)
+    df.loc[df['hp'] == 0, 'inventory_value'] = 0
+
+    # Team totals: one reduceat over rows sorted by (game, round, event, team) group
+    event_codes = group_codes(df, ['game_id', 'round_num', 'event_num'])
+    team_codes, teams = pd.factorize(df['team'], sort=True)
+    codes = event_codes * len(teams) + team_codes
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    totals = np.add.reduceat(df[['is_alive', 'hp', 'inventory_value']].to_numpy(dtype=np.float64)[order], starts, axis=0)
+    row_group = np.empty(len(df), dtype=np.int64)
+    row_group[order] = np.cumsum(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) - 1
+
+    # Groups of one event are adjacent, so the opponent of the only other group is found by position
+    group_event = sorted_codes[starts] // len(teams)
+    event_first = np.searchsorted(group_event, group_event, side='left')
+    event_groups = np.searchsorted(group_event, group_event, side='right') - event_first
+    group_index = np.arange(len(starts))
+    opponent_group = np.where(event_groups == 2, 2 * event_first + 1 - group_index, -1)
+
+    row_opponent = opponent_group[row_group]
+    df['our_team_alive'], df['our_team_health'], df['team_inventory_value'] = totals[row_group].T
+    df['spike_event'] = np.where(df['spike_planted'].astype(bool), 'post-plant', 'pre-plant')
+    has_opponent = row_opponent >= 0
+    opponent_totals = totals[np.where(has_opponent, row_opponent, 0)]
+    df['opponent_team'] = np.asarray(teams)[team_codes[order][starts][np.where(has_opponent, row_opponent, 0)]]
+    df['opponent_team_alive'], df['opponent_team_health'], df['opponent_team_inventory_value'] = opponent_totals.T
+    # Totals are summed as float64; cast them back to the dtype of the summed column, as transform('sum') kept it
+    for column, team_total, opponent_total in (('is_alive', 'our_team_alive', 'opponent_team_alive'),
+                                               ('hp', 'our_team_health', 'opponent_team_health'),
+                                               ('inventory_value', 'team_inventory_value', 'opponent_team_inventory_value')):
+        df[team_total] = df[team_total].astype(df[column].dtype)
+        df[opponent_total] = df[opponent_total].astype(df[column].dtype)
+    if not has_opponent.all():
+        df = df[has_opponent].copy()
+
+    player_round = group_codes(df, ['game_id', 'round_num', 'player'])
+    for charge in CHARGE_COLUMNS:
+        change = group_diff(player_round, df[charge])
+        df[f'{charge}_change'] = change
+        df[f'{charge}_gained'] = change.clip(min=0)
+        df[f'{charge}_used'] = (-change).clip(min=0)
+    return df
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+
+ARRAY_NAMES = ['values', 'round_lengths', 'targets']
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def feature_store_key(file_path, feature_columns, parent_key=None):
+    """
+    Key a feature-store entry by input data and feature list.
+
+    :param file_path: Path to the source CSV.
+    :param feature_columns: Feature columns, in model order.
+    :param parent_key: Key of the entry whose scaler was applied (validation sets).
+    :return: Hex key string.
+    """
+    digest = hashlib.sha256()
+    digest.update(file_digest(file_path).encode())
+    digest.update(json.dumps(list(feature_columns)).encode())
+    if parent_key:
+        digest.update(parent_key.encode())
+    return digest.hexdigest()[:16]
+
+
+def load_features(store_dir, key):
+    """
+    Load a cached entry, memory-mapping its arrays.
+
+    :param store_dir: Feature store directory.
+    :param key: Entry key from `feature_store_key`.
+    :return: Dictionary with the arrays, 'feature_columns' and 'scaler' (if stored), or None when missing.
+    """
+    entry_dir = os.path.join(store_dir, key)
+    metadata_path = os.path.join(entry_dir, 'metadata.json')
+    if not os.path.exists(metadata_path):
+        return None
+
+    with open(metadata_path, 'r') as file:
+        metadata = json.load(file)
+    entry = {name: np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r')
+             for name in ARRAY_NAMES + metadata.get('extra_arrays', [])}
+    entry['feature_columns'] = metadata['feature_columns']
+    scaler_path = os.path.join(entry_dir, 'scaler.pkl')
+    entry['scaler'] = joblib.load(scaler_path) if os.path.exists(scaler_path) else None
+    return entry
+
+
+def save_features(store_dir, key, values, round_lengths, targets, feature_columns, scaler=None, source=None, extra_arrays=None):
+    """
+    Write an entry to the feature store.
+
+    The metadata file is written last, so an interrupted write is treated as missing.
+
+    :param store_dir: Feature store directory.
+    :param key: Entry key from `feature_store_key`.
+    :param values: Event features, float32 [events, features].
+    :param round_lengths: Number of events per round.
+    :param targets: Target per round.
+    :param feature_columns: Feature columns, in model order.
+    :param scaler: Fitted scaler (optional).
+    :param source: Source file path recorded in the metadata (optional).
+    :param extra_arrays: Further named arrays stored with the entry, e.g. offset tables (optional).
+    """
+    entry_dir = os.path.join(store_dir, key)
+    os.makedirs(entry_dir, exist_ok=True)
+    arrays = dict(zip(ARRAY_NAMES, [values, round_lengths, targets]), **(extra_arrays or {}))
+    for name, array in arrays.items():
+        np.save(os.path.join(entry_dir, f'{name}.npy'), array)
+    if scaler is not None:
+        joblib.dump(scaler, os.path.join(entry_dir, 'scaler.pkl'))
+    with open(os.path.join(entry_dir, 'metadata.json'), 'w') as file:
+        json.dump({'feature_columns': list(feature_columns), 'source': source,
+                   'events': int(len(values)), 'rounds': int(len(round_lengths)),
+                   'extra_arrays': list(extra_arrays or {})}, file, indent=4)
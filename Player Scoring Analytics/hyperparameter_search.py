@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import tensorflow as tf
+
+from feature_store import load_features
+from train import build_model, prepare_features
+from training_data import compute_bucket_boundaries, make_dataset
+
+# Variants of the production model (LSTM 16 -> 8, huber, Adam 1e-4) explored by default.
+# A list is sampled uniformly; {"log_uniform": [low, high]} and {"uniform": [low, high]} are ranges.
+DEFAULT_SEARCH_SPACE = {
+    'lstm_units': [[16, 8], [32, 16], [64, 32], [32, 16, 8]],
+    'dense_units': [[], [8], [16]],
+    'dropout': [0.0, 0.1, 0.2, 0.3],
+    'batch_norm': [False, True],
+    'learning_rate': {'log_uniform': [1e-4, 3e-3]},
+    'batch_size': [32, 64],
+    'loss': ['huber', 'mse', 'mae'],
+}
+
+# Trial states in the study store
+QUEUED, RUNNING, COMPLETE, PRUNED, FAILED, INTERRUPTED = 'queued', 'running', 'complete', 'pruned', 'failed', 'interrupted'
+
+
+def sample_params(search_space, rng):
+    """
+    Draw one configuration from a search space.
+
+    :param search_space: Dictionary of parameter name to a list of choices or a range.
+    :param rng: random.Random instance.
+    :return: Dictionary of parameter values.
+    """
+    params = {}
+    for name, space in search_space.items():
+        if isinstance(space, dict) and 'log_uniform' in space:
+            low, high = space['log_uniform']
+            params[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+        elif isinstance(space, dict) and 'uniform' in space:
+            params[name] = rng.uniform(*space['uniform'])
+        else:
+            params[name] = rng.choice(space)
+    return params
+
+
+class StudyStore:
+    """
+    SQLite file holding the trials of one or more studies and their per-epoch objective.
+
+    Every worker process opens its own short-lived connections, so the file can be
+    shared by the whole process pool and inspected while a search is running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS trials (
+                    trial_id INTEGER PRIMARY KEY AUTOINCREMENT, study TEXT, params TEXT, state TEXT,
+                    best_value REAL, best_epoch INTEGER, epochs INTEGER, seconds REAL,
+                    started_at TEXT, finished_at TEXT, model_path TEXT, error TEXT)
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS trial_epochs (
+                    trial_id INTEGER, epoch INTEGER, loss REAL, value REAL, PRIMARY KEY (trial_id, epoch))
+            """)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def create_trial(self, study, params):
+        with self._connect() as connection:
+            cursor = connection.execute("INSERT INTO trials (study, params, state) VALUES (?, ?, ?)",
+                                        (study, json.dumps(params), QUEUED))
+            return cursor.lastrowid
+
+    def start_trial(self, trial_id):
+        with self._connect() as connection:
+            connection.execute("UPDATE trials SET state = ?, started_at = ? WHERE trial_id = ?",
+                               (RUNNING, datetime.now().isoformat(timespec='seconds'), trial_id))
+
+    def report(self, trial_id, epoch, loss, value):
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO trial_epochs VALUES (?, ?, ?, ?)", (trial_id, epoch, loss, value))
+
+    def finish_trial(self, trial_id, state, best_value=None, best_epoch=None, epochs=None, seconds=None,
+                     model_path=None, error=None):
+        with self._connect() as connection:
+            connection.execute("""
+                UPDATE trials SET state = ?, best_value = ?, best_epoch = ?, epochs = ?, seconds = ?,
+                                  finished_at = ?, model_path = ?, error = ?
+                WHERE trial_id = ?
+            """, (state, best_value, best_epoch, epochs, seconds, datetime.now().isoformat(timespec='seconds'),
+                  model_path, error, trial_id))
+
+    def mark_interrupted(self, study):
+        """Close out trials left queued or running by a search that was stopped."""
+        with self._connect() as connection:
+            connection.execute("UPDATE trials SET state = ? WHERE study = ? AND state IN (?, ?)",
+                               (INTERRUPTED, study, QUEUED, RUNNING))
+
+    def count_finished(self, study):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM trials WHERE study = ? AND state IN (?, ?)",
+                                      (study, COMPLETE, PRUNED)).fetchone()[0]
+
+    def best_values_at(self, study, epoch, exclude_trial_id):
+        """Best objective value up to `epoch` of every other trial that reached it."""
+        with self._connect() as connection:
+            rows = connection.execute("""
+                SELECT MIN(e.value) FROM trial_epochs e JOIN trials t ON t.trial_id = e.trial_id
+                WHERE t.study = ? AND e.trial_id != ? AND e.epoch <= ?
+                GROUP BY e.trial_id HAVING MAX(e.epoch) >= ?
+            """, (study, exclude_trial_id, epoch, epoch)).fetchall()
+        return [row[0] for row in rows]
+
+    def top_trials(self, study, limit=10):
+        with self._connect() as connection:
+            rows = connection.execute("""
+                SELECT trial_id, state, best_value, best_epoch, epochs, seconds, params FROM trials
+                WHERE study = ? AND best_value IS NOT NULL ORDER BY best_value LIMIT ?
+            """, (study, limit)).fetchall()
+        return [dict(zip(['trial_id', 'state', 'best_value', 'best_epoch', 'epochs', 'seconds', 'params'], row)) for row in rows]
+
+
+class MedianPruner(tf.keras.callbacks.Callback):
+    """
+    Report each epoch's objective to the study store and stop trials that lag behind.
+
+    After `warmup_epochs`, a trial is pruned when its best value so far is worse than
+    the median best value of the other trials at the same epoch (given at least
+    `min_trials` of them).
+    """
+
+    def __init__(self, store, study, trial_id, objective, warmup_epochs=3, min_trials=3):
+        super().__init__()
+        self.store = store
+        self.study = study
+        self.trial_id = trial_id
+        self.objective = objective
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+        self.best_value = math.inf
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch += 1
+        value = float(logs[self.objective])
+        self.best_value = min(self.best_value, value)
+        self.store.report(self.trial_id, epoch, float(logs['loss']), value)
+        if epoch < self.warmup_epochs:
+            return
+        others = self.store.best_values_at(self.study, epoch, self.trial_id)
+        if len(others) >= self.min_trials and self.best_value > statistics.median(others):
+            self.pruned = True
+            self.model.stop_training = True
+
+
+# Per-process state of the pool workers
+_worker = {}
+
+
+def init_worker(threads, store_dir, train_key, val_key):
+    # Must run before TensorFlow creates its thread pools
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    # Every worker maps the same feature store files instead of re-reading the CSVs
+    _worker['train'] = load_features(store_dir, train_key)
+    _worker['val'] = load_features(store_dir, val_key)
+
+
+def run_trial(trial_id, params, study_path, study, objective, max_epochs, patience, warmup_epochs, min_trials,
+              seed, models_dir=None):
+    """
+    Train and evaluate one configuration in a pool worker.
+
+    :return: Dictionary with the trial id, final state and best objective value.
+    """
+    store = StudyStore(study_path)
+    store.start_trial(trial_id)
+    started = time.perf_counter()
+    try:
+        train_entry, val_entry = _worker['train'], _worker['val']
+        tf.keras.utils.set_random_seed(seed + trial_id)
+        bucket_boundaries = compute_bucket_boundaries(train_entry['round_lengths'])
+        train_dataset = make_dataset(train_entry['values'], train_entry['round_lengths'], train_entry['targets'],
+                                     batch_size=params['batch_size'], bucket_boundaries=bucket_boundaries, seed=seed)
+        val_dataset = make_dataset(val_entry['values'], val_entry['round_lengths'], val_entry['targets'],
+                                   batch_size=params['batch_size'], bucket_boundaries=bucket_boundaries, shuffle=False)
+
+        model = build_model(len(train_entry['feature_columns']), params['learning_rate'],
+                            lstm_units=params['lstm_units'], dense_units=params['dense_units'],
+                            dropout=params['dropout'], batch_norm=params['batch_norm'], loss=params['loss'])
+        pruner = MedianPruner(store, study, trial_id, objective, warmup_epochs, min_trials)
+        early_stopping = tf.keras.callbacks.EarlyStopping(monitor=objective, patience=patience, restore_best_weights=True)
+        history = model.fit(train_dataset, epochs=max_epochs, validation_data=val_dataset,
+                            callbacks=[pruner, early_stopping], verbose=0)
+
+        values = history.history[objective]
+        best_epoch = values.index(min(values)) + 1
+        model_path = None
+        if models_dir and not pruner.pruned:
+            model_path = os.path.join(models_dir, f"{study}_trial_{trial_id}.keras")
+            model.save(model_path)
+        state = PRUNED if pruner.pruned else COMPLETE
+        store.finish_trial(trial_id, state, min(values), best_epoch, len(values), time.perf_counter() - started, model_path)
+        return {'trial_id': trial_id, 'state': state, 'best_value': min(values), 'epochs': len(values)}
+    except Exception as error:
+        # One broken configuration must not stop an overnight search
+        store.finish_trial(trial_id, FAILED, seconds=time.perf_counter() - started, error=repr(error))
+        return {'trial_id': trial_id, 'state': FAILED, 'best_value': None, 'epochs': 0, 'error': repr(error)}
+
+
+def print_top_trials(store, study, objective, limit=10):
+    print(f"{'trial':>6} {'state':10} {objective:>10} {'epoch':>6} {'seconds':>8}  params")
+    for trial in store.top_trials(study, limit):
+        print(f"{trial['trial_id']:>6} {trial['state']:10} {trial['best_value']:>10.5f} {trial['best_epoch']:>6} "
+              f"{trial['seconds'] or 0:>8.1f}  {trial['params']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter and architecture search for the EGR model.")
+    parser.add_argument('--train_csv', type=str, default='./eg_train.csv', help='Path to the training CSV file.')
+    parser.add_argument('--val_csv', type=str, default='./eg_test.csv', help='Path to the validation CSV file.')
+    parser.add_argument('--feature_store', type=str, default='./feature_store', help='Directory of cached preprocessed features.')
+    parser.add_argument('--study', type=str, default='./study.db', help='SQLite file where trials are logged.')
+    parser.add_argument('--study_name', type=str, default='egr', help='Name of the study; rerunning a name resumes it.')
+    parser.add_argument('--search_space', type=str, help='JSON file with the search space (defaults to DEFAULT_SEARCH_SPACE).')
+    parser.add_argument('--n_trials', type=int, default=50, help='Number of finished trials the study should reach.')
+    parser.add_argument('--threads_per_worker', type=int, default=2, help='TensorFlow threads of each worker process.')
+    parser.add_argument('--workers', type=int, help='Worker processes (defaults to CPU count / threads per worker).')
+    parser.add_argument('--objective', type=str, default='val_mse', choices=['val_mse', 'val_mae'],
+                        help='Validation metric minimized; the loss itself differs between trials.')
+    parser.add_argument('--max_epochs', type=int, default=30, help='Maximum epochs per trial.')
+    parser.add_argument('--patience', type=int, default=3, help='Epochs without improvement before early stopping.')
+    parser.add_argument('--warmup_epochs', type=int, default=3, help='Epochs before a trial can be pruned.')
+    parser.add_argument('--min_trials', type=int, default=3, help='Trials needed at an epoch before pruning compares against them.')
+    parser.add_argument('--models_dir', type=str, help='Save the model of every completed trial in this directory.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the sampler and the trials.')
+    parser.add_argument('--list', action='store_true', help='Only print the best trials of the study.')
+    args = parser.parse_args()
+
+    store = StudyStore(args.study)
+    if args.list:
+        print_top_trials(store, args.study_name, args.objective)
+        return
+
+    search_space = DEFAULT_SEARCH_SPACE
+    if args.search_space:
+        with open(args.search_space, 'r') as file:
+            search_space = json.load(file)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads_per_worker)
+    if args.models_dir:
+        os.makedirs(args.models_dir, exist_ok=True)
+
+    print("Loading features...")
+    train_entry, train_key = prepare_features(args.train_csv, args.feature_store)
+    _, val_key = prepare_features(args.val_csv, args.feature_store, scaler=train_entry['scaler'], parent_key=train_key)
+
+    store.mark_interrupted(args.study_name)
+    remaining = args.n_trials - store.count_finished(args.study_name)
+    if remaining <= 0:
+        print(f"Study '{args.study_name}' already has {args.n_trials} finished trials.")
+        print_top_trials(store, args.study_name, args.objective)
+        return
+    rng = random.Random(f"{args.seed}-{args.study_name}-{args.n_trials - remaining}")
+
+    print(f"Running {remaining} trials on {workers} workers x {args.threads_per_worker} threads...")
+    # Spawned, not forked: TensorFlow's runtime does not survive a fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(args.threads_per_worker, args.feature_store, train_key, val_key)) as pool:
+        futures = []
+        for _ in range(remaining):
+            params = sample_params(search_space, rng)
+            trial_id = store.create_trial(args.study_name, params)
+            futures.append(pool.submit(run_trial, trial_id, params, args.study, args.study_name, args.objective,
+                                       args.max_epochs, args.patience, args.warmup_epochs, args.min_trials,
+                                       args.seed, args.models_dir))
+        for future in as_completed(futures):
+            result = future.result()
+            value = 'n/a' if result['best_value'] is None else f"{result['best_value']:.5f}"
+            print(f"Trial {result['trial_id']}: {result['state']} after {result['epochs']} epochs, {args.objective} {value}")
+
+    print_top_trials(store, args.study_name, args.objective)
+
+
+if __name__ == "__main__":
+    main()
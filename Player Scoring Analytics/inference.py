@@ -1,22 +1,57 @@
 import argparse
+import hashlib
 import joblib
 import pandas as pd
 import numpy as np
-import tensorflow as tf
 from datetime import datetime
 from tqdm import tqdm
+from agents import add_agent_columns
+from embedding_store import EmbeddingStore, player_game_table, update_store
+from feature_store import feature_store_key, file_digest, load_features, save_features
+from instrumentation import Tracer, profile, set_tracer, span
+from model_registry import Scorer, load_scorer, stale_game_ids
+from player_form import update_store as update_player_form
+from sequence_store import SequenceStore
+
+# Columns that are identifiers, targets or raw values not used as model features
+EXCLUDED_COLUMNS = [
+    "game_id", "player", "game_version", "game_datetime", "inventory", "team_id", "attacking_team",
+    "event_num", "event_time", "round_start_time", "clock_time", 'account_id', 'agent_id', 'team',
+    "opponent_team", "spike_diffused", "teamId_value", "ability1_temp_charges", "ability1_max_charges",
+    "ultimate_temp_charges", "ultimate_max_charges", "ability2_max_charges", "ability2_temp_charges",
+    "grenade_temp_charges", "grenade_max_charges", "money", "combat_score_total", "damage_dealt",
+    "damage_taken", "combat_score_round", "cs_round_normalized", "kills", "deaths", "assists", "won"
+]
+
+# Columns encoded as category codes before scoring
+CATEGORICAL_COLUMNS = ["agent_name", "map_name", "side", "spike_event", "spike_planted"]
 
 def load_data(file_path):
-    df = pd.read_csv(file_path)
+    return prepare_data(pd.read_csv(file_path))
+
+def prepare_data(df, category_codes=None):
+    """
+    Sort snapshot rows and encode the categorical columns, as expected by `infer`.
+
+    :param df: Prepared snapshot rows.
+    :param category_codes: Column -> {value: code} (see `live_scoring.load_category_codes`); by default
+                           categories are coded in sorted order of the values present in `df`.
+    :return: Sorted and encoded copy of `df`.
+    """
     df = df.sort_values(['game_id', 'team', 'player', 'round_num', 'seconds'])
     df['won'] = df['won'].replace({True: 1, False: 0})
     
-    categorical_columns = ["agent_name", "map_name", "side", "spike_event", "spike_planted"]
-    for col in categorical_columns:
-        df[col] = df[col].astype("category").cat.codes
+    for col in CATEGORICAL_COLUMNS:
+        if category_codes is None:
+            df[col] = df[col].astype("category").cat.codes
+        else:
+            df[col] = df[col].map(category_codes[col]).fillna(-1).astype(int)
     
     return df
 
+def get_feature_columns(df):
+    return df.columns.difference(EXCLUDED_COLUMNS)
+
 def check_and_handle_nan_inf(df, feature_columns):
     X = df[feature_columns]
     if np.any(np.isnan(X)) or np.any(np.isinf(X)):
@@ -45,97 +80,343 @@ def generate_samples(df, feature_columns, target_column):
     
     return player_game_samples, target_game_samples
 
-def pad_sequences(sequences):
-    max_timesteps = max(seq.shape[0] for seq in sequences)
-    padded_sequences = [np.pad(seq, ((0, max_timesteps - seq.shape[0]), (0, 0)), 'constant', constant_values=-999)
-                        for seq in sequences]
-    return np.stack(padded_sequences, axis=0)
+def embedding_model(model):
+    """
+    Model returning both the prediction and the final hidden state of the last LSTM layer.
+
+    The hidden state is the round's performance signature that the Dense output reads.
+    """
+    import tensorflow as tf
+    lstm = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.LSTM)][-1]
+    return tf.keras.Model(model.inputs, [model.outputs[0], lstm.output])
+
+def predict_rounds(model, store, batch_size=256, verbose=True, embeddings=False):
+    """
+    Predict every round, batching rounds of similar length together.
+
+    Each round is an independent model input, so rounds of different player-games
+    can share a batch; sorting by length keeps padding small.
+
+    :param model: Trained Keras model.
+    :param store: SequenceStore with the scaled rounds.
+    :param batch_size: Rounds per model call.
+    :param verbose: Show a progress bar.
+    :param embeddings: Also return each round's embedding (see `embedding_model`), from the same forward pass.
+    :return: float32 array with one prediction per round, in store order, or a tuple of
+             (predictions, embeddings [rounds, units]) with `embeddings`.
+    """
+    predictions = np.empty(len(store), dtype=np.float32)
+    round_embeddings = None
+    if embeddings:
+        model = embedding_model(model)
+    batches = store.length_sorted_batches(batch_size)
+    for indices, padded_batch in tqdm(batches, total=-(-len(store) // batch_size), desc="Inferencing", disable=not verbose):
+        if not embeddings:
+            predictions[indices] = np.asarray(model.predict_on_batch(padded_batch)).reshape(-1)
+            continue
+        batch_predictions, batch_embeddings = model.predict_on_batch(padded_batch)
+        if round_embeddings is None:
+            round_embeddings = np.empty((len(store), batch_embeddings.shape[1]), dtype=np.float32)
+        predictions[indices] = np.asarray(batch_predictions).reshape(-1)
+        round_embeddings[indices] = batch_embeddings
+    return (predictions, round_embeddings) if embeddings else predictions
+
+def extract_feature_matrix(df, feature_columns, order=None):
+    """
+    Copy the feature columns into one contiguous float32 matrix.
+
+    The matrix is filled column by column, so only one temporary column exists
+    besides the matrix itself.
+
+    :param df: DataFrame returned by `load_data`.
+    :param feature_columns: Feature columns, in scaler order.
+    :param order: Row order of the matrix (optional).
+    :return: float32 array [rows, features].
+    """
+    X = np.empty((len(df), len(feature_columns)), dtype=np.float32)
+    for j, column in enumerate(feature_columns):
+        values = df[column].to_numpy()
+        X[:, j] = values if order is None else values[order]
+    return X
 
-def infer(model, new_data, feature_columns, scaler):
+def get_scaler_params(scaler):
+    """
+    Express a fitted scaler as X_scaled = (X - offset) * multiplier.
+
+    :return: Tuple of (offset, multiplier, training means); means are None when the scaler does not keep them.
+    """
+    if hasattr(scaler, 'data_min_'):  # MinMaxScaler: X * scale_ + min_
+        return -scaler.min_ / scaler.scale_, scaler.scale_, None
+    offset = scaler.mean_ if getattr(scaler, 'with_mean', True) else np.zeros(scaler.n_features_in_)
+    multiplier = 1 / scaler.scale_ if getattr(scaler, 'with_std', True) else np.ones(scaler.n_features_in_)
+    return offset, multiplier, scaler.mean_
+
+def sanitize_features(X, means=None, verbose=True):
+    """
+    Replace NaNs with the training means and infinities with the float32 limits, in place.
+
+    :param X: float32 feature matrix.
+    :param means: Training mean per feature; the column means of X are used when omitted.
+    :param verbose: Report whether values were fixed.
+    """
+    nan_mask = np.isnan(X)
+    if nan_mask.any() or np.isinf(X).any():
+        if verbose:
+            print("Input data contains NaNs or infinite values. Fixing...")
+        if means is None:
+            means = np.nanmean(np.where(np.isinf(X), np.nan, X), axis=0)
+        np.copyto(X, np.broadcast_to(np.asarray(means, dtype=np.float32), X.shape), where=nan_mask)
+        np.nan_to_num(X, copy=False, posinf=np.finfo(np.float32).max, neginf=np.finfo(np.float32).min)
+        if verbose:
+            print("NaNs and infinite values fixed.")
+    elif verbose:
+        print("No NaNs or infinite values found.")
+
+def scale_features(X, offset, multiplier):
+    """Apply the scaler's affine transform to X in place."""
+    X -= offset.astype(np.float32)
+    X *= multiplier.astype(np.float32)
+    # Values at the float32 limits can overflow when scaled
+    np.nan_to_num(X, copy=False, posinf=np.finfo(np.float32).max, neginf=np.finfo(np.float32).min)
+
+def prepare_sequences(new_data, feature_columns, scaler, target_range=None, verbose=True):
+    """
+    Scale the features of prepared snapshots into flat per-round sequences.
+
+    :param new_data: DataFrame returned by `load_data`.
+    :param feature_columns: Feature columns, in scaler order.
+    :param scaler: Fitted scaler.
+    :param target_range: (min, max) combat score used to normalize the target; defaults to the range in `new_data`.
+    :param verbose: Report whether NaNs or infinities were fixed.
+    :return: Dictionary with 'values' (float32 [events, features]), 'round_lengths', 'targets' per round,
+             'player_game_lengths' (rounds per player-game) and 'player_game_ids' / 'player_game_players'.
+    """
     # Normalize the target column
-    new_data['cs_round_normalized'] = (new_data['combat_score_round'] - new_data['combat_score_round'].min()) / (new_data['combat_score_round'].max() - new_data['combat_score_round'].min())
-    target_column = 'cs_round_normalized'
+    combat_score = new_data['combat_score_round'].to_numpy(dtype=np.float64)
+    low, high = target_range if target_range is not None else (np.nanmin(combat_score), np.nanmax(combat_score))
+    target = (combat_score - low) / (high - low)
 
-    # Handle NaNs and infinite values, scale features
-    new_data = check_and_handle_nan_inf(new_data, feature_columns)
-    new_data.loc[:, feature_columns] = scaler.transform(new_data.loc[:, feature_columns])
+    # Rows ordered by (game_id, player) group, then round, keeping event order within a round
+    round_keys = new_data.groupby(['game_id', 'player', 'round_num'], sort=True).ngroup().to_numpy()
+    order = np.argsort(round_keys, kind='stable')
 
-    # Generate samples and targets
-    player_game_samples, target_game_samples = generate_samples(new_data, feature_columns, target_column)
+    # One float32 feature matrix, sanitized and scaled in place
+    if hasattr(scaler, 'feature_names_in_') and list(scaler.feature_names_in_) != list(feature_columns):
+        raise ValueError("Feature columns do not match the columns the scaler was fitted on.")
+    offset, multiplier, means = get_scaler_params(scaler)
+    with span('feature_extract'):
+        X = extract_feature_matrix(new_data, feature_columns, order)
+    with span('nan_fix'):
+        sanitize_features(X, means, verbose)
+    with span('scale'):
+        scale_features(X, offset, multiplier)
 
-    print("Player game samples:", len(player_game_samples))
+    # Offset tables of the rounds and player-games in the matrix
+    with span('sample_build'):
+        round_lengths = np.bincount(round_keys)
+        round_ends = np.cumsum(round_lengths)
+        round_starts = round_ends - round_lengths
+        game_ids = new_data['game_id'].to_numpy()[order[round_starts]]
+        players = new_data['player'].to_numpy()[order[round_starts]]
+        # A new player-game starts wherever (game_id, player) changes between rounds
+        new_group = np.ones(len(round_starts), dtype=bool)
+        new_group[1:] = (game_ids[1:] != game_ids[:-1]) | (players[1:] != players[:-1])
+        group_starts = np.flatnonzero(new_group)
+
+    return {
+        'values': X,
+        'round_lengths': round_lengths.astype(np.int64),
+        'targets': target[order][round_ends - 1].astype(np.float32),
+        'player_game_lengths': np.diff(np.append(group_starts, len(round_starts))),
+        'player_game_ids': game_ids[group_starts].astype(str),
+        'player_game_players': players[group_starts].astype(str),
+    }
+
+def score_sequences(model, sequences, batch_size=256, verbose=True, embeddings=False):
+    """
+    Predict every round of prepared sequences.
+
+    :param model: Trained Keras model.
+    :param sequences: Output of `prepare_sequences`, or a feature-store entry holding the same arrays.
+    :param batch_size: Rounds per model call.
+    :param verbose: Print the sample counts and every round's prediction.
+    :param embeddings: Also return one embedding per player-game, the mean of its round embeddings.
+    :return: DataFrame with game_id, player, round_num, EGR and Target per round, or a tuple of
+             (DataFrame, embeddings [player-games, units]) with `embeddings`; player-games are in
+             the order of sequences['player_game_ids'].
+    """
+    store = SequenceStore(sequences['values'], sequences['round_lengths'], sequences['player_game_lengths'])
+    if verbose:
+        print("Player game samples:", store.num_player_games)
     
     # Predictions
-    predictions = []
-    for sample, _ in tqdm(zip(player_game_samples, target_game_samples), total=len(player_game_samples), desc="Inferencing"):
-        padded_sample = pad_sequences(sample)
-        pred = model.predict(padded_sample)
-        predictions.append(pred)
+    with span('predict', player_games=store.num_player_games, rounds=len(store)):
+        predictions = predict_rounds(model, store, batch_size=batch_size, verbose=verbose, embeddings=embeddings)
+    if embeddings:
+        predictions, round_embeddings = predictions
+        player_game_embeddings = (np.add.reduceat(round_embeddings, store.player_game_offsets[:-1], axis=0)
+                                  / np.diff(store.player_game_offsets)[:, None])
     
-    print("Predictions length:", len(predictions))
+    if verbose:
+        print("Predictions length:", len(predictions))
 
-    # Store results properly, tracking the correct game_id
-    results = []
-    grouped_keys = list(new_data.groupby(['game_id', 'player']).groups.keys())
-    print("Grouped keys length:", len(grouped_keys))
-    
-    for i, (game_id, player) in enumerate(grouped_keys):
-        if i >= len(predictions):
-            print(f"Warning: Not enough predictions for game_id {game_id} and player {player}")
-            continue
-        for round_num, (pred_score, target_score) in enumerate(zip(predictions[i], target_game_samples[i])):
-            results.append((game_id, player, round_num + 1, pred_score[0], target_score))
-            print(f"Game ID: {game_id}, Player: {player}, Round Number: {round_num + 1}, Prediction Score: {pred_score[0]}, Target Score: {target_score}")
-    
-    results_df = pd.DataFrame(results, columns=['game_id', 'player', 'round_num', 'EGR', 'Target'])
-    return results_df
+    # Round number within each player-game, counted from 1
+    player_game_lengths = np.diff(store.player_game_offsets)
+    round_numbers = np.arange(len(store)) - np.repeat(store.player_game_offsets[:-1], player_game_lengths) + 1
+    results_df = pd.DataFrame({'game_id': np.repeat(sequences['player_game_ids'], player_game_lengths),
+                               'player': np.repeat(sequences['player_game_players'], player_game_lengths),
+                               'round_num': round_numbers, 'EGR': predictions, 'Target': sequences['targets']})
+    if verbose:
+        for row in results_df.itertuples(index=False):
+            print(f"Game ID: {row.game_id}, Player: {row.player}, Round Number: {row.round_num}, Prediction Score: {row.EGR}, Target Score: {row.Target}")
+    return (results_df, player_game_embeddings) if embeddings else results_df
+
+def infer(model, new_data, feature_columns, scaler, batch_size=256, verbose=True):
+    sequences = prepare_sequences(new_data, feature_columns, scaler, verbose=verbose)
+    return score_sequences(model, sequences, batch_size=batch_size, verbose=verbose)
+
+def merge_results(original_data, results_df):
+    # Attach the per-round predictions to every event row and add agent codes and roles
+    merged_table = pd.merge(original_data, results_df, on=['game_id', 'player', 'round_num'])
+    return add_agent_columns(merged_table)
 
 def main():
     parser = argparse.ArgumentParser(description="Inference script for Valorant LSTM model.")
     parser.add_argument('csv_file', type=str, help='Path to the input CSV file.')
     parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
     parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    parser.add_argument('--registry', type=str, help='Model registry directory; overrides --model_path and --scaler_path.')
+    parser.add_argument('--model_version', type=str, default='latest', help='Registered model version used with --registry.')
+    parser.add_argument('--previous_results', type=str, help='Earlier results file; only games scored by another model version are rescored, and the other games keep their rows in the new file.')
+    parser.add_argument('--feature_store', type=str, help='Directory of cached scaled sequences; repeated runs on the same file skip preprocessing.')
+    parser.add_argument('--embeddings', type=str, help='Embedding store directory; each scored player-game\'s LSTM embedding is added to it.')
+    parser.add_argument('--player_form', type=str, help='Player form store directory; the scored games are added to it.')
+    parser.add_argument('--trace', type=str, help='Write a JSON trace of the stage timings to this file.')
+    parser.add_argument('--profile', type=str, help='Profile the run and write the profile to this file.')
+    parser.add_argument('--profiler', type=str, choices=['cprofile', 'pyinstrument'], default='cprofile', help='Profiler used with --profile.')
     args = parser.parse_args()
-    
-    print("Loading data...")
-    df = load_data(args.csv_file)
-    
-    print("Loading model...")
+
+    tracer = set_tracer(Tracer('inference'))
+    with profile(args.profile, args.profiler):
+        run_inference(args)
+
+    print(tracer.summary())
+    if args.trace:
+        tracer.write(args.trace)
+        print(f"Trace saved to {args.trace}")
+
+def get_scorer(args, feature_columns=None):
+    """
+    Return the scorer selected on the command line.
+
+    :param args: Parsed command-line arguments.
+    :param feature_columns: Feature columns of the input data, used for unregistered models; defaults to the scaler's columns.
+    :return: Scorer.
+    """
+    if args.registry:
+        return load_scorer(args.registry, args.model_version)
+    # Imported here so argument parsing and --help do not wait for TensorFlow
+    import tensorflow as tf
+    # Unregistered models are tagged with a digest of the model file
     model = tf.keras.models.load_model(args.model_path)
-    
-    print("Loading scaler...")
     scaler = joblib.load(args.scaler_path)
+    if feature_columns is None:
+        feature_columns = scaler.feature_names_in_
+    return Scorer(f"unregistered-{file_digest(args.model_path)[:12]}", model, scaler, feature_columns)
+
+def scaler_digest(scaler):
+    """Short digest of a scaler's transform, used to key cached sequences."""
+    offset, multiplier, _ = get_scaler_params(scaler)
+    return hashlib.sha256(np.concatenate([offset, multiplier]).astype(np.float64).tobytes()).hexdigest()[:16]
+
+def load_sequences(args, scorer):
+    """
+    Return the scaled sequences of the input file, from the feature store when possible.
+
+    :param args: Parsed command-line arguments.
+    :param scorer: Scorer whose features and scaler are used.
+    :return: Sequences dictionary (see `prepare_sequences`), or None when there is nothing to score.
+    """
+    key = None
+    if args.feature_store:
+        parent_key = scaler_digest(scorer.scaler)
+        if args.previous_results:
+            parent_key += file_digest(args.previous_results)
+        key = feature_store_key(args.csv_file, scorer.feature_columns, parent_key)
+        entry = load_features(args.feature_store, key)
+        if entry is not None:
+            print(f"Using cached sequences for {args.csv_file} ({key}).")
+            return entry
+
+    print("Loading data...")
+    with span('load'):
+        df = load_data(args.csv_file)
+
+    if args.previous_results:
+        previous = pd.read_csv(args.previous_results, usecols=lambda column: column in ('game_id', 'model_version'),
+                               dtype={'model_version': str})
+        scored_games = set(previous['game_id'].unique()) - set(stale_game_ids(previous, scorer.version))
+        df = df[~df['game_id'].isin(scored_games)]
+        print(f"Skipping {len(scored_games)} games already scored by model version {scorer.version}.")
+        if df.empty:
+            print("No games to rescore.")
+            return None
+
+    with span('prepare', rows=len(df)):
+        scorer.check_columns(df)
+        sequences = prepare_sequences(df, scorer.feature_columns, scorer.scaler)
+    if key:
+        extra_arrays = {name: sequences[name] for name in ['player_game_lengths', 'player_game_ids', 'player_game_players']}
+        save_features(args.feature_store, key, sequences['values'], sequences['round_lengths'], sequences['targets'],
+                      scorer.feature_columns, source=args.csv_file, extra_arrays=extra_arrays)
+    return sequences
+
+def run_inference(args):
+    feature_columns = get_feature_columns(pd.read_csv(args.csv_file, nrows=0))
+
+    print("Loading model...")
+    with span('model_load'):
+        scorer = get_scorer(args, feature_columns)
+    print(f"Using model version {scorer.version}")
+
+    sequences = load_sequences(args, scorer)
+    if sequences is None:
+        return
     
     print("Starting inference...")
-    results_df = infer(model, df, df.columns.difference([
-        "game_id", "player", "game_version", "game_datetime", "inventory", "team_id", "attacking_team",
-        "event_num", "event_time", "round_start_time", "clock_time", 'account_id', 'agent_id', 'team',
-        "opponent_team", "spike_diffused", "teamId_value", "ability1_temp_charges", "ability1_max_charges",
-        "ultimate_temp_charges", "ultimate_max_charges", "ability2_max_charges", "ability2_temp_charges",
-        "grenade_temp_charges", "grenade_max_charges", "money", "combat_score_total", "damage_dealt",
-        "damage_taken", "combat_score_round", "cs_round_normalized", "kills", "deaths", "assists", "won"
-    ]), scaler)
+    with span('infer', rounds=len(sequences['round_lengths'])):
+        if args.embeddings:
+            results_df, player_game_embeddings = score_sequences(scorer.model, sequences, embeddings=True)
+        else:
+            results_df = score_sequences(scorer.model, sequences)
+        results_df['model_version'] = scorer.version
     
     # Load the original data again for merging
-    original_data = pd.read_csv(args.csv_file)
-    rf = results_df.rename(columns={"game_id": "game_id", "player": "player", "round_num": "round_num"})
-    merged_table = pd.merge(original_data, rf, on=['game_id', 'player', 'round_num'])
+    with span('merge'):
+        original_data = pd.read_csv(args.csv_file)
+        original_data = original_data[original_data['game_id'].isin(results_df['game_id'].unique())]
+        merged_table = merge_results(original_data, results_df)
     
-    # Add roles
-    roles_dict = {
-        'Controllers': ['Astra', 'Brimstone', 'Clove', 'Harbor', 'Omen', 'Viper'],
-        'Duelists': ['Iso', 'Jett', 'Neon', 'Phoenix', 'Raze', 'Reyna', 'Yoru'],
-        'Initiators': ['Breach', 'Fade', 'Gekko', 'KAY/O', 'Skye', 'Sova'],
-        'Sentinels': ['Chamber', 'Cypher', 'Deadlock', 'Killjoy', 'Sage', 'Vyse']
-    }
-    agent_to_role = {agent.lower(): role for role, agents in roles_dict.items() for agent in agents}
+    if args.embeddings:
+        with span('embeddings', player_games=len(player_game_embeddings)):
+            ids = player_game_table(sequences['player_game_ids'], sequences['player_game_players'], original_data)
+            update_store(args.embeddings, EmbeddingStore(player_game_embeddings, ids, scorer.version))
     
-    merged_table['role'] = merged_table['agent_name'].str.lower().map(agent_to_role)
+    if args.player_form:
+        with span('player_form'):
+            update_player_form(args.player_form, merged_table)
     
+    # Games that were not rescored keep their earlier rows, so the file replaces the previous one
+    if args.previous_results:
+        previous = pd.read_csv(args.previous_results)
+        kept = previous[~previous['game_id'].isin(merged_table['game_id'].unique())]
+        merged_table = pd.concat([kept, merged_table], ignore_index=True)
+
     # Save results
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_filename = f'results_{timestamp}.csv'
-    merged_table.to_csv(output_filename, index=False)
+    with span('write', rows=len(merged_table)):
+        merged_table.to_csv(output_filename, index=False)
     print(f"Inference completed. Results saved to {output_filename}")
 
 if __name__ == "__main__":
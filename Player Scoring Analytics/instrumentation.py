@@ -0,0 +1,146 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger('eg.trace')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None when unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MB, or None when unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+class Tracer:
+    """
+    Records nested timing spans with wall time, CPU time and memory usage.
+
+    Each finished span is logged as one JSON line on the 'eg.trace' logger and kept
+    so the whole run can be written out as a JSON trace.
+    """
+
+    def __init__(self, name='trace'):
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        stack = self._local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        rss_before = current_rss_mb()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss_after = current_rss_mb()
+            stack.pop()
+            record = {
+                'name': name,
+                'parent': parent,
+                'start_s': round(wall_start - self._origin, 6),
+                'wall_s': round(wall, 6),
+                'cpu_s': round(cpu, 6),
+                'peak_rss_mb': peak_rss_mb(),
+                'rss_delta_mb': None if rss_before is None or rss_after is None else round(rss_after - rss_before, 3),
+                **attributes,
+            }
+            with self._lock:
+                self.spans.append(record)
+            logger.info(json.dumps(record, default=str))
+
+    def to_dict(self):
+        return {'trace': self.name, 'started_at': self.started_at, 'spans': list(self.spans)}
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4, default=str)
+
+    def summary(self):
+        """Human-readable table of the recorded spans."""
+        lines = [f"{'stage':28} {'wall (s)':>10} {'cpu (s)':>10} {'peak RSS (MB)':>14}"]
+        for record in sorted(self.spans, key=lambda record: record['start_s']):
+            name = ('  ' if record['parent'] else '') + record['name']
+            peak = '-' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.1f}"
+            lines.append(f"{name:28} {record['wall_s']:>10.3f} {record['cpu_s']:>10.3f} {peak:>14}")
+        return "\n".join(lines)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+
+def span(name, **attributes):
+    """Record a span on the current tracer."""
+    return _tracer.span(name, **attributes)
+
+
+@contextlib.contextmanager
+def profile(output_path=None, profiler='cprofile'):
+    """
+    Optionally profile the enclosed block.
+
+    :param output_path: Where to write the profile; profiling is disabled when omitted.
+    :param profiler: 'cprofile' (writes pstats data) or 'pyinstrument' (writes HTML, needs pyinstrument installed).
+    """
+    if not output_path:
+        yield
+        return
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        active = Profiler()
+        active.start()
+        try:
+            yield
+        finally:
+            active.stop()
+            with open(output_path, 'w') as file:
+                file.write(active.output_html())
+    else:
+        active = cProfile.Profile()
+        active.enable()
+        try:
+            yield
+        finally:
+            active.disable()
+            active.dump_stats(output_path)
+    print(f"Profile saved to {output_path}")
@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_prep import attach_damage, window_sums
+from inference import (CATEGORICAL_COLUMNS, extract_feature_matrix, get_scaler_params, get_scorer, predict_rounds,
+                       sanitize_features, scale_features)
+from sequence_store import SequenceStore
+
+ABILITIES = ['ability1_base_charges', 'ability2_base_charges', 'grenade_base_charges', 'ultimate_base_charges']
+CONSEQUENCE_VALUES = ['kill_change', 'death_change', 'damage_dealt', 'damage_taken']
+# Consequence columns per window owner: the row's team, the player, and the opposing team
+CONSEQUENCE_COLUMNS = {prefix: [f'{prefix}kill_c', f'{prefix}death_c', f'{prefix}damage_dealt_c', f'{prefix}damage_taken_c']
+                       for prefix in ['', 'player_', 'opponent_']}
+
+
+def load_category_codes(reference_csv):
+    """
+    Return the category codes `prepare_data` assigns on the reference (training) file.
+
+    `prepare_data` codes categories in sorted order of the values present in a file, so
+    live events have to use the codes of the data the model was trained on.
+
+    :param reference_csv: Prepared CSV the model was trained on.
+    :return: Dictionary of column -> {value: code}.
+    """
+    reference = pd.read_csv(reference_csv, usecols=CATEGORICAL_COLUMNS)
+    return {column: {value: code for code, value in enumerate(reference[column].astype('category').cat.categories)}
+            for column in CATEGORICAL_COLUMNS}
+
+
+class RoundState:
+    """Buffers and running totals of the current round of one game."""
+
+    def __init__(self, game_id, round_num):
+        self.game_id = game_id
+        self.round_num = round_num
+        self.rows = []
+        # Rows of the current event, completed with the team totals once the event is over
+        self.pending = []
+        self.event_num = None
+        self.previous = {}
+        # Each player's (team, [alive, health, inventory]) share of the team totals
+        self.contribution = {}
+        self.team_totals = {}
+        self.damage = []
+
+
+class LiveScorer:
+    """
+    Scores every player's round as soon as it ends, from a stream of snapshot events.
+
+    Snapshot events carry the raw snapshot columns of one player at one event. Kill, death
+    and ability charge changes and the team and opponent alive, health and inventory
+    totals are updated incrementally as events arrive. The 10-second consequence windows
+    look ahead in time, so they are computed when the round ends.
+
+    A round ends at a `round_end` or `game_end` event, or when the game's next round starts.
+    Damage events (attacker, attacker_team, victim, victim_team, damage, seconds and
+    optionally event_num) only feed the consequence windows. As in batch preparation,
+    they are attached to the players' latest snapshots with `attach_damage`.
+    """
+
+    def __init__(self, scorer, category_codes, window=10, batch_size=256):
+        self.scorer = scorer
+        self.category_codes = category_codes
+        self.window = window
+        self.batch_size = batch_size
+        self.offset, self.multiplier, self.means = get_scaler_params(scorer.scaler)
+        self.games = {}
+        self.closed_rounds = {}
+        # Two calls with different shapes make TensorFlow trace a shape-generic graph up front,
+        # instead of retracing on the first rounds
+        for size in [1, 2]:
+            warmup = SequenceStore(np.zeros((size * size, len(scorer.feature_columns)), dtype=np.float32), [size] * size)
+            predict_rounds(scorer.model, warmup, verbose=False)
+
+    def process(self, event):
+        """
+        Handle one event.
+
+        :param event: Event dictionary; 'type' is 'snapshot' (default), 'damage', 'round_end' or 'game_end'.
+        :return: List of per-player results of the rounds the event closed.
+        """
+        kind = event.get('type', 'snapshot')
+        game_id = event['game_id']
+        state = self.games.get(game_id)
+
+        if kind == 'game_end':
+            return self.close_round(game_id) if state else []
+        # Late events of a round that was already scored are dropped
+        if event['round_num'] <= self.closed_rounds.get(game_id, -np.inf):
+            return []
+        if kind == 'round_end':
+            return self.close_round(game_id) if state and state.round_num == event['round_num'] else []
+
+        results = []
+        if state is None or state.round_num != event['round_num']:
+            if state is not None:
+                results = self.close_round(game_id)
+            state = self.games[game_id] = RoundState(game_id, event['round_num'])
+        if kind == 'damage':
+            state.damage.append(event)
+        else:
+            self._add_snapshot(state, event)
+        return results
+
+    def _add_snapshot(self, state, event):
+        if event['event_num'] != state.event_num:
+            self._finish_event(state)
+            state.event_num = event['event_num']
+
+        player, team = event['player'], event['team']
+        previous = state.previous.get(player)
+        row = dict(event)
+        hp = row.get('hp') or 0
+        row['is_alive'] = int(hp > 0)
+        if not row['is_alive']:
+            row['inventory_value'] = 0
+        # Changes are taken within the round, so a player's first event has none
+        for column, change in [('kills', 'kill_change'), ('deaths', 'death_change')]:
+            row[change] = max(row[column] - previous[column], 0) if previous else 0
+        for ability in ABILITIES:
+            change = row[ability] - previous[ability] if previous else 0
+            row[f'{ability}_change'] = change
+            row[f'{ability}_gained'] = max(change, 0)
+            row[f'{ability}_used'] = max(-change, 0)
+        row['spike_event'] = 'post-plant' if row.get('spike_planted') else 'pre-plant'
+        state.previous[player] = event
+
+        # Team totals change by the difference of this player's share
+        share = np.array([row['is_alive'], hp, row.get('inventory_value') or 0], dtype=np.float64)
+        old_team, old_share = state.contribution.get(player, (team, 0))
+        state.team_totals[old_team] = state.team_totals.get(old_team, 0) - old_share
+        state.team_totals[team] = state.team_totals.get(team, 0) + share
+        state.contribution[player] = (team, share)
+        state.pending.append(row)
+
+    def _finish_event(self, state):
+        for row in state.pending:
+            opponent = next((team for team in state.team_totals if team != row['team']), None)
+            ours = state.team_totals[row['team']]
+            theirs = state.team_totals.get(opponent, np.zeros(3))
+            row['our_team_alive'], row['our_team_health'], row['team_inventory_value'] = ours
+            row['opponent_team'] = opponent
+            row['opponent_team_alive'], row['opponent_team_health'], row['opponent_team_inventory_value'] = theirs
+        state.rows.extend(state.pending)
+        state.pending = []
+
+    def _add_consequences(self, df, damage):
+        # Damage is attached as-of to the players' snapshot rows, as in batch preparation,
+        # so the windows scan snapshot rows only
+        damage_df = pd.DataFrame(damage, columns=['game_id', 'round_num', 'event_num', 'attacker', 'victim', 'damage', 'seconds'])
+        # Events without an event_num are summed on their own
+        damage_df['event_num'] = damage_df['event_num'].fillna(pd.Series(-1 - np.arange(len(damage_df)), index=damage_df.index))
+        attach_damage(df, damage_df)
+
+        seconds = df['seconds'].to_numpy(dtype=np.float64)
+        values = df[CONSEQUENCE_VALUES].fillna(0).to_numpy(dtype=np.float64)
+        team_codes, team_names = pd.factorize(df['team'])
+        player_codes, _ = pd.factorize(df['player'])
+        # A row without a known opponent gets code -1, which matches no rows
+        opponent_codes = pd.Index(team_names).get_indexer(df['opponent_team'])
+        for prefix, event_keys, query_keys in [('', team_codes, team_codes),
+                                               ('player_', player_codes, player_codes),
+                                               ('opponent_', team_codes, opponent_codes)]:
+            df[CONSEQUENCE_COLUMNS[prefix]] = window_sums(event_keys, seconds, values, query_keys, seconds, self.window)
+
+    def close_round(self, game_id):
+        """Score the buffered round of a game and return one result per player."""
+        started = time.perf_counter()
+        state = self.games.pop(game_id)
+        self.closed_rounds[game_id] = state.round_num
+        self._finish_event(state)
+        if not state.rows:
+            return []
+
+        df = pd.DataFrame(state.rows)
+        self._add_consequences(df, state.damage)
+        for column, codes in self.category_codes.items():
+            df[column] = df[column].map(codes).fillna(-1) if column in df else -1
+        df = df.reindex(columns=df.columns.union(self.scorer.feature_columns, sort=False))
+        df = df.sort_values(['player', 'seconds'], kind='stable')
+
+        X = extract_feature_matrix(df, self.scorer.feature_columns)
+        sanitize_features(X, self.means, verbose=False)
+        scale_features(X, self.offset, self.multiplier)
+        player_values = df['player'].to_numpy()
+        bounds = np.flatnonzero(np.r_[True, player_values[1:] != player_values[:-1], True])
+        store = SequenceStore(X, np.diff(bounds))
+        predictions = predict_rounds(self.scorer.model, store, batch_size=self.batch_size, verbose=False)
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        teams = df['team'].to_numpy()
+        return [{'game_id': game_id, 'player': player_values[start], 'team': teams[start], 'round_num': state.round_num,
+                 'EGR': float(prediction), 'model_version': self.scorer.version, 'latency_ms': latency_ms}
+                for start, prediction in zip(bounds[:-1], predictions)]
+
+    def close_all(self):
+        """Score every buffered round, e.g. when the stream ends."""
+        results = []
+        for game_id in list(self.games):
+            results.extend(self.close_round(game_id))
+        return results
+
+
+def read_file_events(file_path, follow=False, poll_interval=0.05):
+    """
+    Yield JSON-lines events from a file, optionally waiting for new lines like `tail -f`.
+
+    :param file_path: File with one JSON event per line.
+    :param follow: Keep reading lines appended to the file.
+    :param poll_interval: Seconds between checks for new lines.
+    """
+    with open(file_path, 'r') as file:
+        line = ''
+        while True:
+            line += file.readline()
+            if not line.endswith('\n'):
+                # Nothing new, or a line that is still being written
+                if not follow:
+                    if line.strip():
+                        yield json.loads(line)
+                    return
+                time.sleep(poll_interval)
+                continue
+            if line.strip():
+                yield json.loads(line)
+            line = ''
+
+
+def read_socket_events(host, port):
+    """Yield JSON-lines events sent over TCP, one connection at a time (a stand-in for the live feed)."""
+    with socket.create_server((host, port)) as server:
+        print(f"Waiting for events on {host}:{port}", file=sys.stderr)
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile('r') as stream:
+                for line in stream:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def replay_events(csv_path):
+    """Yield the snapshot rows of a prepared CSV as events, in event order, to test the stream."""
+    df = pd.read_csv(csv_path).sort_values(['game_id', 'round_num', 'event_num', 'player'], kind='stable')
+    for record in df.to_dict(orient='records'):
+        yield {key: value for key, value in record.items() if not pd.isna(value)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live per-round EGR scoring from a stream of snapshot events.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--follow', type=str, help='JSON-lines event file to tail.')
+    source.add_argument('--listen', type=str, help='HOST:PORT to accept JSON-lines events on.')
+    source.add_argument('--replay', type=str, help='Prepared CSV replayed as an event stream.')
+    parser.add_argument('--no_wait', action='store_true', help='With --follow, stop at the end of the file instead of waiting.')
+    parser.add_argument('--reference_csv', type=str, default='./eg_train.csv', help='Training CSV whose category codes the model expects.')
+    parser.add_argument('--registry', type=str, help='Model registry directory; overrides --model_path and --scaler_path.')
+    parser.add_argument('--model_version', type=str, default='latest', help='Registered model version used with --registry.')
+    parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
+    parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    parser.add_argument('--output', type=str, help='Also append the results to this CSV file.')
+    args = parser.parse_args()
+
+    scorer = get_scorer(args)
+    live_scorer = LiveScorer(scorer, load_category_codes(args.reference_csv))
+    if args.follow:
+        events = read_file_events(args.follow, follow=not args.no_wait)
+    elif args.listen:
+        host, port = args.listen.rsplit(':', 1)
+        events = read_socket_events(host, int(port))
+    else:
+        events = replay_events(args.replay)
+
+    latencies = []
+
+    def emit(results):
+        for result in results:
+            print(json.dumps(result, default=str), flush=True)
+        if results:
+            latencies.append(results[0]['latency_ms'])
+            if args.output:
+                pd.DataFrame(results).to_csv(args.output, mode='a', index=False, header=not os.path.exists(args.output))
+
+    try:
+        for event in events:
+            emit(live_scorer.process(event))
+    except KeyboardInterrupt:
+        pass
+    emit(live_scorer.close_all())
+
+    if latencies:
+        print(f"Scored {len(latencies)} rounds; latency p50 {np.percentile(latencies, 50):.1f} ms, "
+              f"p95 {np.percentile(latencies, 95):.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
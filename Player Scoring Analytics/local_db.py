@@ -0,0 +1,170 @@
+import collections
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from agents import add_agent_columns, agent_dimension
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Name of the results table inside the embedded database
+TABLE_NAME = 'results'
+
+# Databases of the most recently registered sources, shared by the sessions that load the same file
+MAX_DATABASES = 8
+_databases = collections.OrderedDict()
+_databases_lock = threading.Lock()
+
+
+def engine_name():
+    return 'DuckDB' if duckdb is not None else 'SQLite'
+
+
+def _source_key(source):
+    if isinstance(source, (str, os.PathLike)):
+        return (os.path.abspath(source), os.path.getmtime(source))
+    # Uploaded files are keyed on their contents, since names and sizes can repeat
+    return ('upload', hashlib.sha1(source.getvalue()).hexdigest())
+
+
+class ResultsDatabase:
+    """
+    Results loaded into an embedded database.
+
+    Serves the query functions of `sql_utils` (fetch_query, fetch_data_from_table and
+    fetch_distinct_values) on the loaded results. A database is shared by every
+    Streamlit session that registered the same file, so queries only read.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        # SQLite connections must not be used by several threads at once
+        self._lock = threading.Lock()
+
+    def fetch_query(self, query):
+        """
+        Run a query against the results.
+
+        :param query: SQL query; '{table}' is replaced by the results table name.
+        :return: Pandas DataFrame containing the query results.
+        """
+        query = query.replace('{table}', TABLE_NAME)
+        if duckdb is not None:
+            # A cursor per query, since Streamlit sessions run in separate threads
+            cursor = self._connection.cursor()
+            try:
+                return cursor.execute(query).df()
+            finally:
+                cursor.close()
+        with self._lock:
+            return pd.read_sql(query, self._connection)
+
+    def fetch_data_from_table(self, columns='*', conditions=None):
+        """
+        Fetch data from the results with optional filters.
+
+        :param columns: Columns to select, defaults to '*' (all columns).
+        :param conditions: SQL WHERE clause conditions (optional).
+        :return: Pandas DataFrame containing the query results.
+        """
+        query = f"SELECT {columns} FROM {TABLE_NAME}"
+        if conditions:
+            query += f" WHERE {conditions}"
+        return self.fetch_query(query)
+
+    def fetch_distinct_values(self, columns, conditions=None):
+        """
+        Fetch the distinct values of each column, e.g. to fill filter options.
+
+        :param columns: List of column names.
+        :param conditions: SQL WHERE clause conditions (optional).
+        :return: Dictionary mapping each column to a sorted list of its distinct values.
+        """
+        values = {}
+        for column in columns:
+            query = f'SELECT DISTINCT "{column}" FROM {TABLE_NAME} WHERE "{column}" IS NOT NULL'
+            if conditions:
+                query += f" AND ({conditions})"
+            query += f' ORDER BY "{column}"'
+            values[column] = self.fetch_query(query)[column].tolist()
+        return values
+
+
+def _load_duckdb(source, is_path):
+    connection = duckdb.connect()
+    # DDL statements take no parameters, so the path is passed as a quoted literal
+    path = "'" + str(source).replace("'", "''") + "'" if is_path else None
+    is_parquet = is_path and str(source).endswith('.parquet')
+    if is_parquet:
+        reader = f"read_parquet({path})"
+    elif is_path:
+        reader = f"read_csv_auto({path})"
+    else:
+        connection.register('uploaded', pd.read_csv(io.BytesIO(source.getvalue())))
+        reader = 'uploaded'
+
+    columns = [column[0] for column in connection.execute(f"SELECT * FROM {reader} LIMIT 0").description]
+    if 'agent_name' in columns:
+        # agent_code and role always come from agent_name through the agent dimension
+        connection.register('agent_dimension', agent_dimension())
+        connection.execute("CREATE TABLE agents AS SELECT * FROM agent_dimension")
+        connection.unregister('agent_dimension')
+        kept = ', '.join(f'source."{column}"' for column in columns if column not in ('agent_code', 'role'))
+        select = (f"SELECT {kept}, COALESCE(agents.agent_code, -1) AS agent_code, agents.role "
+                  f"FROM {reader} AS source LEFT JOIN agents ON lower(source.agent_name) = agents.agent_key")
+    else:
+        select = f"SELECT * FROM {reader}"
+    # Parquet files are queried in place; CSV files are loaded into a columnar table
+    connection.execute(f"CREATE {'VIEW' if is_parquet else 'TABLE'} {TABLE_NAME} AS {select}")
+    if not is_path:
+        connection.unregister('uploaded')
+    return connection
+
+
+def _load_sqlite(source, is_path):
+    if not is_path:
+        source = io.BytesIO(source.getvalue())
+    df = pd.read_parquet(source) if is_path and str(source).endswith('.parquet') else pd.read_csv(source)
+    if 'agent_name' in df.columns:
+        df = add_agent_columns(df)
+        df = df.astype({'agent_name': object, 'role': object})
+    # Streamlit reruns the script in different threads
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    df.to_sql(TABLE_NAME, connection, index=False)
+    return connection
+
+
+def register_results(source):
+    """
+    Load results into an embedded database.
+
+    With DuckDB, CSV files are loaded into a columnar table and Parquet files are
+    queried in place through a view. Without DuckDB, the rows are loaded into an
+    in-memory SQLite database. `agent_code` and `role` are derived from `agent_name`.
+    Registering a file that is already loaded returns its database, so the dashboard
+    can call this on every rerun.
+
+    :param source: Path to a CSV or Parquet file, or an uploaded CSV file object.
+    :return: ResultsDatabase.
+    """
+    key = _source_key(source)
+    with _databases_lock:
+        if key in _databases:
+            _databases.move_to_end(key)
+            return _databases[key]
+    is_path = isinstance(source, (str, os.PathLike))
+    connection = _load_duckdb(source, is_path) if duckdb is not None else _load_sqlite(source, is_path)
+    database = ResultsDatabase(connection)
+    with _databases_lock:
+        # Sessions still holding an evicted database keep using it
+        database = _databases.setdefault(key, database)
+        while len(_databases) > MAX_DATABASES:
+            _databases.popitem(last=False)
+    return database
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+import joblib
+
+from feature_store import file_digest
+
+MODEL_FILE = 'model.keras'
+SCALER_FILE = 'scaler.pkl'
+METADATA_FILE = 'metadata.json'
+
+# Deserialized scorers kept warm in this process, keyed by (registry_dir, version)
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+
+class Scorer:
+    """A loaded model version: the model, its scaler, its feature list and metadata."""
+
+    def __init__(self, version, model, scaler, feature_columns, metadata=None):
+        self.version = version
+        self.model = model
+        self.scaler = scaler
+        self.feature_columns = list(feature_columns)
+        self.metadata = metadata or {}
+
+    def check_columns(self, df):
+        missing = [column for column in self.feature_columns if column not in df.columns]
+        if missing:
+            raise ValueError(f"Model version {self.version} needs columns missing from the data: {missing}")
+
+
+def list_versions(registry_dir):
+    """
+    Return the metadata of every registered version, oldest first.
+
+    :param registry_dir: Registry directory.
+    :return: List of metadata dictionaries.
+    """
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = []
+    for name in os.listdir(registry_dir):
+        metadata_path = os.path.join(registry_dir, name, METADATA_FILE)
+        # Versions without metadata are incomplete registrations
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as file:
+                versions.append(json.load(file))
+    return sorted(versions, key=lambda metadata: metadata['created_at'])
+
+
+def resolve_version(registry_dir, version='latest'):
+    """Return the concrete version name for `version`, resolving 'latest' to the newest registration."""
+    versions = list_versions(registry_dir)
+    if not versions:
+        raise FileNotFoundError(f"No model versions registered in {registry_dir}")
+    if version == 'latest':
+        return versions[-1]['version']
+    if version not in {metadata['version'] for metadata in versions}:
+        raise FileNotFoundError(f"Model version {version} is not registered in {registry_dir}")
+    return version
+
+
+def register_model(registry_dir, model_path, scaler_path, feature_columns, version=None, notes=None):
+    """
+    Copy a trained model and its scaler into a new registry version.
+
+    The metadata file is written last, so an interrupted registration is ignored.
+
+    :param registry_dir: Registry directory.
+    :param model_path: Path to the trained `.keras` model.
+    :param scaler_path: Path to the fitted scaler.
+    :param feature_columns: Feature columns, in scaler order.
+    :param version: Version name (optional); defaults to a timestamp.
+    :param notes: Free-text description stored in the metadata (optional).
+    :return: The registered version name.
+    """
+    version = version or datetime.now().strftime('%Y%m%d%H%M%S')
+    version_dir = os.path.join(registry_dir, version)
+    if os.path.exists(os.path.join(version_dir, METADATA_FILE)):
+        raise FileExistsError(f"Model version {version} already exists in {registry_dir}")
+    os.makedirs(version_dir, exist_ok=True)
+
+    shutil.copyfile(model_path, os.path.join(version_dir, MODEL_FILE))
+    # Stored uncompressed so its arrays can be memory-mapped on load
+    joblib.dump(joblib.load(scaler_path), os.path.join(version_dir, SCALER_FILE))
+
+    metadata = {
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'feature_columns': list(feature_columns),
+        'model_sha256': file_digest(model_path),
+        'source_model': os.path.abspath(model_path),
+        'source_scaler': os.path.abspath(scaler_path),
+        'notes': notes,
+    }
+    with open(os.path.join(version_dir, METADATA_FILE), 'w') as file:
+        json.dump(metadata, file, indent=4)
+    return version
+
+
+def load_scorer(registry_dir, version='latest'):
+    """
+    Return a warm scorer for a registered version, loading it on first use.
+
+    :param registry_dir: Registry directory.
+    :param version: Version name or 'latest'.
+    :return: Scorer.
+    """
+    version = resolve_version(registry_dir, version)
+    key = (os.path.abspath(registry_dir), version)
+    with _scorers_lock:
+        if key not in _scorers:
+            # Imported here so listing and registering versions does not load TensorFlow
+            import tensorflow as tf
+            version_dir = os.path.join(registry_dir, version)
+            with open(os.path.join(version_dir, METADATA_FILE), 'r') as file:
+                metadata = json.load(file)
+            model = tf.keras.models.load_model(os.path.join(version_dir, MODEL_FILE))
+            scaler = joblib.load(os.path.join(version_dir, SCALER_FILE), mmap_mode='r')
+            _scorers[key] = Scorer(version, model, scaler, metadata['feature_columns'], metadata)
+        return _scorers[key]
+
+
+def stale_game_ids(results_df, version):
+    """
+    Return the games whose rows were not produced by `version`.
+
+    :param results_df: Scored rows with a 'model_version' column; rows without it count as stale.
+    :param version: Current model version.
+    :return: Array of game ids to rescore.
+    """
+    if 'model_version' not in results_df.columns:
+        return results_df['game_id'].unique()
+    return results_df.loc[results_df['model_version'] != version, 'game_id'].unique()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local registry of versioned EGR models.")
+    parser.add_argument('--registry', type=str, default='./models', help='Registry directory.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = subparsers.add_parser('register', help='Register a trained model and scaler.')
+    register_parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
+    register_parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    register_parser.add_argument('--version', type=str, help='Version name (defaults to a timestamp).')
+    register_parser.add_argument('--notes', type=str, help='Description stored with the version.')
+
+    subparsers.add_parser('list', help='List the registered versions.')
+    args = parser.parse_args()
+
+    if args.command == 'register':
+        scaler = joblib.load(args.scaler_path)
+        version = register_model(args.registry, args.model_path, args.scaler_path,
+                                 scaler.feature_names_in_, version=args.version, notes=args.notes)
+        print(f"Registered model version {version} in {args.registry}")
+    else:
+        for metadata in list_versions(args.registry):
+            print(f"{metadata['version']:20} {metadata['created_at']:20} {metadata.get('notes') or ''}")
+
+
+if __name__ == "__main__":
+    main()
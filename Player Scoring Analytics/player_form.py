@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+
+import pandas as pd
+
+# Form is kept per player and agent
+KEY_COLUMNS = ['player', 'agent_name']
+
+DEFAULT_LAST_GAMES = 5
+DEFAULT_LAST_DAYS = 30
+DEFAULT_EWM_ALPHA = 0.3
+
+GAME_COLUMNS = KEY_COLUMNS + ['game_id', 'game_datetime', 'team', 'role', 'rounds', 'rounds_won', 'egr']
+FORM_COLUMNS = KEY_COLUMNS + ['team', 'role', 'games', 'last_game_datetime', 'egr_mean', 'egr_last_games', 'egr_last_days', 'egr_ewm']
+
+
+def summarize_games(results_df):
+    """
+    Summarize scored rows into one row per player, agent and game.
+
+    EGR is constant within a round, so a game's EGR is the mean over its rounds
+    rather than over its event rows.
+
+    :param results_df: Results as written by `inference.py` (one row per event).
+    :return: DataFrame with the GAME_COLUMNS.
+    """
+    rounds = (results_df.groupby(KEY_COLUMNS + ['game_id', 'round_num'], sort=False, observed=True)
+              .agg(game_datetime=('game_datetime', 'min'), team=('team', 'first'), role=('role', 'first'),
+                   won=('won', 'max'), egr=('EGR', 'first'))
+              .reset_index())
+    rounds['won'] = rounds['won'].astype(float)
+    # Results carry the agent and role as categoricals; the store keeps plain values
+    rounds = rounds.astype({column: object for column in ['agent_name', 'role'] if isinstance(rounds[column].dtype, pd.CategoricalDtype)})
+    games = (rounds.groupby(KEY_COLUMNS + ['game_id'], sort=False, observed=True)
+             .agg(game_datetime=('game_datetime', 'min'), team=('team', 'first'), role=('role', 'first'),
+                  rounds=('round_num', 'size'), rounds_won=('won', 'sum'), egr=('egr', 'mean'))
+             .reset_index())
+    games['game_id'] = games['game_id'].astype(str)
+    games['game_datetime'] = pd.to_datetime(games['game_datetime'])
+    return games[GAME_COLUMNS]
+
+
+def compute_form(games, last_games=DEFAULT_LAST_GAMES, last_days=DEFAULT_LAST_DAYS, ewm_alpha=DEFAULT_EWM_ALPHA):
+    """
+    Form of each player and agent from their game summaries.
+
+    The day window ends at each player's latest game, so form does not change while
+    a player has no new games.
+
+    :param games: Game summaries (see `summarize_games`).
+    :param last_games: Games in the last-games mean.
+    :param last_days: Days in the last-days mean.
+    :param ewm_alpha: Smoothing factor of the exponentially weighted mean, per game.
+    :return: DataFrame with the FORM_COLUMNS.
+    """
+    games = games.sort_values(KEY_COLUMNS + ['game_datetime', 'game_id'], kind='stable')
+    grouped = games.groupby(KEY_COLUMNS, sort=False)
+    form = grouped.agg(team=('team', 'last'), role=('role', 'last'), games=('game_id', 'size'),
+                       last_game_datetime=('game_datetime', 'max'), egr_mean=('egr', 'mean'))
+    form['egr_last_games'] = grouped.tail(last_games).groupby(KEY_COLUMNS, sort=False)['egr'].mean()
+    latest = grouped['game_datetime'].transform('max')
+    recent = games[games['game_datetime'] > latest - pd.Timedelta(days=last_days)]
+    form['egr_last_days'] = recent.groupby(KEY_COLUMNS, sort=False)['egr'].mean()
+    form['egr_ewm'] = grouped['egr'].agg(lambda egr: egr.ewm(alpha=ewm_alpha).mean().iloc[-1])
+    return form.reset_index()[FORM_COLUMNS]
+
+
+class PlayerFormStore:
+    """
+    Per-game EGR summaries and rolling form of every player and agent.
+
+    `games` holds one row per player, agent and game; `form` holds one row per player
+    and agent with the precomputed last-games, last-days and exponentially weighted
+    means. Uploading results only recomputes the form of the players and agents in
+    them. Form lookups go through a dictionary index, and charts read the few rows of
+    one player's games instead of the event table.
+    """
+
+    def __init__(self, games=None, form=None, last_games=DEFAULT_LAST_GAMES, last_days=DEFAULT_LAST_DAYS,
+                 ewm_alpha=DEFAULT_EWM_ALPHA):
+        self.games = games if games is not None else pd.DataFrame(columns=GAME_COLUMNS)
+        self.form = form if form is not None else pd.DataFrame(columns=FORM_COLUMNS)
+        self.last_games = last_games
+        self.last_days = last_days
+        self.ewm_alpha = ewm_alpha
+        self._index_form()
+
+    def _index_form(self):
+        self.form = self.form.reset_index(drop=True)
+        self._form_rows = {key: i for i, key in enumerate(zip(self.form['player'], self.form['agent_name']))}
+
+    @classmethod
+    def load(cls, store_dir, **kwargs):
+        """
+        Load a store; a missing store loads empty with the given window settings.
+
+        :param store_dir: Store directory.
+        :param kwargs: last_games, last_days and ewm_alpha of a new store.
+        :return: PlayerFormStore.
+        """
+        metadata_path = os.path.join(store_dir, 'metadata.json')
+        if not os.path.exists(metadata_path):
+            return cls(**kwargs)
+        with open(metadata_path, 'r') as file:
+            metadata = json.load(file)
+        games = pd.read_csv(os.path.join(store_dir, 'games.csv'), dtype={'game_id': str}, parse_dates=['game_datetime'])
+        form = pd.read_csv(os.path.join(store_dir, 'form.csv'), parse_dates=['last_game_datetime'])
+        return cls(games, form, metadata['last_games'], metadata['last_days'], metadata['ewm_alpha'])
+
+    def save(self, store_dir):
+        """Write the store; files are replaced atomically and the metadata file is written last."""
+        os.makedirs(store_dir, exist_ok=True)
+        metadata = {'last_games': self.last_games, 'last_days': self.last_days, 'ewm_alpha': self.ewm_alpha,
+                    'games': len(self.games), 'players': len(self.form)}
+        files = {'games.csv': lambda path: self.games.to_csv(path, index=False),
+                 'form.csv': lambda path: self.form.to_csv(path, index=False)}
+        for name, write in files.items():
+            temporary_path = os.path.join(store_dir, f'.{name}.tmp')
+            write(temporary_path)
+            os.replace(temporary_path, os.path.join(store_dir, name))
+        temporary_path = os.path.join(store_dir, '.metadata.json.tmp')
+        with open(temporary_path, 'w') as file:
+            json.dump(metadata, file, indent=4)
+        os.replace(temporary_path, os.path.join(store_dir, 'metadata.json'))
+
+    def update(self, results_df):
+        """
+        Add newly scored results.
+
+        Games already in the store (e.g. rescored by a new model version) are replaced.
+        Only the players and agents of the added or replaced games are recomputed.
+
+        :param results_df: Results as written by `inference.py`.
+        :return: Number of game summaries added.
+        """
+        new_games = summarize_games(results_df)
+        replaced = self.games['game_id'].isin(set(new_games['game_id']))
+        affected = pd.concat([self.games.loc[replaced, KEY_COLUMNS], new_games[KEY_COLUMNS]]).drop_duplicates()
+        games = pd.concat([self.games[~replaced], new_games], ignore_index=True) if len(self.games) else new_games
+        self.games = games.reset_index(drop=True)
+
+        affected_keys = pd.MultiIndex.from_frame(affected)
+        in_affected = pd.MultiIndex.from_frame(self.games[KEY_COLUMNS]).isin(affected_keys)
+        form = compute_form(self.games[in_affected], self.last_games, self.last_days, self.ewm_alpha)
+        keep = ~pd.MultiIndex.from_frame(self.form[KEY_COLUMNS]).isin(affected_keys) if len(self.form) else []
+        self.form = pd.concat([self.form[keep], form], ignore_index=True) if len(self.form) else form
+        self._index_form()
+        return len(new_games)
+
+    def player_form(self, player, agent_name):
+        """Form of one player on one agent as a dictionary, or None."""
+        row = self._form_rows.get((player, agent_name))
+        return None if row is None else self.form.iloc[row].to_dict()
+
+    def history(self, player, agent_name=None):
+        """
+        A player's game summaries in time order, with the running form columns for charts.
+
+        :param player: Player.
+        :param agent_name: Only games on this agent (optional).
+        :return: DataFrame of game summaries with egr_last_games and egr_ewm up to each game.
+        """
+        mask = self.games['player'] == player
+        if agent_name is not None:
+            mask &= self.games['agent_name'] == agent_name
+        history = self.games[mask].sort_values(['game_datetime', 'game_id'], kind='stable').reset_index(drop=True)
+        history['egr_last_games'] = history['egr'].rolling(self.last_games, min_periods=1).mean()
+        history['egr_ewm'] = history['egr'].ewm(alpha=self.ewm_alpha).mean()
+        return history
+
+    def leaderboard(self, by='egr_ewm', n=20, min_games=1, teams=None):
+        """
+        Best players and agents by a form column.
+
+        :param by: Form column to rank by.
+        :param n: Rows returned.
+        :param min_games: Minimum games on the agent.
+        :param teams: Only these teams (optional).
+        :return: DataFrame with the FORM_COLUMNS.
+        """
+        form = self.form[self.form['games'] >= min_games]
+        if teams:
+            form = form[form['team'].isin(teams)]
+        return form.nlargest(n, by).reset_index(drop=True)
+
+
+def update_store(store_dir, results_df):
+    """
+    Add results to the store in `store_dir`, creating it when missing.
+
+    :param store_dir: Store directory.
+    :param results_df: Results as written by `inference.py`.
+    :return: The saved PlayerFormStore.
+    """
+    store = PlayerFormStore.load(store_dir)
+    added = store.update(results_df)
+    store.save(store_dir)
+    print(f"Updated player form in {store_dir} with {added} player-games ({len(store.games)} games, {len(store.form)} player-agents).")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling player form built from scored results.")
+    parser.add_argument('--store', type=str, default='./player_form', help='Player form store directory.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help='Add results files to the store.')
+    update_parser.add_argument('results_csv', nargs='+', help='Results files written by inference.py.')
+    update_parser.add_argument('--last_games', type=int, default=DEFAULT_LAST_GAMES, help='Games in the last-games mean of a new store.')
+    update_parser.add_argument('--last_days', type=int, default=DEFAULT_LAST_DAYS, help='Days in the last-days mean of a new store.')
+    update_parser.add_argument('--ewm_alpha', type=float, default=DEFAULT_EWM_ALPHA, help='Per-game smoothing factor of a new store.')
+    show_parser = subparsers.add_parser('show', help="Print a player's form and game history.")
+    show_parser.add_argument('player', type=str)
+    show_parser.add_argument('--agent', type=str, help='Only this agent.')
+    top_parser = subparsers.add_parser('leaderboard', help='Print the players in best form.')
+    top_parser.add_argument('--by', type=str, default='egr_ewm', choices=['egr_ewm', 'egr_last_games', 'egr_last_days', 'egr_mean'])
+    top_parser.add_argument('--n', type=int, default=20)
+    top_parser.add_argument('--min_games', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        store = PlayerFormStore.load(args.store, last_games=args.last_games, last_days=args.last_days, ewm_alpha=args.ewm_alpha)
+        for results_csv in args.results_csv:
+            added = store.update(pd.read_csv(results_csv, usecols=KEY_COLUMNS + ['game_id', 'round_num', 'game_datetime', 'team', 'role', 'won', 'EGR']))
+            print(f"Added {added} player-games from {results_csv}.")
+        store.save(args.store)
+    elif args.command == 'show':
+        store = PlayerFormStore.load(args.store)
+        history = store.history(args.player, args.agent)
+        if history.empty:
+            print(f"No games of {args.player} in the store.")
+            return
+        for agent_name in history['agent_name'].unique():
+            print(json.dumps(store.player_form(args.player, agent_name), default=str))
+        print(history.to_string(index=False))
+    else:
+        print(PlayerFormStore.load(args.store).leaderboard(args.by, args.n, args.min_games).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import queue
+import threading
+import time
+
+import pandas as pd
+import psycopg2
+from sqlalchemy import inspect, text
+
+from inference import CATEGORICAL_COLUMNS, get_scorer, merge_results, prepare_data, prepare_sequences, score_sequences
+from instrumentation import Tracer, set_tracer, span
+from live_scoring import load_category_codes
+from player_form import PlayerFormStore
+from sql_utils import copy_results, get_engine, load_config, prepare_results_upload
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def load_table_category_codes(engine, source_table):
+    """
+    Return the category codes `prepare_data` assigns on the whole source table.
+
+    Partitions only hold a few games, so their categories are coded with the codes of
+    every value in the table, as when the table is exported and scored as one file.
+
+    :param engine: SQLAlchemy engine.
+    :param source_table: Schema-qualified table of prepared snapshots.
+    :return: Dictionary of column -> {value: code}.
+    """
+    codes = {}
+    with engine.connect() as connection:
+        for column in CATEGORICAL_COLUMNS:
+            values = connection.execute(text(f'SELECT DISTINCT "{column}" FROM {source_table} WHERE "{column}" IS NOT NULL')).scalars()
+            codes[column] = {value: code for code, value in enumerate(sorted(values))}
+    return codes
+
+
+def load_target_range(engine, source_table):
+    """(min, max) combat score of the source table, used to normalize the target of every partition."""
+    with engine.connect() as connection:
+        return tuple(connection.execute(text(f"SELECT MIN(combat_score_round), MAX(combat_score_round) FROM {source_table}")).one())
+
+
+def scored_game_ids(engine, table_name, version):
+    """Games already in the results table with rows of model `version`."""
+    schema_name, bare_table_name = table_name.split('.')
+    inspector = inspect(engine)
+    if bare_table_name not in inspector.get_table_names(schema=schema_name):
+        return []
+    if 'model_version' not in {column['name'] for column in inspector.get_columns(bare_table_name, schema=schema_name)}:
+        return []
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT DISTINCT game_id FROM {table_name} WHERE model_version = :version"),
+                                  {'version': version}).scalars().all()
+
+
+def read_partitions(db_params, source_table, games_per_partition=8, fetch_rows=20000, skip_game_ids=()):
+    """
+    Yield the rows of the source table a few games at a time.
+
+    Rows are streamed in game order through a server-side cursor, so only the current
+    partition is held in memory.
+
+    :param db_params: Dictionary with connection parameters (host, port, user, password, dbname).
+    :param source_table: Schema-qualified table of prepared snapshots.
+    :param games_per_partition: Games per yielded DataFrame.
+    :param fetch_rows: Rows per round trip to the server.
+    :param skip_game_ids: Games not to read.
+    :return: Generator of Pandas DataFrames.
+    """
+    connection = psycopg2.connect(**db_params)
+    try:
+        # A named cursor keeps the result set on the server
+        cursor = connection.cursor(name='score_db_source')
+        cursor.itersize = fetch_rows
+        cursor.execute(f"SELECT * FROM {source_table} WHERE NOT (game_id = ANY(%s)) ORDER BY game_id", (list(skip_game_ids),))
+        rows, games, last_game, columns = [], 0, None, None
+        while True:
+            chunk = cursor.fetchmany(fetch_rows)
+            if columns is None:
+                columns = [column[0] for column in cursor.description]
+                game_index = columns.index('game_id')
+            if not chunk:
+                break
+            for row in chunk:
+                if row[game_index] != last_game:
+                    if games == games_per_partition:
+                        yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                        rows, games = [], 0
+                    games += 1
+                    last_game = row[game_index]
+                rows.append(row)
+        if rows:
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    finally:
+        connection.close()
+
+
+def score_partition(scorer, raw, category_codes, target_range):
+    """
+    Score the games of one partition.
+
+    :param scorer: Scorer.
+    :param raw: Prepared snapshot rows as read from the source table.
+    :param category_codes: Output of `load_table_category_codes` or `load_category_codes`.
+    :param target_range: (min, max) combat score used to normalize the target.
+    :return: Snapshot rows with EGR, Target, model_version, agent code and role, as written by `inference.py`.
+    """
+    scorer.check_columns(raw)
+    df = prepare_data(raw, category_codes)
+    # Columns that are NULL throughout the partition come back as objects
+    object_columns = [column for column in scorer.feature_columns if df[column].dtype == object]
+    for column in object_columns:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    sequences = prepare_sequences(df, scorer.feature_columns, scorer.scaler, target_range, verbose=False)
+    results_df = score_sequences(scorer.model, sequences, verbose=False)
+    results_df['model_version'] = scorer.version
+    return merge_results(raw, results_df)
+
+
+def write_partition(engine, table_name, results):
+    """Replace the rows of the partition's games in the results table, in one transaction."""
+    with engine.begin() as connection:
+        results = prepare_results_upload(connection, results, table_name)
+        # Rescored games replace their rows from other model versions
+        connection.execute(text(f"DELETE FROM {table_name} WHERE game_id = ANY(:game_ids)"),
+                           {'game_ids': [str(game_id) for game_id in results['game_id'].unique()]})
+        copy_results(connection, results, table_name)
+
+
+def _put(stage_queue, item, stop):
+    # Give up when another stage has failed, instead of blocking on a full queue
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def run_pipeline(partitions, score, write, prefetch=2):
+    """
+    Run read, compute and write as three stages connected by bounded queues.
+
+    A reader thread pulls partitions while the calling thread scores the previous one
+    and a writer thread stores the one before, so a run takes about as long as its
+    slowest stage rather than the sum of the three.
+
+    :param partitions: Iterable of input partitions; consumed by the reader thread.
+    :param score: Function turning an input partition into results.
+    :param write: Function storing results.
+    :param prefetch: Partitions buffered between two stages.
+    :return: Dictionary of busy seconds per stage, with the partition count and wall time.
+    """
+    read_queue = queue.Queue(maxsize=prefetch)
+    write_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    stats = {'read_s': 0.0, 'compute_s': 0.0, 'write_s': 0.0, 'partitions': 0}
+    errors = []
+
+    def reader():
+        try:
+            iterator = iter(partitions)
+            while True:
+                started = time.perf_counter()
+                with span('read'):
+                    partition = next(iterator, _DONE)
+                stats['read_s'] += time.perf_counter() - started
+                if not _put(read_queue, partition, stop) or partition is _DONE:
+                    return
+        except Exception as error:
+            errors.append(error)
+            _put(read_queue, _DONE, stop)
+
+    def writer():
+        try:
+            while True:
+                results = write_queue.get()
+                if results is _DONE:
+                    return
+                started = time.perf_counter()
+                with span('write', rows=len(results)):
+                    write(results)
+                stats['write_s'] += time.perf_counter() - started
+                stats['partitions'] += 1
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=reader, name='score-db-reader', daemon=True),
+               threading.Thread(target=writer, name='score-db-writer', daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while not errors:
+            # Polled, since a reader stopped by a failed writer does not queue _DONE
+            try:
+                partition = read_queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            if partition is _DONE:
+                break
+            compute_started = time.perf_counter()
+            with span('compute', rows=len(partition)):
+                results = score(partition)
+            stats['compute_s'] += time.perf_counter() - compute_started
+            if not _put(write_queue, results, stop):
+                break
+    finally:
+        # The writer finishes the queued results; it has already stopped if writing failed
+        _put(write_queue, _DONE, stop)
+        threads[1].join()
+        stop.set()
+        threads[0].join()
+    if errors:
+        raise errors[0]
+    stats['wall_s'] = time.perf_counter() - started
+    return stats
+
+
+def check_pipeline(timeout=30):
+    """
+    Check that `run_pipeline` keeps partition order and raises the error of a failing stage.
+
+    Each failure is checked with a slow reader, so the other stages are waiting on
+    it when the error happens; a run that does not finish within `timeout` seconds fails.
+    """
+    def slow(values, delay=0.05):
+        # Partitions are lists, as the stages time them by length
+        for value in values:
+            time.sleep(delay)
+            yield [value]
+
+    def fail(message):
+        raise RuntimeError(message)
+
+    def run(partitions, score, write):
+        outcome = {}
+
+        def target():
+            try:
+                outcome['stats'] = run_pipeline(partitions, score, write, prefetch=1)
+            except Exception as error:
+                outcome['error'] = error
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            raise AssertionError(f"run_pipeline did not finish within {timeout} s.")
+        return outcome
+
+    written = []
+    outcome = run(slow(range(10)), lambda partition: [partition[0] * 2], written.append)
+    assert written == [[value * 2] for value in range(10)] and outcome['stats']['partitions'] == 10, outcome
+
+    failures = {
+        'read': (slow(fail('read') if value == 3 else value for value in range(10)), lambda partition: partition, lambda results: None),
+        'compute': (slow(range(10)), lambda partition: fail('compute') if partition == [3] else partition, lambda results: None),
+        'write': (slow(range(10)), lambda partition: partition, lambda results: fail('write') if results == [3] else None),
+    }
+    for stage, (partitions, score, write) in failures.items():
+        error = run(partitions, score, write).get('error')
+        assert isinstance(error, RuntimeError) and str(error) == stage, f"A failing {stage} stage raised {error!r}."
+    print("Pipeline checks passed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the games of a PostgreSQL table and write EGR back with COPY.")
+    parser.add_argument('--source_table', type=str, help='Schema-qualified table of prepared snapshots; defaults to "source_table" in the config.')
+    parser.add_argument('--config', type=str, default='config.json', help='Configuration file with db_params and the results table_name.')
+    parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
+    parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    parser.add_argument('--registry', type=str, help='Model registry directory; overrides --model_path and --scaler_path.')
+    parser.add_argument('--model_version', type=str, default='latest', help='Registered model version used with --registry.')
+    parser.add_argument('--reference_csv', type=str, help='Training CSV whose category codes the model expects; defaults to the codes of the source table.')
+    parser.add_argument('--games_per_partition', type=int, default=8, help='Games read, scored and written together.')
+    parser.add_argument('--fetch_rows', type=int, default=20000, help='Rows per fetch from the server-side cursor.')
+    parser.add_argument('--prefetch', type=int, default=2, help='Partitions buffered between two stages.')
+    parser.add_argument('--rescore', action='store_true', help='Also score games that already have rows of this model version.')
+    parser.add_argument('--player_form', type=str, help='Player form store directory; each written partition is added to it and the store is saved at the end of the run.')
+    parser.add_argument('--trace', type=str, help='Write a JSON trace of the stage timings to this file.')
+    parser.add_argument('--check', action='store_true', help='Only check the read/compute/write pipeline on in-memory stages.')
+    args = parser.parse_args()
+
+    if args.check:
+        check_pipeline()
+        return
+
+    config = load_config(args.config)
+    source_table = args.source_table or config.get('source_table')
+    if not source_table:
+        parser.error("--source_table is required when the config has no 'source_table'.")
+    table_name = config['table_name']
+    engine = get_engine(config['db_params'])
+
+    tracer = set_tracer(Tracer('score_db'))
+    print("Loading model...")
+    scorer = get_scorer(args)
+    print(f"Using model version {scorer.version}")
+
+    category_codes = load_category_codes(args.reference_csv) if args.reference_csv else load_table_category_codes(engine, source_table)
+    target_range = load_target_range(engine, source_table)
+    skip_game_ids = [] if args.rescore else scored_game_ids(engine, table_name, scorer.version)
+    if skip_game_ids:
+        print(f"Skipping {len(skip_game_ids)} games already scored by model version {scorer.version}.")
+
+    form_store = PlayerFormStore.load(args.player_form) if args.player_form else None
+
+    def write(results):
+        write_partition(engine, table_name, results)
+        if form_store is not None:
+            form_store.update(results)
+
+    partitions = read_partitions(config['db_params'], source_table, args.games_per_partition, args.fetch_rows, skip_game_ids)
+    try:
+        stats = run_pipeline(partitions,
+                             lambda raw: score_partition(scorer, raw, category_codes, target_range),
+                             write,
+                             prefetch=args.prefetch)
+    finally:
+        # Saved once, with every partition written before a failure
+        if form_store is not None:
+            form_store.save(args.player_form)
+
+    print(f"Scored {stats['partitions']} partitions from {source_table} into {table_name} in {stats['wall_s']:.1f} s "
+          f"(busy: read {stats['read_s']:.1f} s, compute {stats['compute_s']:.1f} s, write {stats['write_s']:.1f} s).")
+    if args.trace:
+        tracer.write(args.trace)
+        print(f"Trace saved to {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import collections
+import io
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from inference import get_scorer, infer, prepare_data
+from live_scoring import load_category_codes
+
+RESULT_COLUMNS = ['game_id', 'player', 'round_num', 'EGR', 'model_version']
+
+
+class ScoreRequest:
+    """Prepared snapshots of one request, waiting for their per-round results."""
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.game_ids = set(snapshots['game_id'].unique())
+        self.submitted_at = time.monotonic()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class ServiceMetrics:
+    """Counters for the /metrics endpoint."""
+
+    def __init__(self, window=1000):
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.rows_scored = 0
+        self.rounds_scored = 0
+        self.scoring_seconds = 0.0
+        # Latencies and batch sizes of the most recent requests and batches
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record_rejected(self):
+        with self.lock:
+            self.requests += 1
+            self.errors += 1
+
+    def record_batch(self, batch, rows, rounds, seconds, failed):
+        now = time.monotonic()
+        with self.lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.errors += len(batch) if failed else 0
+            self.rows_scored += rows
+            self.rounds_scored += rounds
+            self.scoring_seconds += seconds
+            self.batch_sizes.append(len(batch))
+            self.latencies.extend(now - request.submitted_at for request in batch)
+
+    def snapshot(self, queue_depth):
+        with self.lock:
+            uptime = time.monotonic() - self.started_at
+            latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+            return {
+                'queue_depth': queue_depth,
+                'uptime_s': round(uptime, 3),
+                'requests': self.requests,
+                'errors': self.errors,
+                'batches': self.batches,
+                'rows_scored': self.rows_scored,
+                'rounds_scored': self.rounds_scored,
+                'mean_batch_requests': round(float(np.mean(self.batch_sizes)), 3) if self.batch_sizes else 0,
+                'rows_per_second': round(self.rows_scored / uptime, 3) if uptime else 0,
+                'rows_per_scoring_second': round(self.rows_scored / self.scoring_seconds, 3) if self.scoring_seconds else 0,
+                'latency_p50_s': round(float(np.percentile(latencies, 50)), 4),
+                'latency_p95_s': round(float(np.percentile(latencies, 95)), 4),
+            }
+
+
+class MicroBatcher:
+    """
+    Collects concurrent score requests into micro-batches scored by one worker thread.
+
+    A batch is closed when it reaches `max_batch_rows` snapshot rows or when its first
+    request has waited `max_latency_ms`. Requests for a game already in the batch wait
+    for the next batch, so games from different requests are never mixed. Requests are
+    prepared and checked on their own before they are queued, so only the model call
+    is shared and an invalid request cannot fail or change the others in its batch.
+    """
+
+    def __init__(self, scorer, category_codes, max_batch_rows=200000, max_latency_ms=50, batch_size=256):
+        self.scorer = scorer
+        self.category_codes = category_codes
+        self.max_batch_rows = max_batch_rows
+        self.max_latency = max_latency_ms / 1000
+        self.batch_size = batch_size
+        self.metrics = ServiceMetrics()
+        self._queue = queue.Queue()
+        self._deferred = collections.deque()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + len(self._deferred)
+
+    def prepare(self, snapshots):
+        """
+        Sort and encode the snapshots of one request and check them against the model.
+
+        :param snapshots: Raw snapshot rows of one or more complete player-games.
+        :return: Prepared snapshots for `submit`.
+        :raises ValueError: When the snapshots lack columns or have non-numeric features.
+        """
+        try:
+            prepared = prepare_data(snapshots, self.category_codes)
+        except KeyError as e:
+            raise ValueError(f"Snapshots are missing column {e}") from e
+        self.scorer.check_columns(prepared)
+        # Converted here so a non-numeric feature fails this request rather than its batch
+        prepared[self.scorer.feature_columns] = prepared[self.scorer.feature_columns].astype(np.float32)
+        return prepared
+
+    def submit(self, snapshots, timeout=None):
+        """
+        Score prepared snapshots and wait for their results.
+
+        :param snapshots: Output of `prepare`.
+        :param timeout: Seconds to wait for the results (optional).
+        :return: DataFrame with RESULT_COLUMNS.
+        """
+        request = ScoreRequest(snapshots)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Scoring request timed out.")
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _next_request(self, timeout=None):
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect_batch(self):
+        first = self._next_request()
+        batch, game_ids, rows = [first], set(first.game_ids), len(first.snapshots)
+        deadline = first.submitted_at + self.max_latency
+        skipped = []
+        while rows < self.max_batch_rows:
+            # After the deadline, requests that are already queued still join the batch
+            try:
+                request = self._next_request(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request.game_ids & game_ids:
+                skipped.append(request)
+                continue
+            batch.append(request)
+            game_ids |= request.game_ids
+            rows += len(request.snapshots)
+        self._deferred.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            rows = sum(len(request.snapshots) for request in batch)
+            results, error = None, None
+            try:
+                prepared = pd.concat([request.snapshots for request in batch], ignore_index=True)
+                results = infer(self.scorer.model, prepared, self.scorer.feature_columns, self.scorer.scaler,
+                                batch_size=self.batch_size, verbose=False)
+                results['model_version'] = self.scorer.version
+            except Exception as e:
+                error = e
+            self.metrics.record_batch(batch, rows, 0 if results is None else len(results),
+                                      time.perf_counter() - started, error is not None)
+            for request in batch:
+                if error is None:
+                    request.results = results.loc[results['game_id'].isin(request.game_ids), RESULT_COLUMNS].reset_index(drop=True)
+                request.error = error
+                request.done.set()
+
+
+def parse_snapshots(body, content_type):
+    """
+    Parse a request body into a snapshot frame.
+
+    :param body: Raw request body.
+    :param content_type: 'text/csv', or JSON of the form {"snapshots": [row, ...]}.
+    :return: Pandas DataFrame.
+    """
+    if content_type.startswith('text/csv'):
+        return pd.read_csv(io.BytesIO(body))
+    payload = json.loads(body)
+    return pd.DataFrame(payload['snapshots'] if isinstance(payload, dict) else payload)
+
+
+def make_handler(batcher, request_timeout):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'model_version': batcher.scorer.version})
+            elif self.path == '/metrics':
+                self._send_json(200, batcher.metrics.snapshot(batcher.queue_depth))
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                snapshots = parse_snapshots(body, self.headers.get('Content-Type', 'application/json'))
+            except (ValueError, KeyError, pd.errors.ParserError) as e:
+                self._send_json(400, {'error': f"Invalid snapshot payload: {e}"})
+                return
+            if snapshots.empty:
+                self._send_json(400, {'error': "No snapshots in the request."})
+                return
+            try:
+                prepared = batcher.prepare(snapshots)
+            except ValueError as e:
+                batcher.metrics.record_rejected()
+                self._send_json(400, {'error': f"Invalid snapshots: {e}"})
+                return
+            try:
+                results = batcher.submit(prepared, timeout=request_timeout)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'model_version': batcher.scorer.version, 'results': results.to_dict(orient='records')})
+
+        def log_message(self, format, *args):
+            # Request lines would flood the console at scoring rates; /metrics covers them
+            pass
+
+    return ScoringHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running EGR scoring service with micro-batching.")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8502, help='Port to listen on.')
+    parser.add_argument('--registry', type=str, help='Model registry directory; overrides --model_path and --scaler_path.')
+    parser.add_argument('--model_version', type=str, default='latest', help='Registered model version used with --registry.')
+    parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to the trained model.')
+    parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to the scaler file.')
+    parser.add_argument('--reference_csv', type=str, default='./eg_train.csv', help='Training CSV whose category codes the model expects.')
+    parser.add_argument('--max_batch_rows', type=int, default=200000, help='Snapshot rows after which a micro-batch is closed.')
+    parser.add_argument('--max_latency_ms', type=float, default=50, help='Longest time a request waits for other requests to join its batch.')
+    parser.add_argument('--batch_size', type=int, default=256, help='Rounds per model call.')
+    parser.add_argument('--request_timeout', type=float, default=300, help='Seconds a request waits for its results.')
+    args = parser.parse_args()
+
+    print("Loading model...")
+    scorer = get_scorer(args)
+    batcher = MicroBatcher(scorer, load_category_codes(args.reference_csv), args.max_batch_rows, args.max_latency_ms, args.batch_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, args.request_timeout))
+    print(f"Scoring service for model version {scorer.version} listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+
+# Padding value recognised by the model's Masking layer
+MASK_VALUE = -999.0
+
+
+def lengths_to_offsets(lengths):
+    """Turn per-item lengths into an offset table with a leading 0 (item i spans offsets[i]:offsets[i + 1])."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+class SequenceStore:
+    """
+    Rounds of event features stored as one flat float32 array plus offset tables.
+
+    `values` is [events, features], usually memory-mapped from the feature store.
+    Round i is the zero-copy view values[round_offsets[i]:round_offsets[i + 1]], and
+    player-game j owns rounds player_game_offsets[j]:player_game_offsets[j + 1].
+    Rounds are only padded, once, when a batch is assembled.
+    """
+
+    def __init__(self, values, round_lengths, player_game_lengths=None):
+        self.values = values
+        self.round_lengths = np.asarray(round_lengths, dtype=np.int64)
+        self.round_offsets = lengths_to_offsets(self.round_lengths)
+        if player_game_lengths is None:
+            player_game_lengths = [len(self.round_lengths)]
+        self.player_game_offsets = lengths_to_offsets(player_game_lengths)
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Build a store from a feature-store entry (see `feature_store.load_features`)."""
+        return cls(entry['values'], entry['round_lengths'], entry.get('player_game_lengths'))
+
+    def __len__(self):
+        return len(self.round_lengths)
+
+    def __getitem__(self, i):
+        return self.values[self.round_offsets[i]:self.round_offsets[i + 1]]
+
+    @property
+    def num_player_games(self):
+        return len(self.player_game_offsets) - 1
+
+    def player_game_rounds(self, j):
+        """Round indices of player-game j."""
+        return np.arange(self.player_game_offsets[j], self.player_game_offsets[j + 1])
+
+    def assemble_batch(self, round_indices, mask_value=MASK_VALUE):
+        """
+        Copy rounds into one padded [rounds, max events, features] float32 array.
+
+        :param round_indices: Rounds of the batch.
+        :param mask_value: Value of the padded timesteps.
+        :return: Padded batch.
+        """
+        round_indices = np.asarray(round_indices)
+        lengths = self.round_lengths[round_indices]
+        batch = np.full((len(round_indices), lengths.max(initial=0), self.values.shape[1]), mask_value, dtype=np.float32)
+        for row, (i, length) in enumerate(zip(round_indices, lengths)):
+            batch[row, :length] = self.values[self.round_offsets[i]:self.round_offsets[i] + length]
+        return batch
+
+    def length_sorted_batches(self, batch_size):
+        """Yield (round indices, padded batch) with rounds of similar length batched together."""
+        order = np.argsort(self.round_lengths, kind='stable')
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            yield indices, self.assemble_batch(indices)
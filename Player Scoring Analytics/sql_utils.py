@@ -1,6 +1,7 @@
+import io
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, inspect, text
 import json
 import sys
 import os
@@ -17,28 +18,227 @@ def load_config(config_file='config.json'):
         print(f"Error: Could not parse the configuration file '{config_file}'.")
         sys.exit(1)
 
-def upload_csv_to_postgres(db_params, file_path, table_name):
+# Engines are cached per connection URL so repeated queries reuse the connection pool
+_engines = {}
+
+def get_engine(db_params):
+    url = f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
+    if url not in _engines:
+        _engines[url] = create_engine(url)
+    return _engines[url]
+
+# Declared layout of the results table. Column order follows the inference output.
+RESULTS_COLUMNS = [
+    ('round_num', 'integer'), ('game_id', 'text'), ('player', 'text'), ('inventory_value', 'integer'),
+    ('event_num', 'integer'), ('game_version', 'text'), ('game_datetime', 'timestamp'),
+    ('round_start_time', 'timestamp'), ('event_time', 'timestamp'), ('seconds', 'double precision'),
+    ('kills', 'double precision'), ('assists', 'integer'), ('deaths', 'double precision'), ('money', 'integer'),
+    ('inventory', 'text'), ('combat_score_round', 'integer'), ('combat_score_total', 'integer'),
+    ('ability1_base_charges', 'integer'), ('ability1_max_charges', 'integer'), ('ability1_temp_charges', 'integer'),
+    ('ability2_base_charges', 'integer'), ('ability2_max_charges', 'integer'), ('ability2_temp_charges', 'integer'),
+    ('grenade_base_charges', 'integer'), ('grenade_max_charges', 'integer'), ('grenade_temp_charges', 'integer'),
+    ('ultimate_base_charges', 'integer'), ('ultimate_max_charges', 'integer'), ('ultimate_temp_charges', 'integer'),
+    ('hp', 'integer'), ('armor', 'integer'), ('x', 'double precision'), ('y', 'double precision'),
+    ('z', 'double precision'), ('velocity_x', 'double precision'), ('velocity_y', 'double precision'),
+    ('velocity_z', 'double precision'), ('view_x', 'double precision'), ('view_y', 'double precision'),
+    ('view_z', 'double precision'), ('spike_planted', 'boolean'), ('clock_time', 'double precision'),
+    ('account_id', 'bigint'), ('agent_id', 'integer'), ('team', 'text'), ('agent_name', 'text'), ('side', 'text'),
+    ('attacking_team', 'text'), ('teamId_value', 'integer'), ('kill_change', 'double precision'),
+    ('death_change', 'double precision'), ('is_alive', 'integer'), ('our_team_alive', 'integer'),
+    ('our_team_health', 'integer'), ('team_inventory_value', 'integer'), ('spike_event', 'text'),
+    ('opponent_team', 'text'), ('opponent_team_alive', 'integer'), ('opponent_team_health', 'integer'),
+    ('opponent_team_inventory_value', 'integer'),
+    ('ability1_base_charges_change', 'integer'), ('ability1_base_charges_gained', 'integer'), ('ability1_base_charges_used', 'integer'),
+    ('ability2_base_charges_change', 'integer'), ('ability2_base_charges_gained', 'integer'), ('ability2_base_charges_used', 'integer'),
+    ('grenade_base_charges_change', 'integer'), ('grenade_base_charges_gained', 'integer'), ('grenade_base_charges_used', 'integer'),
+    ('ultimate_base_charges_change', 'integer'), ('ultimate_base_charges_gained', 'integer'), ('ultimate_base_charges_used', 'integer'),
+    ('damage_dealt', 'integer'), ('damage_taken', 'integer'), ('kill_c', 'integer'), ('death_c', 'integer'),
+    ('damage_dealt_c', 'integer'), ('damage_taken_c', 'integer'), ('player_kill_c', 'integer'),
+    ('player_death_c', 'integer'), ('player_damage_dealt_c', 'integer'), ('player_damage_taken_c', 'integer'),
+    ('opponent_kill_c', 'integer'), ('opponent_death_c', 'integer'), ('opponent_damage_dealt_c', 'integer'),
+    ('opponent_damage_taken_c', 'integer'), ('spike_diffused', 'double precision'), ('team_id', 'integer'),
+    ('won', 'boolean'), ('map_name', 'text'), ('EGR', 'double precision'), ('Target', 'double precision'),
+    ('model_version', 'text'), ('agent_code', 'smallint'), ('role', 'text'),
+]
+
+# (name suffix, method, columns) of the indexes behind the apps' filters
+RESULTS_INDEXES = [
+    ('game_player_round_idx', 'btree', ['game_id', 'player', 'round_num']),
+    ('team_game_idx', 'btree', ['team', 'game_id']),
+    ('game_datetime_brin', 'brin', ['game_datetime']),
+]
+
+def is_partitioned(connection, table_name):
+    schema_name, bare_table_name = table_name.split('.')
+    relkind = connection.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = :schema AND c.relname = :table"), {'schema': schema_name, 'table': bare_table_name}).scalar()
+    return relkind == 'p'
+
+def create_results_table(connection, table_name, indexes=True):
+    """
+    Create the results table with typed columns, range-partitioned by month of game_datetime.
+    
+    Rows without a game_datetime land in a default partition.
+    
+    :param connection: Open SQLAlchemy connection (inside a transaction).
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param indexes: Whether to create the indexes now; a bulk load creates them afterwards.
+    """
+    schema_name, bare_table_name = table_name.split('.')
+    columns = ",\n    ".join(f'"{column}" {column_type}' for column, column_type in RESULTS_COLUMNS)
+    connection.execute(text(f'CREATE TABLE {schema_name}."{bare_table_name}" (\n    {columns}\n) PARTITION BY RANGE (game_datetime)'))
+    connection.execute(text(f'CREATE TABLE {schema_name}."{bare_table_name}_default" PARTITION OF {schema_name}."{bare_table_name}" DEFAULT'))
+    if indexes:
+        create_results_indexes(connection, table_name)
+
+def create_results_indexes(connection, table_name):
+    # Indexes on the partitioned parent are created on every partition, current and future
+    schema_name, bare_table_name = table_name.split('.')
+    for suffix, method, columns in RESULTS_INDEXES:
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS "{bare_table_name}_{suffix}" ON {schema_name}."{bare_table_name}" USING {method} ({column_list})'))
+
+def create_month_partitions(connection, table_name, months):
+    """
+    Create the monthly partitions covering `months` that do not exist yet.
+    
+    :param connection: Open SQLAlchemy connection (inside a transaction).
+    :param table_name: Schema-qualified name of a partitioned results table.
+    :param months: Timestamps of any day in each month to cover.
+    """
+    schema_name, bare_table_name = table_name.split('.')
+    for month in sorted({pd.Timestamp(month).to_period('M') for month in months if pd.notna(month)}):
+        start, end = month.start_time, (month + 1).start_time
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {schema_name}."{bare_table_name}_y{month.year}m{month.month:02d}" '
+            f'PARTITION OF {schema_name}."{bare_table_name}" FOR VALUES FROM (\'{start}\') TO (\'{end}\')'))
+
+def migrate_results_table(db_params, table_name):
+    """
+    Move an existing results table created by `to_sql` into the declared partitioned layout.
+    
+    The old table is kept as '<table>_legacy' so it can be checked and dropped by hand.
+    
+    :param db_params: Dictionary with connection parameters (host, port, user, password, dbname).
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    """
+    schema_name, bare_table_name = table_name.split('.')
+    legacy_table_name = f"{bare_table_name}_legacy"
+    try:
+        engine = get_engine(db_params)
+        with engine.begin() as connection:
+            inspector = inspect(connection)
+            if bare_table_name not in inspector.get_table_names(schema=schema_name):
+                print(f"Table '{table_name}' does not exist in the database.")
+                return
+            if is_partitioned(connection, table_name):
+                print(f"Table '{table_name}' already uses the partitioned layout.")
+                return
+            existing_columns = {column['name'] for column in inspector.get_columns(bare_table_name, schema=schema_name)}
+            dropped = existing_columns - {column for column, _ in RESULTS_COLUMNS}
+            if dropped:
+                print(f"Warning: columns not in the declared layout are not migrated: {sorted(dropped)}")
+
+            connection.execute(text(f'ALTER TABLE {schema_name}."{bare_table_name}" RENAME TO "{legacy_table_name}"'))
+            create_results_table(connection, table_name, indexes=False)
+            months = connection.execute(text(
+                f'SELECT DISTINCT date_trunc(\'month\', CAST(game_datetime AS timestamp)) FROM {schema_name}."{legacy_table_name}"')).scalars().all()
+            create_month_partitions(connection, table_name, months)
+
+            # Text columns written by to_sql are cast to the declared types on the way in
+            select_list = ', '.join(f'CAST("{column}" AS {column_type})' if column in existing_columns else 'NULL'
+                                    for column, column_type in RESULTS_COLUMNS)
+            column_list = ', '.join(f'"{column}"' for column, _ in RESULTS_COLUMNS)
+            rows = connection.execute(text(
+                f'INSERT INTO {schema_name}."{bare_table_name}" ({column_list}) SELECT {select_list} FROM {schema_name}."{legacy_table_name}"')).rowcount
+            create_results_indexes(connection, table_name)
+            connection.execute(text(f'ANALYZE {schema_name}."{bare_table_name}"'))
+
+        print(f"Migrated {rows} rows into the partitioned table '{table_name}'. The old table is kept as '{schema_name}.{legacy_table_name}'.")
+
+    except Exception as error:
+        print(f"Error migrating table: {error}")
+
+def prepare_results_upload(connection, df, table_name):
+    """
+    Make the results table ready for the rows of `df`.
+    
+    Creates the declared table if it does not exist and the monthly partitions of the rows.
+    Tables created before the partitioned layout are appended to as they are.
+    
+    :param connection: Open SQLAlchemy connection (inside a transaction).
+    :param df: Results DataFrame to upload.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :return: The rows to upload, restricted to the declared columns for a partitioned table.
+    """
+    schema_name, bare_table_name = table_name.split('.')
+    inspector = inspect(connection)
+    if bare_table_name not in inspector.get_table_names(schema=schema_name):
+        create_results_table(connection, table_name)
+
+    if is_partitioned(connection, table_name):
+        declared_columns = [column for column, _ in RESULTS_COLUMNS]
+        extra_columns = [column for column in df.columns if column not in declared_columns]
+        if extra_columns:
+            print(f"Warning: columns not in the declared layout are not uploaded: {extra_columns}")
+        df = df[[column for column in declared_columns if column in df.columns]]
+        create_month_partitions(connection, table_name, pd.to_datetime(df['game_datetime']).unique())
+    return df
+
+def copy_results(connection, df, table_name):
+    """
+    Append rows to the results table with COPY.
+    
+    COPY does not convert values the way INSERT does (e.g. '3.0' into an integer column),
+    so the columns of the declared layout are cast to their declared types first.
+    
+    :param connection: Open SQLAlchemy connection (inside a transaction).
+    :param df: Results DataFrame; its columns must exist in the table.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    """
+    schema_name, bare_table_name = table_name.split('.')
+    column_types = dict(RESULTS_COLUMNS)
+    df = df.copy()
+    for column in df.columns:
+        column_type = column_types.get(column)
+        if column_type in ('smallint', 'integer', 'bigint') and pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].round().astype('Int64')
+        elif column_type == 'boolean' and not pd.api.types.is_bool_dtype(df[column]):
+            df[column] = df[column].astype('boolean')
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    column_list = ', '.join(f'"{column}"' for column in df.columns)
+    # COPY runs on the psycopg2 connection behind the SQLAlchemy one, inside the same transaction
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(f'COPY {schema_name}."{bare_table_name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+def upload_csv_to_postgres(db_params, file_path, table_name, player_form=None):
     try:
         # Step 1: Read the CSV file into a DataFrame and drop columns with "Unnamed" in their names
         df = pd.read_csv(file_path)
         df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
 
         # Step 2: Connect to PostgreSQL
-        engine = create_engine(f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}")
-        with engine.connect() as connection:
+        engine = get_engine(db_params)
+        with engine.begin() as connection:
             # Extract schema and table names
             schema_name, bare_table_name = table_name.split('.')
 
-            # Step 3: Check if table exists
-            inspector = inspect(engine)
-            if bare_table_name in inspector.get_table_names(schema=schema_name):
-                # Step 4: Insert data into the existing table
-                df.to_sql(bare_table_name, con=connection, schema=schema_name, if_exists='append', index=False)
-            else:
-                # Step 3: Create the table and insert data
-                df.to_sql(bare_table_name, con=connection, schema=schema_name, if_exists='replace', index=False)
+            # Step 3: Create the declared table and the monthly partitions of the new rows
+            df = prepare_results_upload(connection, df, table_name)
+
+            # Step 4: Insert data into the table
+            df.to_sql(bare_table_name, con=connection, schema=schema_name, if_exists='append', index=False)
 
         print(f"Data from {file_path} has been successfully uploaded to the {table_name} table.")
+
+        # Step 5: Add the uploaded games to the player form store (Player Scoring Analytics only)
+        if player_form:
+            from player_form import update_store
+            update_store(player_form, df)
         
     except pd.errors.EmptyDataError:
         print(f"Error: The file {file_path} is empty.")
@@ -66,7 +266,7 @@ def fetch_data_from_table(columns='*', conditions=None):
     """
     try:
         # Step 1: Connect to PostgreSQL
-        engine = create_engine(f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}")
+        engine = get_engine(db_params)
         with engine.connect() as connection:
             # Step 2: Build the SQL query
             query = f"SELECT {columns} FROM {table_name}"
@@ -82,6 +282,46 @@ def fetch_data_from_table(columns='*', conditions=None):
         print(f"Error fetching data: {error}")
         return pd.DataFrame()
 
+def fetch_query(query):
+    """
+    Run a query against the configured table, e.g. an aggregate for a chart.
+    
+    :param query: SQL query; '{table}' is replaced by the configured table name.
+    :return: Pandas DataFrame containing the query results.
+    """
+    config = load_config()
+    try:
+        engine = get_engine(config['db_params'])
+        with engine.connect() as connection:
+            return pd.read_sql(query.replace('{table}', config['table_name']), connection)
+    except Exception as error:
+        print(f"Error running query: {error}")
+        return pd.DataFrame()
+
+def fetch_distinct_values(columns, conditions=None):
+    """
+    Fetch the distinct values of each column, e.g. to fill filter options.
+    
+    :param columns: List of column names.
+    :param conditions: SQL WHERE clause conditions (optional).
+    :return: Dictionary mapping each column to a sorted list of its distinct values.
+    """
+    config = load_config()
+    table_name = config['table_name']
+    values = {}
+    try:
+        engine = get_engine(config['db_params'])
+        with engine.connect() as connection:
+            for column in columns:
+                query = f'SELECT DISTINCT "{column}" FROM {table_name} WHERE "{column}" IS NOT NULL'
+                if conditions:
+                    query += f" AND ({conditions})"
+                query += f' ORDER BY "{column}"'
+                values[column] = pd.read_sql(query, connection)[column].tolist()
+    except Exception as error:
+        print(f"Error fetching distinct values: {error}")
+    return values
+
 def delete_table(db_params, table_name):
     """
     Delete the specified table from the database after user confirmation.
@@ -120,6 +360,18 @@ if __name__ == "__main__":
     # Load configuration
     
 
+    # Uploads can also be added to a player form store: --player_form <store directory>
+    player_form = None
+    if '--player_form' in sys.argv[1:-1]:
+        index = sys.argv.index('--player_form')
+        player_form = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+
+    # Move a table created before the declared layout into it
+    if sys.argv[1:] == ['--migrate']:
+        migrate_results_table(config['db_params'], config['table_name'])
+        sys.exit(0)
+
     # Get the file path from command line arguments
     if len(sys.argv) < 2:
         print("Error: Please provide the CSV file path as an argument.")
@@ -137,7 +389,7 @@ if __name__ == "__main__":
 
     if action == 'upload':
         # Upload CSV to PostgreSQL
-        upload_csv_to_postgres(config['db_params'], csv_file_path, config['table_name'])
+        upload_csv_to_postgres(config['db_params'], csv_file_path, config['table_name'], player_form)
 
     elif action == 'delete':
         # Delete table from PostgreSQL
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from agents import ROLES_DICT
+
+# Columns of a prepared snapshot file, as read by inference.py (eg_app.py adds EGR and role)
+SNAPSHOT_COLUMNS = [
+    'round_num', 'game_id', 'player', 'inventory_value', 'event_num', 'game_version', 'game_datetime',
+    'round_start_time', 'event_time', 'seconds', 'kills', 'assists', 'deaths', 'money', 'inventory',
+    'combat_score_round', 'combat_score_total', 'ability1_base_charges', 'ability1_max_charges',
+    'ability1_temp_charges', 'ability2_base_charges', 'ability2_max_charges', 'ability2_temp_charges',
+    'grenade_base_charges', 'grenade_max_charges', 'grenade_temp_charges', 'ultimate_base_charges',
+    'ultimate_max_charges', 'ultimate_temp_charges', 'hp', 'armor', 'x', 'y', 'z', 'velocity_x',
+    'velocity_y', 'velocity_z', 'view_x', 'view_y', 'view_z', 'spike_planted', 'clock_time',
+    'account_id', 'agent_id', 'team', 'agent_name', 'side', 'attacking_team', 'teamId_value',
+    'kill_change', 'death_change', 'is_alive', 'our_team_alive', 'our_team_health',
+    'team_inventory_value', 'spike_event', 'opponent_team', 'opponent_team_alive',
+    'opponent_team_health', 'opponent_team_inventory_value', 'ability1_base_charges_change',
+    'ability1_base_charges_gained', 'ability1_base_charges_used', 'ability2_base_charges_change',
+    'ability2_base_charges_gained', 'ability2_base_charges_used', 'grenade_base_charges_change',
+    'grenade_base_charges_gained', 'grenade_base_charges_used', 'ultimate_base_charges_change',
+    'ultimate_base_charges_gained', 'ultimate_base_charges_used', 'damage_dealt', 'damage_taken',
+    'kill_c', 'death_c', 'damage_dealt_c', 'damage_taken_c', 'player_kill_c', 'player_death_c',
+    'player_damage_dealt_c', 'player_damage_taken_c', 'opponent_kill_c', 'opponent_death_c',
+    'opponent_damage_dealt_c', 'opponent_damage_taken_c', 'spike_diffused', 'team_id', 'won', 'map_name',
+]
+
+TEAMS = ['EG', 'SEN', 'NRG', 'C9', '100T', 'G2', 'LOUD', 'FUR', 'MIBR', 'LEV', 'KRU', 'TL']
+MAPS = ['Ascent', 'Bind', 'Haven', 'Icebox', 'Lotus', 'Split', 'Sunset']
+AGENTS = [agent for agents in ROLES_DICT.values() for agent in agents]
+ABILITIES = ['ability1', 'ability2', 'grenade', 'ultimate']
+
+
+def generate_snapshots(num_games=2, num_rounds=24, num_events=20, players_per_team=5, seed=0):
+    """
+    Generate a synthetic prepared snapshot frame with the columns of a real export.
+
+    Values are random but structurally consistent: one row per player per event,
+    cumulative kills and deaths, players dying once per round at most, team and
+    opponent aggregates summed over the players of each team, one winner per round.
+
+    :param num_games: Number of games.
+    :param num_rounds: Rounds per game.
+    :param num_events: Snapshot events per round.
+    :param players_per_team: Players per team (two teams per game).
+    :param seed: Random seed.
+    :return: Pandas DataFrame with SNAPSHOT_COLUMNS.
+    """
+    rng = np.random.default_rng(seed)
+    G, R, E, T, P = num_games, num_rounds, num_events, 2, players_per_team
+    shape = (G, R, E, T, P)
+
+    def broadcast(array, axes):
+        # Expand an array over the given axes of (game, round, event, team, player) to the full shape
+        full = [1] * 5
+        for axis, size in zip(axes, array.shape):
+            full[axis] = size
+        return np.broadcast_to(array.reshape(full), shape)
+
+    game_idx = broadcast(np.arange(G), [0])
+    round_num = broadcast(np.arange(1, R + 1), [1])
+    event_idx = broadcast(np.arange(E), [2])
+    team_idx = broadcast(np.arange(T), [3])
+    player_idx = broadcast(np.arange(P), [4])
+
+    # Game-level attributes
+    game_teams = np.stack([rng.choice(len(TEAMS), size=2, replace=False) for _ in range(G)])
+    team_code = broadcast(game_teams, [0, 3])
+    opponent_code = broadcast(game_teams[:, ::-1], [0, 3])
+    map_code = broadcast(rng.integers(len(MAPS), size=G), [0])
+    agent_code = broadcast(np.stack([rng.choice(len(AGENTS), size=(T, P), replace=False) for _ in range(G)]), [0, 3, 4])
+    game_start = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, size=G), unit='s')
+
+    # Round timing: events spread over 100 seconds, the same for all players of an event
+    seconds = broadcast(np.sort(rng.uniform(0, 100, size=(G, R, E)), axis=2), [0, 1, 2])
+    round_start = game_start.values[:, None] + np.arange(R)[None, :] * np.timedelta64(120, 's')
+    event_time = broadcast(round_start, [0, 1]) + (seconds * 1e9).astype(np.int64).astype('timedelta64[ns]')
+
+    # Deaths: each player dies at most once per round
+    death_event = rng.integers(0, 2 * E, size=(G, R, 1, T, P))
+    is_alive = (event_idx < death_event).astype(int)
+    death_change = (event_idx == death_event).astype(float)
+    hp = np.where(is_alive == 1, rng.integers(1, 101, size=shape), 0)
+    kill_change = (rng.random(shape) < 0.4 / E).astype(float)
+    kills = np.cumsum(kill_change.reshape(G, R * E, T, P), axis=1).reshape(shape)
+    deaths = np.cumsum(death_change.reshape(G, R * E, T, P), axis=1).reshape(shape)
+    inventory_value = np.where(is_alive == 1, broadcast(rng.integers(0, 9000, size=(G, R, T, P)), [0, 1, 3, 4]), 0)
+
+    # Team aggregates and the same values seen from the opponent's side
+    our_team_alive = np.broadcast_to(is_alive.sum(axis=4, keepdims=True), shape)
+    our_team_health = np.broadcast_to(hp.sum(axis=4, keepdims=True), shape)
+    team_inventory_value = np.broadcast_to(inventory_value.sum(axis=4, keepdims=True), shape)
+
+    # Sides swap at half time, spike is planted in some rounds
+    attacking_by_round = (np.arange(R) >= R // 2).astype(int)
+    attacking = broadcast(attacking_by_round, [1])
+    attacking_code = broadcast(game_teams[:, attacking_by_round], [0, 1])
+    is_attacking = team_idx == attacking
+    spike_planted = event_idx >= broadcast(rng.integers(E // 2, 2 * E, size=(G, R)), [0, 1])
+    winner = broadcast(rng.integers(0, 2, size=(G, R)), [0, 1])
+
+    data = {
+        'round_num': round_num,
+        'game_id': np.array([f'synthetic-game-{seed:04d}-{g:06d}' for g in range(G)])[game_idx],
+        'player': np.array(TEAMS)[team_code].astype(object) + '_' + player_idx.astype(str).astype(object),
+        'inventory_value': inventory_value,
+        'event_num': round_num * 1000 + event_idx,
+        'game_version': 'release-08.11',
+        'game_datetime': game_start.values[game_idx],
+        'round_start_time': broadcast(round_start, [0, 1]),
+        'event_time': event_time,
+        'seconds': seconds,
+        'kills': kills,
+        'assists': np.cumsum((rng.random(shape) < 0.2 / E).reshape(G, R * E, T, P), axis=1).reshape(shape),
+        'deaths': deaths,
+        'money': rng.integers(0, 9000, size=shape),
+        'inventory': '[]',
+        'combat_score_round': broadcast(rng.integers(0, 600, size=(G, R, T, P)), [0, 1, 3, 4]),
+        'combat_score_total': np.cumsum(rng.integers(0, 30, size=shape).reshape(G, R * E, T, P), axis=1).reshape(shape),
+        'hp': hp,
+        'armor': np.where(is_alive == 1, rng.choice([0, 25, 50], size=shape), 0),
+        'spike_planted': spike_planted,
+        'clock_time': (100 - seconds).round(1),
+        'account_id': (team_code * P + player_idx).astype(str),
+        'agent_id': agent_code.astype(str),
+        'team': np.array(TEAMS)[team_code],
+        'agent_name': np.array(AGENTS)[agent_code],
+        'side': np.where(is_attacking, 'attack', 'defense'),
+        'attacking_team': np.array(TEAMS)[attacking_code],
+        'teamId_value': team_code,
+        'kill_change': kill_change,
+        'death_change': death_change,
+        'is_alive': is_alive,
+        'our_team_alive': our_team_alive,
+        'our_team_health': our_team_health,
+        'team_inventory_value': team_inventory_value,
+        'spike_event': np.where(spike_planted, 'post-plant', 'pre-plant'),
+        'opponent_team': np.array(TEAMS)[opponent_code],
+        'opponent_team_alive': our_team_alive[:, :, :, ::-1],
+        'opponent_team_health': our_team_health[:, :, :, ::-1],
+        'opponent_team_inventory_value': team_inventory_value[:, :, :, ::-1],
+        'damage_dealt': np.where(rng.random(shape) < 0.05, rng.integers(1, 160, size=shape), 0),
+        'damage_taken': np.where(rng.random(shape) < 0.05, rng.integers(1, 160, size=shape), 0),
+        'spike_diffused': np.nan,
+        'team_id': team_code,
+        'won': team_idx == winner,
+        'map_name': np.array(MAPS)[map_code],
+    }
+    for ability in ABILITIES:
+        base = rng.integers(0, 3, size=shape)
+        change = np.diff(base, axis=2, prepend=base[:, :, :1])
+        data[f'{ability}_base_charges'] = base
+        data[f'{ability}_max_charges'] = 2
+        data[f'{ability}_temp_charges'] = 0
+        data[f'{ability}_base_charges_change'] = change
+        data[f'{ability}_base_charges_gained'] = change.clip(min=0)
+        data[f'{ability}_base_charges_used'] = (-change).clip(min=0)
+    for axis in ['x', 'y', 'z']:
+        data[axis] = rng.normal(0, 3000, size=shape)
+        data[f'velocity_{axis}'] = rng.normal(0, 200, size=shape)
+        data[f'view_{axis}'] = rng.uniform(-1, 1, size=shape)
+    for prefix in ['', 'player_', 'opponent_']:
+        data[f'{prefix}kill_c'] = rng.poisson(0.2, size=shape)
+        data[f'{prefix}death_c'] = rng.poisson(0.2, size=shape)
+        data[f'{prefix}damage_dealt_c'] = rng.poisson(20, size=shape)
+        data[f'{prefix}damage_taken_c'] = rng.poisson(20, size=shape)
+
+    n_rows = G * R * E * T * P
+    columns = {}
+    for column in SNAPSHOT_COLUMNS:
+        value = data[column]
+        columns[column] = np.broadcast_to(value, shape).reshape(n_rows) if isinstance(value, np.ndarray) else value
+    return pd.DataFrame(columns, index=pd.RangeIndex(n_rows))
@@ -0,0 +1,144 @@
+import argparse
+import os
+
+import joblib
+import pandas as pd
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+from tensorflow.keras.layers import LSTM, BatchNormalization, Dense, Dropout, Input, Masking
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.optimizers import Adam
+
+from feature_store import feature_store_key, load_features, save_features
+from inference import check_and_handle_nan_inf, get_feature_columns, load_data
+from model_registry import register_model
+from training_data import MASK_VALUE, build_sequence_arrays, compute_bucket_boundaries, make_dataset
+
+TARGET_COLUMN = 'cs_round_normalized'
+
+
+def preprocess_data(df, feature_columns, scaler=None):
+    """
+    Normalize the target, fix NaN/Inf values and scale the features.
+
+    :param df: DataFrame returned by `load_data`.
+    :param feature_columns: Feature columns fed to the model.
+    :param scaler: Fitted scaler for validation data; a new StandardScaler is fitted when omitted.
+    :return: Tuple of (preprocessed DataFrame, scaler).
+    """
+    df['cs_round_normalized'] = (df['combat_score_round'] - df['combat_score_round'].min()) / (df['combat_score_round'].max() - df['combat_score_round'].min())
+    df = check_and_handle_nan_inf(df, feature_columns)
+    df = check_and_handle_nan_inf(df, [TARGET_COLUMN])
+    if scaler is None:
+        scaler = StandardScaler()
+        scaler.fit(df.loc[:, feature_columns])
+    df.loc[:, feature_columns] = scaler.transform(df.loc[:, feature_columns])
+    return df, scaler
+
+
+def prepare_features(csv_path, store_dir, scaler=None, parent_key=None):
+    """
+    Return preprocessed sequence arrays for a CSV, using the feature store when possible.
+
+    :param csv_path: Path to the prepared CSV.
+    :param store_dir: Feature store directory.
+    :param scaler: Fitted scaler for validation data (optional).
+    :param parent_key: Key of the training entry whose scaler is applied (validation data).
+    :return: Tuple of (feature store entry, key).
+    """
+    feature_columns = list(get_feature_columns(pd.read_csv(csv_path, nrows=0)))
+    key = feature_store_key(csv_path, feature_columns, parent_key)
+
+    entry = load_features(store_dir, key)
+    if entry is not None:
+        print(f"Using cached features for {csv_path} ({key}).")
+        return entry, key
+
+    print(f"Preprocessing {csv_path}...")
+    df = load_data(csv_path)
+    df, fitted_scaler = preprocess_data(df, feature_columns, scaler)
+    values, round_lengths, targets = build_sequence_arrays(df, feature_columns, TARGET_COLUMN)
+    save_features(store_dir, key, values, round_lengths, targets, feature_columns,
+                  scaler=fitted_scaler if scaler is None else None, source=csv_path)
+    return load_features(store_dir, key), key
+
+
+def build_model(num_features, learning_rate=0.0001, lstm_units=(16, 8), dense_units=(), dropout=0.0,
+                batch_norm=False, loss='huber'):
+    """
+    Build the EGR model. The defaults are the architecture used in production.
+
+    :param num_features: Number of feature columns.
+    :param learning_rate: Adam learning rate.
+    :param lstm_units: Units of the stacked LSTM layers; only the last one returns a single vector.
+    :param dense_units: Units of ReLU Dense layers between the LSTMs and the output.
+    :param dropout: Dropout rate after each LSTM layer (0 disables it).
+    :param batch_norm: Add BatchNormalization after each LSTM layer.
+    :param loss: Keras loss name.
+    :return: Compiled model.
+    """
+    layers = [
+        Input(shape=(None, num_features)),  # Input layer with shape specification
+        Masking(mask_value=MASK_VALUE),  # Handles variable timesteps
+    ]
+    for i, units in enumerate(lstm_units):
+        layers.append(LSTM(units, return_sequences=i < len(lstm_units) - 1))
+        if batch_norm:
+            layers.append(BatchNormalization())
+        if dropout:
+            layers.append(Dropout(dropout))
+    for units in dense_units:
+        layers.append(Dense(units, activation='relu'))
+    layers.append(Dense(1, activation='linear'))  # Linear activation for continuous predictions
+
+    model = Sequential(layers)
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss=loss, metrics=['mse', 'mae'])
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training script for Valorant LSTM model.")
+    parser.add_argument('--train_csv', type=str, default='./eg_train.csv', help='Path to the training CSV file.')
+    parser.add_argument('--val_csv', type=str, default='./eg_test.csv', help='Path to the validation CSV file.')
+    parser.add_argument('--feature_store', type=str, default='./feature_store', help='Directory of cached preprocessed features.')
+    parser.add_argument('--checkpoint_dir', type=str, default='./checkpoints', help='Directory used to resume interrupted training.')
+    parser.add_argument('--model_path', type=str, default='valorant_lstm_model_combatscore_target.keras', help='Path to save the trained model.')
+    parser.add_argument('--scaler_path', type=str, default='scaler_combatscore_target.pkl', help='Path to save the scaler.')
+    parser.add_argument('--registry', type=str, help='Also register the trained model in this model registry directory.')
+    parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs.')
+    parser.add_argument('--batch_size', type=int, default=32, help='Rounds per batch.')
+    parser.add_argument('--learning_rate', type=float, default=0.0001, help='Adam learning rate.')
+    args = parser.parse_args()
+
+    print("Loading features...")
+    train_entry, train_key = prepare_features(args.train_csv, args.feature_store)
+    val_entry, _ = prepare_features(args.val_csv, args.feature_store, scaler=train_entry['scaler'], parent_key=train_key)
+
+    bucket_boundaries = compute_bucket_boundaries(train_entry['round_lengths'])
+    train_dataset = make_dataset(train_entry['values'], train_entry['round_lengths'], train_entry['targets'],
+                                 batch_size=args.batch_size, bucket_boundaries=bucket_boundaries)
+    val_dataset = make_dataset(val_entry['values'], val_entry['round_lengths'], val_entry['targets'],
+                               batch_size=args.batch_size, bucket_boundaries=bucket_boundaries, shuffle=False)
+
+    print("Training model...")
+    model = build_model(len(train_entry['feature_columns']), args.learning_rate)
+    callbacks = [
+        # Restores the model, optimizer and epoch counter if a previous run was interrupted
+        tf.keras.callbacks.BackupAndRestore(backup_dir=os.path.join(args.checkpoint_dir, 'backup')),
+        tf.keras.callbacks.ModelCheckpoint(os.path.join(args.checkpoint_dir, 'best.keras'), monitor='val_loss', save_best_only=True),
+    ]
+    model.fit(train_dataset, epochs=args.epochs, validation_data=val_dataset, callbacks=callbacks)
+
+    model.save(args.model_path)
+    joblib.dump(train_entry['scaler'], args.scaler_path)
+    print(f"Model saved to {args.model_path}")
+    print(f"Scaler saved to {args.scaler_path}")
+
+    if args.registry:
+        version = register_model(args.registry, args.model_path, args.scaler_path, train_entry['feature_columns'],
+                                 notes=f"Trained on {args.train_csv} for {args.epochs} epochs")
+        print(f"Registered model version {version} in {args.registry}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import tensorflow as tf
+
+from sequence_store import MASK_VALUE
+
+
+def build_sequence_arrays(df, feature_columns, target_column):
+    """
+    Flatten the rounds of every player-game into contiguous arrays.
+
+    Rounds are ordered like `generate_samples` (game_id, player, round_num) and
+    events keep their order within a round.
+
+    :param df: Preprocessed DataFrame.
+    :param feature_columns: Feature columns fed to the model.
+    :param target_column: Target column; the last value of each round is used.
+    :return: Tuple of (values float32 [events, features], round_lengths int64 [rounds], targets float32 [rounds]).
+    """
+    round_keys = df.groupby(['game_id', 'player', 'round_num'], sort=True).ngroup().to_numpy()
+    order = np.argsort(round_keys, kind='stable')
+
+    values = np.ascontiguousarray(df[feature_columns].to_numpy(dtype=np.float32)[order])
+    round_lengths = np.bincount(round_keys).astype(np.int64)
+    round_ends = np.cumsum(round_lengths) - 1
+    targets = df[target_column].to_numpy(dtype=np.float32)[order][round_ends]
+    return values, round_lengths, targets
+
+
+def compute_bucket_boundaries(round_lengths, num_buckets=8):
+    """Pick bucket boundaries at quantiles of the round lengths so buckets fill evenly."""
+    quantiles = np.quantile(round_lengths, np.linspace(0, 1, num_buckets + 1)[1:-1])
+    return sorted(set(int(q) + 1 for q in quantiles))
+
+
+def make_dataset(values, round_lengths, targets, batch_size=32, bucket_boundaries=None, shuffle=True, seed=None):
+    """
+    Build a batched tf.data pipeline over individual rounds.
+
+    Each round is an independent sequence for the model, so rounds from different
+    player-games are batched together with rounds of similar length. Padding only
+    happens at batch assembly, up to the longest round in the batch.
+
+    :param values: Event features, float32 [events, features].
+    :param round_lengths: Number of events per round.
+    :param targets: Target per round.
+    :param batch_size: Rounds per batch.
+    :param bucket_boundaries: Round-length bucket boundaries; computed from the data when omitted.
+    :param shuffle: Shuffle rounds every epoch (disable for validation).
+    :param seed: Shuffle seed.
+    :return: tf.data.Dataset yielding (padded rounds, targets).
+    """
+    if bucket_boundaries is None:
+        bucket_boundaries = compute_bucket_boundaries(round_lengths)
+
+    rounds = tf.RaggedTensor.from_row_lengths(values, round_lengths)
+    dataset = tf.data.Dataset.from_tensor_slices((rounds, targets))
+    # Newer TensorFlow versions slice rows of a ragged tensor as uniform RaggedTensors, which
+    # padded batching rejects; passing them through map turns them into dense tensors
+    if isinstance(dataset.element_spec[0], tf.RaggedTensorSpec):
+        dataset = dataset.map(lambda rounds, targets: (rounds.to_tensor() if isinstance(rounds, tf.RaggedTensor) else rounds, targets))
+    dataset = dataset.cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(round_lengths), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda rounds, targets: tf.shape(rounds)[0],
+        bucket_boundaries=bucket_boundaries,
+        bucket_batch_sizes=[batch_size] * (len(bucket_boundaries) + 1),
+        padding_values=(tf.constant(MASK_VALUE, tf.float32), tf.constant(0.0, tf.float32)),
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -1,8 +1,7 @@
 import pickle
 from pathlib import Path
 from datetime import date
-import pandas as pd  # pip install pandas openpyxl
-import plotly.express as px  # pip install plotly-express
+import csv
 import streamlit as st  # pip install streamlit
 import streamlit_authenticator as stauth  # pip install streamlit-authenticator
 import streamlit.components.v1 as components
@@ -11,7 +10,7 @@ import yaml
 from yaml.loader import SafeLoader
 # from userprofile import user_profile
 from chat_ui import chatui
-from sql_utils import fetch_data_from_table
+from sql_utils import fetch_distinct_values
 
 
 
@@ -20,10 +19,10 @@ def authenticate_user(username, password):
     return True
 
 def clear_chat_history():
-    st.session_state.messages = []
+    st.session_state.messages.clear()
+    st.session_state.memory.clear()
     
 sh = ""
-context_history: List[Dict[str, str]] = []
 
 
 # st.set_page_config(page_title="Valorant ChatBot", page_icon=":video_game:", layout="wide")
@@ -45,8 +44,16 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-df_video = pd.read_csv('./EG_Youtube.csv')
-df=fetch_data_from_table()
+@st.cache_data(ttl=600, show_spinner=False)
+def load_sidebar_options():
+    # Only the distinct values are fetched, not the full table
+    return fetch_distinct_values(['game_version', 'team', 'opponent_team', 'map_name', 'game_id'])
+
+@st.cache_resource(show_spinner=False)
+def load_video_lookup(video_file='./EG_Youtube.csv'):
+    # game_id -> video URL, read once per process
+    with open(video_file, newline='') as file:
+        return {row['game_id']: row['Video'] for row in csv.DictReader(file)}
 
 
 
@@ -89,16 +96,20 @@ else:
     # Get the first day of the current year
     first_day_of_year = date(current_year, 1, 1)
 
+    sidebar_options = load_sidebar_options()
+    video_lookup = load_video_lookup()
+
     with st.sidebar:
         with st.expander("Game Options"):
             # st.multiselect("Select Game Version", ["V1", "V2", "V3"])
-            st.multiselect("Select Game Version", df['game_version'].unique())
-            date = st.date_input("Choose Dates", value=(date.today(), date.today()))
+            st.multiselect("Select Game Version", sidebar_options.get('game_version', []))
+            # An empty range means no date filter is applied to chat queries
+            date = st.date_input("Choose Dates", value=())
             # date = st.date_input("Choose Dates")
-            st.multiselect("Select Team", df['team'].unique())
-            st.multiselect("Select Opponent Team", df['opponent_team'].unique())
-            st.multiselect("Select Map", df['map_name'].unique())
-            game_id = st.multiselect("Select Game IDs", df['game_id'].unique())
+            st.multiselect("Select Team", sidebar_options.get('team', []))
+            st.multiselect("Select Opponent Team", sidebar_options.get('opponent_team', []))
+            st.multiselect("Select Map", sidebar_options.get('map_name', []))
+            game_id = st.multiselect("Select Game IDs", sidebar_options.get('game_id', []))
             st.button("Filter")
             # with st.expander("Chat History"):
          # st.button('Clear Chat History', on_click=clear_chat_history)
@@ -140,10 +151,13 @@ else:
     tab1, tab2 = st.tabs(["Chat","Display Video"])
        
     with tab1:
-        chatui(game_id, date, context_history)
+        chatui(game_id, date)
     with tab2:
         if game_id:
-            st.video(df_video[df_video['game_id']==game_id[0]]['Video'].iloc[0])
+            if game_id[0] in video_lookup:
+                st.video(video_lookup[game_id[0]])
+            else:
+                st.write("No video available for the selected game id")
         else:
             st.write("Select game id from sidebar")
                  
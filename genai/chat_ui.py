@@ -1,21 +1,18 @@
 import streamlit as st
-import random
-import time
-import psycopg2
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
-import logging
 from typing import List, Union, Generator, Iterator, Dict
 import os
+import sys
 import json  # Added for config loading
-from pydantic import BaseModel
-from llama_index.llms.ollama import Ollama
-from llama_index.core.query_engine import NLSQLTableQueryEngine
-from llama_index.core import SQLDatabase, PromptTemplate
-import aiohttp
-import asyncio
+from collections import deque
 from datetime import datetime
 import streamlit_chat
+from sql_guard import SQLGuardError, run_guarded_query
+from conversation_memory import ConversationMemory
+from instrumentation import Tracer
+from intent_router import format_answer, route_question
+from llm_pool import LLMPool
 
 # Function to load the configuration file
 def load_config(config_file='config.json'):
@@ -39,12 +36,34 @@ connection_params = config['db_params']
 # Extract table name from JSON
 table_name = config['table_name']
 
-# Create the SQLAlchemy engine using parameters from the JSON file
-engine = create_engine(f"postgresql+psycopg2://{connection_params['user']}:{connection_params['password']}@{connection_params['host']}:{connection_params['port']}/{connection_params['dbname']}")
-sql_database = SQLDatabase(engine, include_tables=[table_name.split('.')[-1]], schema=table_name.split('.')[0])
+# Limits applied to every LLM-generated query
+guard_params = config.get('sql_guard', {})
 
-# Initialize the LLM model
-llm = Ollama(model='llama3.1:latest', context_window=30000, request_timeout=300.0,temperature=0)
+# Number of chat messages rendered on each rerun; older ones stay summarized in memory
+MAX_DISPLAYED_MESSAGES = 20
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    # Create the SQLAlchemy engine using parameters from the JSON file
+    return create_engine(f"postgresql+psycopg2://{connection_params['user']}:{connection_params['password']}@{connection_params['host']}:{connection_params['port']}/{connection_params['dbname']}")
+
+@st.cache_resource(show_spinner=False)
+def get_chat_resources():
+    """
+    Create the database engine, SQLDatabase and LLM client once per process.
+
+    The llama-index imports are deferred to here so that the login page,
+    sidebar and routed questions run without loading the LLM stack.
+    """
+    from schema_cache import CachedSchemaSQLDatabase
+
+    engine = get_engine()
+    # The prompt's {schema} comes from a cached digest instead of per-query introspection
+    sql_database = CachedSchemaSQLDatabase(engine, table_name)
+
+    # Pool of Ollama endpoints shared by all sessions, configured in the "llm_pool" section
+    llm_pool = LLMPool.from_config(config, client_kwargs={'context_window': 30000, 'temperature': 0}).start()
+    return engine, sql_database, llm_pool
 
 def extract_sql_query(response_object):
     for key, value in response_object.items():
@@ -59,7 +78,53 @@ def handle_streaming_response(response_gen):
     response_list = list(response_gen)
     return "".join(response_list)
 
-def chat_bot(user_query, game_id, date, context_history):
+def synthesize_answer(llm, user_query, sql_query, result_df):
+    # Turn the guarded query result into a natural-language answer
+    if result_df.empty:
+        result_str = "No rows returned."
+    else:
+        result_str = result_df.to_csv(index=False)
+    answer_prompt = f"""
+    Given an input question, synthesize a response from the query results.
+    Query: {user_query}
+    SQL: {sql_query}
+    SQL Response: {result_str}
+    Response:
+    """
+    return handle_streaming_response(chunk.delta for chunk in llm.stream_complete(answer_prompt))
+
+def answer_routed_question(route, user_query, game_id, date, memory):
+    # Known question shapes run their parameterized SQL directly, without the LLM
+    tracer = Tracer('chat')
+    with tracer.span('chat_request', intent=route['name']):
+        try:
+            with tracer.span('db_execution'):
+                guarded_sql, result_df = run_guarded_query(get_engine(), route['sql'], table_name, game_ids=game_id,
+                                                           date_range=date, params=route['params'], **guard_params)
+            final_response = format_answer(route, result_df)
+        except SQLGuardError as error:
+            print(f"Query rejected: {error}")
+            final_response = f"The query was rejected: {error}"
+        except SQLAlchemyError as error:
+            print(f"Error executing query: {error}")
+            final_response = f"The query could not be executed: {error.__class__.__name__}"
+
+    print("Latency: ", {record['name']: record['wall_s'] for record in tracer.spans})
+
+    memory.add_turn(user_query, final_response)
+    return route['sql'], final_response
+
+def chat_bot(user_query, game_id, date, memory):
+    route = route_question(get_engine(), table_name, user_query)
+    if route is not None:
+        print("routed intent: ", route['name'], route['params'])
+        return answer_routed_question(route, user_query, game_id, date, memory)
+
+    from llama_index.core.query_engine import NLSQLTableQueryEngine
+    from llama_index.core import PromptTemplate
+
+    engine, sql_database, llm_pool = get_chat_resources()
+
     # Few-shot examples as context, using the dynamic table name
     few_shot_examples = [
         {
@@ -91,6 +156,9 @@ def chat_bot(user_query, game_id, date, context_history):
     # Build the few-shot context
     context_prompt = "\n".join([f"Q: {example['query']}\nA: {example['response']}" for example in few_shot_examples])
 
+    # Summary and relevant earlier turns of this session; braces are escaped for the template
+    history_prompt = memory.to_prompt(user_query).replace("{", "{{").replace("}", "}}")
+
     # Define the final prompt with few-shot examples
     text_to_sql_prompt = f"""
     {context_prompt}
@@ -114,6 +182,8 @@ def chat_bot(user_query, game_id, date, context_history):
     Only use tables from the schema below:
     {{schema}}
 
+    {history_prompt}
+
     Question: {{query_str}}
     SQLQuery:
     """
@@ -122,58 +192,54 @@ def chat_bot(user_query, game_id, date, context_history):
     
     print("text_to_sql_template: ", text_to_sql_template)
 
-    query_engine = NLSQLTableQueryEngine(sql_database=sql_database,
-                                         tables=[table_name.split('.')[-1]],
-                                         llm=llm,
-                                         embed_model="local",
-                                         text_to_sql_prompt=text_to_sql_template,
-                                         streaming=True
-                                        )
+    # Only generate the SQL here; it is validated and executed by the guard below
+    def generate_sql(llm):
+        query_engine = NLSQLTableQueryEngine(sql_database=sql_database,
+                                             tables=[table_name.split('.')[-1]],
+                                             llm=llm,
+                                             embed_model="local",
+                                             text_to_sql_prompt=text_to_sql_template,
+                                             sql_only=True,
+                                             synthesize_response=False
+                                            )
+        return query_engine.query(query)
 
     print("game id selected: ", game_id)
     print("date selected: ", date)
 
-    if game_id:
-        user_prompt = f"""Where game_id in {game_id}"""
-        query = f"""{user_query} \n {user_prompt}"""
-    else:
-        query = f"""{user_query}"""
+    # Sidebar filters are injected as predicates by the guard, not into the question
+    query = f"""{user_query}"""
 
     print("user_query: ", query)
 
-    s = datetime.now()
-    
-    response = query_engine.query(query)
-    print("type(response)", type(response))
-
-    # Check if the response is indeed a streaming response
-    if isinstance(response.response_gen, Generator):
-        print("if part")
-        final_response = handle_streaming_response(response.response_gen)
-    else:
-        # Fallback: if the response is a string (not streaming)
-        print("else part")
-        final_response = response.response
+    # Per-request trace: LLM SQL generation, database execution and answer synthesis
+    tracer = Tracer('chat')
+    with tracer.span('chat_request'):
+        with tracer.span('llm_sql_generation'):
+            response = llm_pool.run('sql', generate_sql)
+        # With sql_only the response text is the generated SQL itself
+        sql_query = extract_sql_query(response.metadata) or response.response
+        print("sql_query: ", sql_query)
+
+        try:
+            with tracer.span('db_execution'):
+                guarded_sql, result_df = run_guarded_query(engine, sql_query, table_name, game_ids=game_id, date_range=date, **guard_params)
+            print("guarded_sql: ", guarded_sql)
+            with tracer.span('answer_synthesis', rows=len(result_df)):
+                final_response = llm_pool.run('answer', lambda llm: synthesize_answer(llm, query, guarded_sql, result_df))
+        except SQLGuardError as error:
+            print(f"Query rejected: {error}")
+            final_response = f"The generated query was rejected: {error}"
+        except SQLAlchemyError as error:
+            print(f"Error executing query: {error}")
+            final_response = f"The generated query could not be executed: {error.__class__.__name__}"
     
-    e = datetime.now()
-    print("Latency: ", (e-s).total_seconds())
-
-    sql_query = extract_sql_query(response.metadata)
-    print("sql_query: ", sql_query)
+    print("Latency: ", {record['name']: record['wall_s'] for record in tracer.spans})
     
     print("final_response: ", final_response)
 
-    # Save the current interaction to the context history
-    context_history.append({
-        'query': query,
-        'response': final_response
-    })
-
-    print("before appending context history:", context_history)
-
-    # Limit the context history to the last 5 interactions for example
-    context_history = context_history[-5:]
-    print("appended context history:", context_history)
+    # Save the current interaction to this session's bounded memory
+    memory.add_turn(query, final_response)
 
     result = f"Generated SQL Query:\n```sql\n{sql_query}\n```\nResponse:\n{final_response}"
     print("final final result", result)
@@ -195,32 +261,38 @@ def move_focus():
 def userid_change():
     st.session_state.userid = st.session_state.userid_input
     
-def complete_messages(nbegin, nend, query, game_id, date, context_history, stream=False):
-    messages = [
-                {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.messages
-            ]
+def complete_messages(nbegin, nend, query, game_id, date, memory, stream=False):
     with st.spinner(f"Waiting for response from EG ChatBot."):
-        sql_query, final_response = chat_bot(query, game_id, date, context_history)       
+        sql_query, final_response = chat_bot(query, game_id, date, memory)       
     return sql_query, final_response
 
-def chatui(game_id, date, context_history):        
+def add_message(role, content):
+    # Messages carry a running id so widget keys stay stable when old ones are dropped
+    st.session_state.message_count += 1
+    st.session_state.messages.append({"role": role, "content": content, "id": st.session_state.message_count})
+
+def chatui(game_id, date):        
 
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = deque(maxlen=MAX_DISPLAYED_MESSAGES)
+        st.session_state.message_count = 0
+    if "memory" not in st.session_state:
+        st.session_state.memory = ConversationMemory()
         
     if st.sidebar.button("Clear Conversation", key='clear_chat_button'):
-        st.session_state.messages = []
+        st.session_state.messages.clear()
+        st.session_state.memory.clear()
         move_focus()
-    for i, message in enumerate(st.session_state.messages):
-        nkey = int(i/2)
+    for message in st.session_state.messages:
         if message["role"] == "user":
-            streamlit_chat.message(message["content"], is_user=True, avatar_style="adventurer", key='chat_messages_user_'+str(nkey))
+            streamlit_chat.message(message["content"], is_user=True, avatar_style="adventurer", key='chat_messages_user_'+str(message["id"]))
         else:
-            streamlit_chat.message(message["content"], is_user=False, key='chat_messages_assistant_'+str(nkey))
+            streamlit_chat.message(message["content"], is_user=False, key='chat_messages_assistant_'+str(message["id"]))
 
     if user_content := st.chat_input("Type your question here."):
-        nkey = int(len(st.session_state.messages)/2)
+        nkey = st.session_state.message_count + 1
         streamlit_chat.message(user_content, is_user=True, avatar_style="adventurer", seed=44, key='chat_messages_user_'+str(nkey))
-        llm_generated_sql, assistant_content = complete_messages(0, 1, user_content, game_id, date, context_history)
-        streamlit_chat.message(assistant_content, avatar_style="adventurer", seed=44, key='chat_messages_assistant_'+str(nkey))
+        llm_generated_sql, assistant_content = complete_messages(0, 1, user_content, game_id, date, st.session_state.memory)
+        streamlit_chat.message(assistant_content, avatar_style="adventurer", seed=44, key='chat_messages_assistant_'+str(nkey + 1))
+        add_message("user", user_content)
+        add_message("assistant", assistant_content)
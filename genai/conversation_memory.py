@@ -0,0 +1,86 @@
+import re
+from collections import deque
+
+# Words ignored when matching a question against earlier turns
+STOP_WORDS = {
+    'the', 'and', 'for', 'from', 'with', 'that', 'this', 'what', 'which', 'who', 'how', 'many',
+    'give', 'show', 'find', 'list', 'all', 'each', 'did', 'does', 'has', 'have', 'get', 'got',
+    'are', 'was', 'were', 'can', 'you', 'our', 'per',
+}
+
+
+def _keywords(text):
+    return {word for word in re.findall(r"[a-z0-9_]+", text.lower()) if len(word) > 2 and word not in STOP_WORDS}
+
+
+def _first_sentence(text, max_chars):
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3] + "..."
+
+
+class ConversationMemory:
+    """
+    Bounded chat history for one Streamlit session.
+
+    The most recent turns are kept verbatim in a ring buffer. Turns that fall out
+    of it are compacted into one-line summaries, which are themselves bounded, so
+    memory use and prompt size stay flat however long the session runs.
+    """
+
+    def __init__(self, max_turns=5, max_summary_lines=10, max_summary_chars=150):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = deque(maxlen=max_summary_lines)
+        self.max_summary_chars = max_summary_chars
+
+    def add_turn(self, query, response):
+        if len(self.turns) == self.turns.maxlen:
+            self._compact(self.turns[0])
+        self.turns.append({'query': query, 'response': response, 'keywords': _keywords(query + " " + response)})
+
+    def _compact(self, turn):
+        # Extractive summary: the question and the first sentence of the answer
+        answer = _first_sentence(turn['response'], self.max_summary_chars)
+        self.summary.append(f"Q: {turn['query']} -> A: {answer}")
+
+    def relevant_turns(self, query, max_relevant=2):
+        """
+        Select the previous turns worth feeding into the prompt.
+
+        The latest turn is always included so follow-up questions resolve; older
+        turns are included when they share keywords with the new question.
+
+        :param query: The new user question.
+        :param max_relevant: Maximum number of turns returned.
+        :return: List of turns in chronological order.
+        """
+        if not self.turns:
+            return []
+        turns = list(self.turns)
+        selected = {len(turns) - 1}
+        query_keywords = _keywords(query)
+        scored = sorted(
+            ((len(query_keywords & turn['keywords']), i) for i, turn in enumerate(turns[:-1])),
+            reverse=True,
+        )
+        for score, i in scored:
+            if len(selected) >= max_relevant or score == 0:
+                break
+            selected.add(i)
+        return [turns[i] for i in sorted(selected)]
+
+    def to_prompt(self, query, max_relevant=2):
+        """Render the summary and relevant turns as a compact prompt section."""
+        sections = []
+        if self.summary:
+            sections.append("Earlier in this conversation:\n" + "\n".join(self.summary))
+        relevant = self.relevant_turns(query, max_relevant)
+        if relevant:
+            sections.append("Previous questions and answers:\n" + "\n".join(
+                f"Q: {turn['query']}\nA: {_first_sentence(turn['response'], 2 * self.max_summary_chars)}"
+                for turn in relevant
+            ))
+        return "\n\n".join(sections)
+
+    def clear(self):
+        self.turns.clear()
+        self.summary.clear()
@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+# Seconds between reloads of the cached slot values
+DEFAULT_REFRESH_INTERVAL = 600
+
+# Slot name -> column whose distinct values can fill it
+SLOT_COLUMNS = {'team': 'team', 'player': 'player', 'game_id': 'game_id'}
+
+# Longest slot value, in words, looked up in a question
+MAX_SLOT_WORDS = 3
+
+# Known question shapes, taken from the few-shot examples of the text-to-SQL prompt.
+# Patterns must match the whole normalized question (lower case, slot values replaced
+# by <slot>), so questions with extra conditions fall through to the LLM.
+# Every pattern also accepts a trailing "in game <game_id>".
+INTENTS = [
+    {
+        'name': 'team_players',
+        'patterns': [
+            r"(?:give me |list |show(?: me)? |who are |what are )?(?:the |all )?(?:the )?players (?:from|of|on|in|for) (?:team )?<team>",
+            r"who plays for (?:team )?<team>",
+        ],
+        'sql': "SELECT DISTINCT player FROM {table} WHERE team = :team{game_filter} ORDER BY player",
+        'title': "Players from {team}",
+    },
+    {
+        'name': 'team_rounds_won',
+        'patterns': [
+            r"(?:give me |tell me |show(?: me)? )?how many rounds (?:has |have )?(?:team )?<team>(?: team)? (?:has |have )?won",
+            r"how many rounds did (?:team )?<team>(?: team)? win",
+            r"(?:give me |show(?: me)? )?(?:the )?rounds won by (?:team )?<team>",
+        ],
+        'sql': ("WITH unique_outcomes AS (SELECT DISTINCT round_num, team, game_id, won FROM {table} "
+                "WHERE team = :team{game_filter}) "
+                "SELECT game_id, team, COUNT(*) AS rounds_won FROM unique_outcomes WHERE won = True GROUP BY game_id, team"),
+        'title': "Rounds won by {team}",
+    },
+    {
+        'name': 'player_kills_per_round',
+        'patterns': [
+            r"(?:give me |show(?: me)? )?how many kills (?:in |per |for )?(?:each |every )?round (?:player )?<player> (?:has got|has|got|had|made)",
+            r"how many kills did (?:player )?<player> (?:get|have|make) (?:in |per |for )?(?:each |every )?round",
+            r"(?:give me |show(?: me)? )?(?:the )?kills (?:per|in each|for each|in every) round (?:of|for|by) (?:player )?<player>",
+        ],
+        'sql': ("SELECT round_num, game_id, SUM(kill_change) AS total_kills FROM {table} "
+                "WHERE player = :player{game_filter} GROUP BY round_num, game_id ORDER BY game_id, round_num"),
+        'title': "Kills per round of {player}",
+    },
+    {
+        'name': 'team_kills_per_round',
+        'patterns': [
+            r"(?:give me |show(?: me)? )?how many kills did (?:team )?<team>(?: team)? (?:get|have|make) (?:in |per |for )?(?:each |every )?round",
+            r"(?:give me |show(?: me)? )?how many kills (?:in |per |for )?(?:each |every )?round (?:team )?<team>(?: team)? (?:has got|has|got|had|made)",
+            r"(?:give me |show(?: me)? )?(?:the )?kills (?:per|in each|for each|in every) round (?:of|for|by) (?:team )?<team>(?: team)?",
+        ],
+        'sql': ("SELECT round_num, game_id, SUM(kill_change) AS total_kills FROM {table} "
+                "WHERE team = :team{game_filter} GROUP BY round_num, game_id ORDER BY game_id, round_num"),
+        'title': "Kills per round of {team}",
+    },
+    {
+        'name': 'player_kill_and_assist_rounds',
+        'patterns': [
+            r"(?:find |show(?: me)? |list |give me )?(?:all )?(?:the )?rounds (?:where|in which|when) (?:player )?<player> (?:had|got|made) (?:a |at least one )?kill and (?:an |a |at least one )?assist",
+        ],
+        'sql': ("SELECT DISTINCT game_id, round_num, kill_change, assists FROM {table} "
+                "WHERE player = :player AND kill_change > 0 AND assists > 0{game_filter} ORDER BY game_id, round_num"),
+        'title': "Rounds where {player} had a kill and an assist",
+    },
+    {
+        'name': 'close_rounds',
+        'patterns': [
+            r"(?:find |show(?: me)? |list |give me )?(?:all )?(?:the )?(?:rounds that were close|close rounds)"
+            r"(?: at some point in (?:the )?round it was a 2v2 or 3v3 for at least 5 seconds)?",
+        ],
+        'sql': ("WITH filtered_events AS (SELECT round_num, game_id, "
+                "seconds - LAG(seconds, 1, seconds) OVER (PARTITION BY round_num, game_id ORDER BY seconds) AS time_diff "
+                "FROM {table} WHERE our_team_alive IN (2, 3) AND opponent_team_alive IN (2, 3){game_filter}), "
+                "grouped_events AS (SELECT round_num, game_id, SUM(time_diff) AS total_time_diff FROM filtered_events GROUP BY round_num, game_id) "
+                "SELECT round_num, game_id FROM grouped_events WHERE total_time_diff >= 5 ORDER BY game_id, round_num"),
+        'title': "Close rounds (2v2 or 3v3 for at least 5 seconds)",
+    },
+]
+
+GAME_SUFFIX = r"(?: (?:in|for|from) (?:the )?(?:game )?<game_id>)?"
+
+_compiled_intents = [
+    (intent, [re.compile(rf"^(?:{pattern}){GAME_SUFFIX}$") for pattern in intent['patterns']])
+    for intent in INTENTS
+]
+
+_slot_cache = {}
+_slot_lock = threading.Lock()
+
+
+def load_slot_values(engine, table_name, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """
+    Return the cached distinct values of the slot columns, reloading them every `refresh_interval` seconds.
+
+    :param engine: SQLAlchemy engine.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param refresh_interval: Seconds between reloads.
+    :return: Dictionary mapping each slot to {lower-case value: value}.
+    """
+    with _slot_lock:
+        entry = _slot_cache.get(table_name)
+        now = time.monotonic()
+        if entry and now - entry['loaded_at'] < refresh_interval:
+            return entry['values']
+
+        values = {}
+        with engine.connect() as connection:
+            for slot, column in SLOT_COLUMNS.items():
+                rows = connection.execute(text(f'SELECT DISTINCT "{column}" FROM {table_name} WHERE "{column}" IS NOT NULL')).scalars()
+                values[slot] = {str(value).lower(): str(value) for value in rows}
+        _slot_cache[table_name] = {'values': values, 'loaded_at': now}
+        return values
+
+
+def normalize_question(question, slot_values):
+    """
+    Lower-case a question and replace known slot values with <slot> placeholders.
+
+    :param question: User question.
+    :param slot_values: Output of `load_slot_values`.
+    :return: Tuple of (normalized question, {slot: value}).
+    """
+    # Punctuation is dropped, except characters that appear inside names and game ids
+    words = [word.strip(".'") for word in re.sub(r"[^\w\s'.-]", " ", question).split()]
+    words = [word for word in words if word]
+    tokens, slots = [], {}
+    i = 0
+    while i < len(words):
+        for n in range(min(MAX_SLOT_WORDS, len(words) - i), 0, -1):
+            candidate = " ".join(words[i:i + n]).lower()
+            slot = next((slot for slot, values in slot_values.items() if candidate in values), None)
+            if slot is not None:
+                tokens.append(f"<{slot}>")
+                slots[slot] = slot_values[slot][candidate]
+                i += n
+                break
+        else:
+            tokens.append(words[i].lower())
+            i += 1
+    return " ".join(tokens), slots
+
+
+def match_intent(question, table_name, slot_values):
+    """
+    Match a question against the known intents.
+
+    :param question: User question.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param slot_values: Output of `load_slot_values`.
+    :return: Dictionary with the intent name, SQL, bind parameters and answer title, or None.
+    """
+    normalized, slots = normalize_question(question, slot_values)
+    for intent, patterns in _compiled_intents:
+        if not any(pattern.match(normalized) for pattern in patterns):
+            continue
+        game_filter = " AND game_id = :game_id" if 'game_id' in slots else ""
+        title = intent['title'].format(**slots)
+        if 'game_id' in slots:
+            title += f" in game {slots['game_id']}"
+        return {
+            'name': intent['name'],
+            'sql': intent['sql'].format(table=table_name, game_filter=game_filter),
+            'params': slots,
+            'title': title,
+        }
+    return None
+
+
+def route_question(engine, table_name, question, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """Return the matched intent of a question (see `match_intent`), or None when the LLM has to answer it."""
+    return match_intent(question, table_name, load_slot_values(engine, table_name, refresh_interval))
+
+
+def format_answer(route, result_df):
+    """Render the result of a routed question without calling the LLM."""
+    if result_df.empty:
+        return f"{route['title']}: no rows returned."
+    return f"{route['title']}:\n\n{result_df.to_string(index=False)}"
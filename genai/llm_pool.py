@@ -0,0 +1,231 @@
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+try:
+    import httpx  # Transport of the llama-index Ollama client
+except ImportError:
+    httpx = None
+
+DEFAULT_BASE_URL = 'http://localhost:11434'
+DEFAULT_MODEL = 'llama3.1:latest'
+DEFAULT_REQUEST_TIMEOUT = 300.0
+DEFAULT_HEALTH_INTERVAL = 30
+DEFAULT_KEEP_WARM_INTERVAL = 240
+DEFAULT_KEEP_ALIVE = '30m'
+
+# Seconds a health check waits for an endpoint
+HEALTH_TIMEOUT = 5
+
+# Errors after which a request is retried on another endpoint
+CONNECTION_ERRORS = (ConnectionError, httpx.TransportError) if httpx is not None else (ConnectionError,)
+
+
+def _model_name(model):
+    # Ollama lists models with their tag
+    return model if ':' in model else f"{model}:latest"
+
+
+def _model_not_found(error):
+    # Ollama answers 404 for a model it does not have; the Ollama client raises it with a
+    # status_code, httpx as an HTTPStatusError with the response
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None and getattr(error, 'response', None) is not None:
+        status_code = getattr(error.response, 'status_code', None)
+    return status_code == 404
+
+
+def ollama_client(base_url, model, request_timeout, **kwargs):
+    from llama_index.llms.ollama import Ollama
+    return Ollama(model=model, base_url=base_url, request_timeout=request_timeout, **kwargs)
+
+
+class Endpoint:
+    """One Ollama instance of the pool and its routing state."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        # Installed models from the last health check; None until the first check
+        self.models = None
+        self.last_used = {}
+        self.clients = {}
+
+    def serves(self, model):
+        return self.models is None or _model_name(model) in self.models
+
+    def drop_model(self, model):
+        # Until the next health check lists it again
+        if self.models is not None:
+            self.models.discard(_model_name(model))
+
+
+class LLMPool:
+    """
+    Pool of Ollama endpoints shared by all chat sessions of the process.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests
+    that has the model installed. A monitor thread checks the endpoints' health and
+    pings models that have been idle for `keep_warm_interval` seconds, so the first
+    question after a quiet period does not wait for the model to reload.
+    Models are chosen per role, e.g. a small model for 'sql' and a larger one for 'answer'.
+    """
+
+    def __init__(self, endpoints, models, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                 health_interval=DEFAULT_HEALTH_INTERVAL, keep_warm_interval=DEFAULT_KEEP_WARM_INTERVAL,
+                 keep_alive=DEFAULT_KEEP_ALIVE, client_factory=ollama_client, client_kwargs=None):
+        self.endpoints = [Endpoint(base_url) for base_url in endpoints]
+        self.models = dict(models)
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.keep_warm_interval = keep_warm_interval
+        self.keep_alive = keep_alive
+        self.client_factory = client_factory
+        self.client_kwargs = client_kwargs or {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Build a pool from the "llm_pool" section of config.json.
+
+        Without the section, the pool is a single local Ollama serving llama3.1 for every role.
+
+        :param config: Loaded configuration dictionary.
+        :param kwargs: Extra LLMPool arguments, e.g. client_kwargs.
+        :return: LLMPool.
+        """
+        section = config.get('llm_pool', {})
+        model = section.get('model', DEFAULT_MODEL)
+        return cls(
+            section.get('endpoints', [DEFAULT_BASE_URL]),
+            {'sql': section.get('sql_model', model), 'answer': section.get('answer_model', model)},
+            request_timeout=section.get('request_timeout', DEFAULT_REQUEST_TIMEOUT),
+            health_interval=section.get('health_interval', DEFAULT_HEALTH_INTERVAL),
+            keep_warm_interval=section.get('keep_warm_interval', DEFAULT_KEEP_WARM_INTERVAL),
+            keep_alive=section.get('keep_alive', DEFAULT_KEEP_ALIVE),
+            **kwargs,
+        )
+
+    def start(self):
+        """Start the health-check and keep-warm thread."""
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name='llm-pool-monitor', daemon=True)
+            self._monitor.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _monitor_loop(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self.keep_warm()
+            self._stop.wait(self.health_interval)
+
+    def _candidates(self, model, exclude):
+        return [endpoint for endpoint in self.endpoints if endpoint not in exclude and endpoint.serves(model)]
+
+    def _acquire(self, model, exclude):
+        with self._lock:
+            candidates = self._candidates(model, exclude)
+            if not candidates:
+                raise RuntimeError(f"No LLM endpoint serves model {model}.")
+            # Fall back to unhealthy endpoints that have the model rather than failing outright
+            ready = [endpoint for endpoint in candidates if endpoint.healthy]
+            # Ties go to the endpoint that served the model least recently
+            endpoint = min(ready or candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.last_used.get(model, 0)))
+            endpoint.outstanding += 1
+            endpoint.last_used[model] = time.monotonic()
+            if model not in endpoint.clients:
+                endpoint.clients[model] = self.client_factory(endpoint.base_url, model, self.request_timeout, **self.client_kwargs)
+            return endpoint
+
+    def _release(self, endpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def run(self, role, fn):
+        """
+        Call `fn` with an LLM client for `role` on the least busy endpoint.
+
+        A request that cannot reach its endpoint marks it unhealthy, and a request
+        for a model the endpoint does not have drops the model from it; both are
+        retried on the next endpoint with the model.
+
+        :param role: 'sql' or 'answer'.
+        :param fn: Function taking the LLM client; streamed responses should be consumed inside it.
+        :return: The return value of `fn`.
+        """
+        model = self.models[role]
+        tried = []
+        while True:
+            endpoint = self._acquire(model, tried)
+            try:
+                return fn(endpoint.clients[model])
+            except Exception as error:
+                if _model_not_found(error):
+                    print(f"LLM endpoint {endpoint.base_url} does not have model {model}.")
+                    with self._lock:
+                        endpoint.drop_model(model)
+                elif isinstance(error, CONNECTION_ERRORS):
+                    print(f"LLM endpoint {endpoint.base_url} failed: {error}")
+                    endpoint.healthy = False
+                else:
+                    raise
+                tried.append(endpoint)
+                if not self._candidates(model, tried):
+                    raise
+            finally:
+                self._release(endpoint)
+
+    def check_health(self):
+        """Query every endpoint's installed models and update its health."""
+        for endpoint in self.endpoints:
+            try:
+                with urllib.request.urlopen(f"{endpoint.base_url}/api/tags", timeout=HEALTH_TIMEOUT) as response:
+                    models = {model['name'] for model in json.load(response).get('models', [])}
+                healthy = True
+            except (OSError, ValueError):
+                healthy, models = False, None
+            if healthy != endpoint.healthy:
+                print(f"LLM endpoint {endpoint.base_url} is {'healthy' if healthy else 'unreachable'}.")
+            endpoint.healthy, endpoint.models = healthy, models
+
+    def keep_warm(self):
+        """Load each role's model on every healthy endpoint where it has been idle for `keep_warm_interval` seconds."""
+        for endpoint in self.endpoints:
+            for model in set(self.models.values()):
+                idle = time.monotonic() - endpoint.last_used.get(model, float('-inf'))
+                if not endpoint.healthy or not endpoint.serves(model) or idle < self.keep_warm_interval:
+                    continue
+                # A generate request without a prompt only loads the model
+                body = json.dumps({'model': model, 'keep_alive': self.keep_alive}).encode()
+                request = urllib.request.Request(f"{endpoint.base_url}/api/generate", data=body,
+                                                 headers={'Content-Type': 'application/json'})
+                try:
+                    with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+                        response.read()
+                    # Counted as a use so the model is not pinged again before it can idle out
+                    endpoint.last_used[model] = time.monotonic()
+                except (OSError, ValueError) as error:
+                    print(f"Keep-warm of {model} on {endpoint.base_url} failed: {error}")
+
+    def status(self):
+        with self._lock:
+            return [{'base_url': endpoint.base_url, 'healthy': endpoint.healthy, 'outstanding': endpoint.outstanding,
+                     'models': sorted(endpoint.models) if endpoint.models is not None else None}
+                    for endpoint in self.endpoints]
+
+
+if __name__ == "__main__":
+    # Check the endpoints configured in config.json (or the given config file)
+    with open(sys.argv[1] if len(sys.argv) > 1 else 'config.json', 'r') as file:
+        pool = LLMPool.from_config(json.load(file))
+    pool.check_health()
+    print(json.dumps({'models': pool.models, 'endpoints': pool.status()}, indent=4))
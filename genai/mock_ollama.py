@@ -0,0 +1,186 @@
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_pool import LLMPool
+
+
+class ResponseError(Exception):
+    """Error response of an endpoint, raised with its status code like the Ollama client's."""
+
+    def __init__(self, error, status_code):
+        super().__init__(error)
+        self.status_code = status_code
+
+
+class MockOllama:
+    """
+    Local stand-in for an Ollama instance serving /api/tags, /api/generate and /api/chat.
+
+    Requests for a model that is not in `models` are answered with 404, as Ollama does.
+    Every generate or chat request is counted per model in `requests`.
+    """
+
+    def __init__(self, models, host='127.0.0.1', port=0):
+        self.models = {model if ':' in model else f"{model}:latest" for model in models}
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json(200, {'models': [{'name': model} for model in sorted(mock.models)]})
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                model = payload.get('model', '')
+                if self.path not in ('/api/generate', '/api/chat'):
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                if (model if ':' in model else f"{model}:latest") not in mock.models:
+                    self._send_json(404, {'error': f"model '{model}' not found"})
+                    return
+                with mock._lock:
+                    mock.requests[model] = mock.requests.get(model, 0) + 1
+                text = f"{model} at {mock.base_url}"
+                if self.path == '/api/chat':
+                    self._send_json(200, {'model': model, 'message': {'role': 'assistant', 'content': text}, 'done': True})
+                else:
+                    self._send_json(200, {'model': model, 'response': text if payload.get('prompt') else '', 'done': True})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class MockClient:
+    """Minimal completion client for an endpoint, in place of the llama-index Ollama client."""
+
+    def __init__(self, base_url, model, request_timeout):
+        self.base_url = base_url
+        self.model = model
+        self.request_timeout = request_timeout
+
+    def complete(self, prompt):
+        body = json.dumps({'model': self.model, 'prompt': prompt, 'stream': False}).encode()
+        request = urllib.request.Request(f"{self.base_url}/api/generate", data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+                return json.load(response)['response']
+        except urllib.error.HTTPError as error:
+            raise ResponseError(json.load(error).get('error', ''), error.code) from error
+        except urllib.error.URLError as error:
+            raise ConnectionError(error.reason) from error
+
+
+def mock_client(base_url, model, request_timeout, **kwargs):
+    return MockClient(base_url, model, request_timeout)
+
+
+def unused_url():
+    """URL of a local port nothing listens on, standing in for an instance that is down."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def check_pool():
+    """Check the routing, failover and keep-warm of LLMPool against mock endpoints."""
+    small, large = 'small:latest', 'large:latest'
+    both = MockOllama([small, large]).start()
+    only_large = MockOllama([large]).start()
+    down = unused_url()
+    try:
+        complete = lambda llm: llm.complete('question')
+
+        # Before the first health check, an endpoint that is down or lacks the model is
+        # skipped by retrying on the next one
+        pool = LLMPool([down, only_large.base_url, both.base_url], {'sql': small, 'answer': large},
+                       client_factory=mock_client, keep_warm_interval=0)
+        assert pool.run('sql', complete) == f"{small} at {both.base_url}"
+        status = {endpoint['base_url']: endpoint for endpoint in pool.status()}
+        assert not status[down]['healthy'] and status[only_large.base_url]['healthy']
+
+        # After it, requests only go to healthy endpoints with the model
+        pool.check_health()
+        for _ in range(4):
+            assert pool.run('sql', complete) == f"{small} at {both.base_url}"
+        assert only_large.requests.get(small, 0) == 0
+
+        # Concurrent requests are spread over the endpoints with the model
+        barrier = threading.Barrier(2)
+        answers = []
+
+        def ask(llm):
+            barrier.wait(timeout=5)
+            return llm.complete('question')
+
+        threads = [threading.Thread(target=lambda: answers.append(pool.run('answer', ask))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(answers) == sorted(f"{large} at {mock.base_url}" for mock in (both, only_large))
+
+        # Keep-warm loads the models on the healthy endpoints that have them
+        before = dict(only_large.requests)
+        pool.keep_warm()
+        assert only_large.requests[large] == before[large] + 1 and small not in only_large.requests
+
+        # A model no endpoint has fails without calling any endpoint
+        missing = LLMPool([only_large.base_url], {'sql': small}, client_factory=mock_client)
+        missing.check_health()
+        try:
+            missing.run('sql', complete)
+            raise AssertionError("Expected a missing model to fail.")
+        except RuntimeError:
+            pass
+
+        # When every endpoint is down, the last connection error is raised
+        unreachable = LLMPool([down, unused_url()], {'sql': small}, client_factory=mock_client, request_timeout=2)
+        try:
+            unreachable.run('sql', complete)
+            raise AssertionError("Expected unreachable endpoints to fail.")
+        except ConnectionError:
+            pass
+    finally:
+        both.stop()
+        only_large.stop()
+    print("LLM pool checks passed.")
+
+
+if __name__ == "__main__":
+    check_pool()
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from llama_index.core import SQLDatabase
+from sqlalchemy import text
+
+# Columns the chatbot is expected to query, in the order they are listed in the prompt
+CHAT_COLUMNS = [
+    'game_id', 'game_datetime', 'game_version', 'map_name', 'team', 'opponent_team', 'player',
+    'agent_name', 'role', 'side', 'round_num', 'event_num', 'seconds', 'won', 'kills', 'deaths',
+    'assists', 'kill_change', 'death_change', 'damage_dealt', 'damage_taken', 'is_alive', 'hp',
+    'our_team_alive', 'opponent_team_alive', 'our_team_health', 'opponent_team_health',
+    'inventory_value', 'team_inventory_value', 'opponent_team_inventory_value', 'spike_planted',
+    'combat_score_round', 'EGR',
+]
+
+# Columns whose distinct values are listed so the LLM can write exact, selective filters
+LOW_CARDINALITY_COLUMNS = ['game_version', 'map_name', 'team', 'opponent_team', 'agent_name', 'role', 'side']
+
+# Columns with more distinct values than this are summarized by count only
+MAX_LISTED_VALUES = 40
+
+# Seconds between checks of the table's modification counters
+DEFAULT_REFRESH_INTERVAL = 60
+
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _table_signature(connection, table_name):
+    # Cheap change detector: modification counters of the table and its partitions
+    query = text("""
+        SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)
+        FROM pg_stat_user_tables s
+        WHERE s.relid = CAST(:table_name AS regclass)
+           OR s.relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:table_name AS regclass))
+    """)
+    return connection.execute(query, {'table_name': table_name}).scalar()
+
+
+def build_schema_digest(connection, table_name, columns=CHAT_COLUMNS, low_cardinality_columns=LOW_CARDINALITY_COLUMNS):
+    """
+    Build a compact description of the results table for the text-to-SQL prompt.
+
+    :param connection: SQLAlchemy connection.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param columns: Columns to describe; other columns are left out of the prompt.
+    :param low_cardinality_columns: Columns whose distinct values are listed.
+    :return: Schema digest string.
+    """
+    schema_name, bare_table_name = table_name.split('.')
+
+    # Step 1: Column types
+    type_rows = connection.execute(text("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = :schema_name AND table_name = :table_name
+    """), {'schema_name': schema_name, 'table_name': bare_table_name}).fetchall()
+    column_types = dict(type_rows)
+
+    # Step 2: Indexed columns
+    indexed = {row[0] for row in connection.execute(text("""
+        SELECT DISTINCT a.attname FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = CAST(:table_name AS regclass)
+    """), {'table_name': table_name})}
+
+    # Step 3: One line per column, with values for low-cardinality columns
+    lines = [f"Table {table_name} (one row per player per snapshot event). Columns:"]
+    for column in columns:
+        if column not in column_types:
+            continue
+        details = [column_types[column]]
+        if column in indexed:
+            details.append('indexed')
+        line = f"- {column} ({', '.join(details)})"
+        if column in low_cardinality_columns:
+            values = connection.execute(text(
+                f"SELECT DISTINCT {_quote(column)} FROM {table_name} WHERE {_quote(column)} IS NOT NULL LIMIT {MAX_LISTED_VALUES + 1}"
+            )).scalars().all()
+            if len(values) > MAX_LISTED_VALUES:
+                line += f": more than {MAX_LISTED_VALUES} distinct values"
+            else:
+                line += ": " + ", ".join(f"'{value}'" for value in sorted(map(str, values)))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def get_schema_digest(engine, table_name, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    """
+    Return the cached schema digest, rebuilding it when the table has changed.
+
+    The modification counters are checked at most once per `refresh_interval` seconds,
+    so most prompts are built without touching the database.
+
+    :param engine: SQLAlchemy engine.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param refresh_interval: Seconds between change checks.
+    :return: Schema digest string.
+    """
+    with _digest_lock:
+        entry = _digest_cache.get(table_name)
+        now = time.monotonic()
+        if entry and now - entry['checked_at'] < refresh_interval:
+            return entry['digest']
+
+        with engine.connect() as connection:
+            signature = _table_signature(connection, table_name)
+            if entry is None or entry['signature'] != signature:
+                print(f"Building schema digest for {table_name}...")
+                entry = {'digest': build_schema_digest(connection, table_name), 'signature': signature}
+        entry['checked_at'] = now
+        _digest_cache[table_name] = entry
+        return entry['digest']
+
+
+class CachedSchemaSQLDatabase(SQLDatabase):
+    """SQLDatabase that fills the prompt's {schema} from the cached digest instead of introspecting."""
+
+    def __init__(self, engine, table_name, refresh_interval=DEFAULT_REFRESH_INTERVAL, **kwargs):
+        schema_name, bare_table_name = table_name.split('.')
+        super().__init__(engine, include_tables=[bare_table_name], schema=schema_name, **kwargs)
+        self._full_table_name = table_name
+        self._refresh_interval = refresh_interval
+
+    def get_single_table_info(self, table_name):
+        return get_schema_digest(self._engine, self._full_table_name, self._refresh_interval)
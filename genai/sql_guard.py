@@ -0,0 +1,189 @@
+import re
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+# Default limits, overridable through the "sql_guard" section of config.json
+DEFAULT_MAX_ROWS = 100
+DEFAULT_MAX_PLAN_COST = 1_000_000
+DEFAULT_STATEMENT_TIMEOUT_MS = 15000
+
+# Statements that still take effect inside the READ ONLY transaction the queries run in:
+# session settings, locks, notifications, prepared statements, COPY and library loads.
+# Writes are left to the transaction, so column names such as "comment" or "into" pass.
+FORBIDDEN_KEYWORDS = re.compile(
+    r"\b(set|reset|discard|lock|listen|unlisten|notify|prepare|execute|deallocate|copy|load)\b",
+    re.IGNORECASE,
+)
+# Server-side functions that can read files, sleep, change settings or reach other databases
+FORBIDDEN_FUNCTIONS = re.compile(r"\b(pg_\w+|dblink\w*|lo_\w+|set_config)\s*\(", re.IGNORECASE)
+
+QUOTED_IDENTIFIER = re.compile(r'"((?:[^"]|"")*)"')
+
+# Words that can follow a table reference without being an alias
+NON_ALIAS_KEYWORDS = (
+    "where", "group", "order", "limit", "having", "join", "inner", "left", "right", "full",
+    "cross", "on", "union", "except", "intersect", "window", "offset", "fetch", "natural",
+    "using", "lateral",
+)
+
+
+class SQLGuardError(Exception):
+    """Raised when a generated statement is rejected by the guard."""
+
+
+def _strip_literals_and_comments(sql):
+    # Blank out string literals and comments so keyword checks only see SQL tokens; matched
+    # left to right, so quotes inside a literal, identifier or comment are not taken as delimiters
+    def blank(match):
+        token = match.group(0)
+        return "''" if token.startswith("'") else token if token.startswith('"') else " "
+    return re.sub(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", blank, sql, flags=re.DOTALL)
+
+
+def validate_read_only(sql):
+    """
+    Check that the statement is a single read-only SELECT.
+
+    :param sql: SQL statement produced by the LLM.
+    :return: The statement without trailing semicolons.
+    """
+    if not sql or not sql.strip():
+        raise SQLGuardError("No SQL query was generated.")
+
+    statement = sql.strip().rstrip(';').strip()
+    tokens = _strip_literals_and_comments(statement)
+    # Quoted identifiers are names, not keywords or delimiters
+    names_blanked = QUOTED_IDENTIFIER.sub('""', tokens)
+
+    if ';' in names_blanked:
+        raise SQLGuardError("Only a single SQL statement is allowed.")
+    if not re.match(r"^\s*(select|with)\b", names_blanked, re.IGNORECASE):
+        raise SQLGuardError("Only SELECT queries are allowed.")
+
+    keyword = FORBIDDEN_KEYWORDS.search(names_blanked)
+    if keyword:
+        raise SQLGuardError(f"Keyword '{keyword.group(1).upper()}' is not allowed in generated queries.")
+    # A quoted function name still calls the function
+    function = FORBIDDEN_FUNCTIONS.search(QUOTED_IDENTIFIER.sub(r'\1', tokens))
+    if function:
+        raise SQLGuardError(f"Function '{function.group(1)}' is not allowed in generated queries.")
+
+    return statement
+
+
+def _normalize_date_range(date_range):
+    # st.date_input returns a single date, an empty tuple or a (start, end) tuple
+    if not date_range:
+        return None
+    if isinstance(date_range, (date, datetime)):
+        date_range = (date_range, date_range)
+    dates = list(date_range)
+    if len(dates) == 1:
+        dates = dates * 2
+    start, end = dates[0], dates[-1]
+    # The end date is inclusive in the sidebar, so filter up to the next midnight
+    return start, end + timedelta(days=1)
+
+
+def inject_filters(sql, table_name, game_ids=None, date_range=None):
+    """
+    Replace every reference to the results table with a filtered subquery.
+
+    The sidebar selections become real predicates that PostgreSQL pushes down
+    to the scan, instead of hints appended to the natural-language question.
+
+    :param sql: Validated SQL statement.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param game_ids: Game IDs selected in the sidebar (optional).
+    :param date_range: Date or (start, end) tuple selected in the sidebar (optional).
+    :return: Tuple of (SQL statement, bind parameters).
+    """
+    predicates = []
+    params = {}
+    if game_ids:
+        predicates.append("game_id IN :guard_game_ids")
+        params['guard_game_ids'] = list(game_ids)
+    dates = _normalize_date_range(date_range)
+    if dates:
+        predicates.append("CAST(game_datetime AS timestamp) >= :guard_start_date")
+        predicates.append("CAST(game_datetime AS timestamp) < :guard_end_date")
+        params['guard_start_date'], params['guard_end_date'] = dates
+
+    if not predicates:
+        return sql, params
+
+    schema_name, bare_table_name = table_name.split('.')
+    filtered_table = f"(SELECT * FROM {table_name} WHERE {' AND '.join(predicates)})"
+    table_ref = rf'(?:"?{re.escape(schema_name)}"?\.)?"?{re.escape(bare_table_name)}"?'
+    alias = rf"\s+(?:AS\s+)?(?!(?:{'|'.join(NON_ALIAS_KEYWORDS)})\b)[A-Za-z_]\w*"
+    pattern = re.compile(rf"\b(FROM|JOIN)\s+{table_ref}(?![\w.])({alias})?", re.IGNORECASE)
+
+    def replace(match):
+        # Keep the query's own alias, otherwise alias the subquery as the bare table name
+        return f"{match.group(1)} {filtered_table}{match.group(2) or ' AS ' + bare_table_name}"
+
+    guarded_sql, count = pattern.subn(replace, sql)
+    if count == 0:
+        raise SQLGuardError(f"The generated query does not read from {table_name}.")
+    return guarded_sql, params
+
+
+def apply_row_limit(sql, max_rows):
+    """Wrap the statement so that at most `max_rows` rows are returned."""
+    return f"SELECT * FROM (\n{sql}\n) AS guarded_result LIMIT {int(max_rows)}"
+
+
+def _build_statement(sql, params):
+    statement = text(sql)
+    if 'guard_game_ids' in params:
+        statement = statement.bindparams(bindparam('guard_game_ids', expanding=True))
+    return statement
+
+
+def run_guarded_query(engine, sql, table_name, game_ids=None, date_range=None,
+                      max_rows=DEFAULT_MAX_ROWS, max_plan_cost=DEFAULT_MAX_PLAN_COST,
+                      statement_timeout_ms=DEFAULT_STATEMENT_TIMEOUT_MS, params=None):
+    """
+    Validate, filter, cost-check and execute an LLM-generated or routed query.
+
+    The query runs in a read-only transaction with a statement timeout, and is
+    rejected before execution when the planner's estimated cost exceeds the budget.
+
+    :param engine: SQLAlchemy engine.
+    :param sql: SQL statement produced by the LLM.
+    :param table_name: Schema-qualified table name (e.g., 'schema.table').
+    :param game_ids: Game IDs selected in the sidebar (optional).
+    :param date_range: Date or (start, end) tuple selected in the sidebar (optional).
+    :param max_rows: Maximum number of rows returned.
+    :param max_plan_cost: Maximum estimated total cost from EXPLAIN.
+    :param statement_timeout_ms: Statement timeout in milliseconds.
+    :param params: Bind parameters of a parameterized query (optional).
+    :return: Tuple of (executed SQL, Pandas DataFrame with the results).
+    """
+    statement = validate_read_only(sql)
+    statement, filter_params = inject_filters(statement, table_name, game_ids, date_range)
+    params = {**(params or {}), **filter_params}
+    statement = apply_row_limit(statement, max_rows)
+
+    with engine.connect() as connection:
+        with connection.begin():
+            # Step 1: Make the transaction read-only and bound its run time
+            connection.execute(text("SET TRANSACTION READ ONLY"))
+            connection.execute(text(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}"))
+
+            # Step 2: Reject plans above the cost budget before running them
+            plan = connection.execute(_build_statement(f"EXPLAIN (FORMAT JSON) {statement}", params), params).scalar()
+            total_cost = plan[0]['Plan']['Total Cost']
+            if total_cost > max_plan_cost:
+                raise SQLGuardError(
+                    f"Estimated query cost {total_cost:.0f} exceeds the budget of {max_plan_cost:.0f}. "
+                    "Please narrow the question or select games in the sidebar."
+                )
+
+            # Step 3: Execute the query and fetch the data into a DataFrame
+            result = connection.execute(_build_statement(statement, params), params)
+            df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+    return statement, df